@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "orbitai.settings")
 
 application = get_asgi_application()
+
+if getattr(settings, "VECTORSEARCH_WARMUP_ON_BOOT", False):
+    from vectorsearch.services.providers import warmup
+
+    warmup()
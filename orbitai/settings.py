@@ -136,3 +136,146 @@ STORYBOOK_DEFAULTS = {
 
 PINECONE_API_KEY = "Enter Your Pinecone api key"
 PINECONE_ENV= "us-east-1"
+
+# Sentence encoder used for persona and query embeddings
+VECTORSEARCH_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Persona search backend: "local" (in-process NumPy over Persona.embedding), "ivf" or "pinecone"
+VECTORSEARCH_BACKEND = "local"
+PINECONE_INDEX_NAME = "index1"
+# The local/IVF backends and the BM25 index rebuild in a background thread when the index version moves on,
+# serving the previous one meanwhile. False rebuilds inside the request that notices the new version.
+VECTORSEARCH_BACKGROUND_RELOAD = True
+
+# Approximate index written by `manage.py build_vector_index` (used when VECTORSEARCH_BACKEND = "ivf")
+VECTORSEARCH_INDEX_PATH = BASE_DIR / "vector_index"
+VECTORSEARCH_IVF_NLIST = None   # None -> ~sqrt(number of personas)
+VECTORSEARCH_IVF_NPROBE = 8     # lists scanned per query: higher = better recall, slower
+
+# Hybrid search: BM25 over bio/job_role/hobbies/location fused with vector ranks (reciprocal rank fusion).
+# `manage.py lexical_report` measures BM25 latency against the sub-millisecond target.
+VECTORSEARCH_HYBRID = True
+VECTORSEARCH_RRF_K = 60
+VECTORSEARCH_LEXICAL_WEIGHT = 1.0
+
+# Query embedding cache. SHARED names a CACHES alias (e.g. file-based or Redis) shared by all workers.
+VECTORSEARCH_QUERY_CACHE = {
+    "MAX_ENTRIES": 2048,
+    "TTL": 3600,     # seconds
+    "SHARED": None,
+}
+
+# Final search results cached per (query, filters, index version); ALIAS should be shared across workers.
+# The index version itself is stored in the database; VERSION_TTL is how long a process trusts its last read.
+VECTORSEARCH_RESULT_CACHE = {
+    "ENABLED": True,
+    "ALIAS": "default",
+    "TTL": 300,      # seconds
+    "VERSION_TTL": 1.0,  # seconds
+}
+
+# The encoder and Pinecone client load on first use. Warm them up when the WSGI/ASGI app boots,
+# or replace them with deterministic stubs (also via ORBITAI_VECTORSEARCH_STUB=1) for tests/offline work.
+VECTORSEARCH_WARMUP_ON_BOOT = False
+VECTORSEARCH_STUB_MODELS = False
+
+# Shared embedding server (`manage.py run_embedding_server`). When set, workers send encode requests
+# to this Unix socket instead of each loading the model; they fall back to a local copy if it is down.
+VECTORSEARCH_EMBEDDING_SOCKET = None   # e.g. "/run/orbitai/embeddings.sock"
+VECTORSEARCH_EMBEDDING_FALLBACK_LOCAL = True
+
+# Local backend vector storage: None (float32) or "int8" (per-row scale, ~4x less memory).
+# With int8, the best VECTORSEARCH_RERANK candidates are re-scored exactly from Persona.embedding (0 disables).
+# `manage.py quantization_report` prints memory and recall@k for both modes.
+VECTORSEARCH_LOCAL_QUANTIZATION = None
+VECTORSEARCH_RERANK = 100
+
+# CPU inference of the in-process encoder (also used by run_embedding_server). QUANTIZE applies torch dynamic
+# int8 quantization to the Linear layers; THREADS pins torch intra-op threads per worker process (set it to
+# cores / workers); MAX_SEQ_LENGTH truncates inputs (persona bios fit well within 128 tokens).
+# QUANTIZE and MAX_SEQ_LENGTH change the vectors, so they are part of the encoder version: re-run
+# generate_embeddings after changing them. `manage.py compare_encoders` measures the trade-off.
+VECTORSEARCH_ENCODER = {
+    "QUANTIZE": False,
+    "THREADS": None,
+    "MAX_SEQ_LENGTH": None,
+}
+
+# Batch JSON search API (POST /vectorsearchapi/search/batch/; vectorsearch.urls is mounted without a trailing slash)
+VECTORSEARCH_BATCH_MAX_QUERIES = 500
+VECTORSEARCH_BATCH_MAX_K = 200
+
+# Paging: the ranked ids for a query are cached per index version, so "More results" and API cursors only
+# hydrate the next slice. The first page ranks 50 deep; cursors go deeper (x4 at a time) up to RANKING_DEPTH.
+# The NDJSON stream endpoint returns up to STREAM_MAX_RESULTS.
+VECTORSEARCH_PAGE_SIZE = 5
+VECTORSEARCH_RANKING_DEPTH = 1000
+VECTORSEARCH_STREAM_MAX_RESULTS = 5000
+
+# In-process cache of persona display fields used to hydrate search results (never loads embeddings)
+VECTORSEARCH_CARD_CACHE = {
+    "MAX_ENTRIES": 50000,
+}
+
+# Compatibility scoring of search results (services.scoring): SIMILARITY_WEIGHT x similarity plus
+# FIELD_WEIGHTS per matching requested smoker/gender/location, capped at MAX. RANK_BY_COMPATIBILITY
+# re-orders results by the final score instead of keeping the (hybrid) search order.
+VECTORSEARCH_SCORING = {
+    "SIMILARITY_WEIGHT": 100.0,
+    "FIELD_WEIGHTS": {"smoker": 5.0, "gender": 5.0, "location": 5.0},
+    "MAX": 100.0,
+    "RANK_BY_COMPATIBILITY": False,
+}
+
+# Persona saves/deletes (and load_personas) queue vector-store updates in the VectorOutbox table, applied by
+# `manage.py drain_vector_outbox --loop` in batches: one encode call, bulk upserts and deletes.
+# Only turn this on where that drainer runs: nothing else empties the table. Without it, run
+# generate_embeddings after changing personas.
+VECTORSEARCH_OUTBOX = False
+
+# Directory for a file-backed stand-in of the Pinecone index (offline development/tests); None uses Pinecone.
+PINECONE_LOCAL_PATH = None
+
+# Storybook images are generated by `manage.py run_image_workers`, which drains ImageJob rows. A worker's
+# claim on a job lasts IMAGE_JOB_LEASE seconds and is renewed while it generates; a job whose lease ran out
+# (dead worker) is claimed again, up to IMAGE_JOB_MAX_ATTEMPTS times.
+STORYBOOK_IMAGE_JOB_LEASE = 300
+STORYBOOK_IMAGE_JOB_MAX_ATTEMPTS = 3
+
+# Generated storybook images are cached by (provider, model, prompt, negative prompt, seed, size): a page
+# asking for an image rendered before reuses the stored file instead of calling the provider. Least recently
+# used entries are evicted beyond MAX_BYTES; a file is only deleted once no page points at it, and entries
+# used within the last GRACE seconds are kept.
+STORYBOOK_IMAGE_CACHE = {
+    "ENABLED": True,
+    "MAX_BYTES": 2 * 1024 ** 3,
+    "GRACE": 300,    # seconds
+}
+
+# Image requests to the inference API go through one keep-alive session per process with at most
+# POOL_MAXSIZE connections per host. AIImageService.generate_for_storybook and generate_images_batch render
+# up to STORYBOOK_IMAGE_CONCURRENCY images at once.
+STORYBOOK_IMAGE_CONCURRENCY = 4
+STORYBOOK_IMAGE_HTTP = {
+    "POOL_CONNECTIONS": 4,
+    "POOL_MAXSIZE": 8,
+}
+
+# Flow control for the image provider, shared by every worker thread and process (state kept in the database).
+# RATE_LIMIT: token bucket, RATE requests/second with bursts of BURST. RETRY: retryable errors (model loading,
+# 429, 5xx, timeouts) back off exponentially with jitter from BASE_DELAY up to MAX_DELAY seconds, never less
+# than the provider's estimated_time / Retry-After. CIRCUIT_BREAKER: FAILURE_THRESHOLD failures in a row (or a
+# provider-given wait) pause all requests, and run_image_workers stops claiming jobs, for COOLDOWN seconds.
+STORYBOOK_IMAGE_RATE_LIMIT = {
+    "RATE": 1.0,
+    "BURST": 4,
+}
+STORYBOOK_IMAGE_RETRY = {
+    "MAX_RETRIES": 4,
+    "BASE_DELAY": 2.0,
+    "MAX_DELAY": 60.0,
+}
+STORYBOOK_IMAGE_CIRCUIT_BREAKER = {
+    "FAILURE_THRESHOLD": 5,
+    "COOLDOWN": 30.0,
+}
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "orbitai.settings")
 
 application = get_wsgi_application()
+
+if getattr(settings, "VECTORSEARCH_WARMUP_ON_BOOT", False):
+    from vectorsearch.services.providers import warmup
+
+    warmup()
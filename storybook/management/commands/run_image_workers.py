@@ -0,0 +1,93 @@
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from storybook.models import ImageJob
+from storybook.services.ai_image_service import AIImageService
+from storybook.services.image_generator import image_concurrency
+from storybook.services.image_jobs import claim_next, lease_seconds, pending_jobs, run_job
+from storybook.services.throttling import get_circuit_breaker
+
+
+OUTCOMES = {
+    ImageJob.Status.SUCCESS: "ready",
+    ImageJob.Status.FAILED: "failed",
+    ImageJob.Status.QUEUED: "requeued (page held by another claim)",
+}
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+class Command(BaseCommand):
+    help = "Generate storybook images by draining queued ImageJobs with a pool of worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Worker threads, i.e. image generations in flight at once "
+                                 "(default: settings.STORYBOOK_IMAGE_CONCURRENCY)")
+        parser.add_argument("--poll-interval", type=float, default=2.0,
+                            help="Seconds an idle worker sleeps before looking for new jobs")
+        parser.add_argument("--lease-seconds", type=int, default=None,
+                            help="How long a claim lasts without renewal before another worker may take "
+                                 "the job (default: settings.STORYBOOK_IMAGE_JOB_LEASE)")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit once no claimable job is left instead of polling forever")
+
+    def handle(self, *args, **opts):
+        lease = opts["lease_seconds"] or lease_seconds()
+        workers = max(1, opts["workers"] or image_concurrency())
+        stop = threading.Event()
+        done = {ImageJob.Status.SUCCESS: 0, ImageJob.Status.FAILED: 0, ImageJob.Status.QUEUED: 0}
+        done_lock = threading.Lock()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        breaker = get_circuit_breaker()
+
+        def work(n):
+            worker_id = f"{prefix}:{n}"
+            service = AIImageService()
+            try:
+                while not stop.is_set():
+                    paused = breaker.remaining()
+                    if paused:
+                        # Provider unhealthy: leave the jobs queued instead of spending attempts on them.
+                        stop.wait(paused)
+                        continue
+                    job = claim_next(worker_id, lease)
+                    if job is None:
+                        if opts["once"]:
+                            return
+                        stop.wait(opts["poll_interval"])
+                        continue
+                    status = run_job(job, worker_id, service, lease)
+                    with done_lock:
+                        done[status] += 1
+                    self.stdout.write(f"[{worker_id}] page {job.page_id}: {OUTCOMES[status]}")
+            finally:
+                connection.close()
+
+        signal.signal(signal.SIGTERM, _interrupt)
+        self.stdout.write(f"Starting {workers} image workers ({pending_jobs()} jobs pending, lease {lease}s)")
+        threads = [threading.Thread(target=work, args=(n,), name=f"image-worker-{n}", daemon=True)
+                   for n in range(workers)]
+        for t in threads:
+            t.start()
+        try:
+            for t in threads:
+                while t.is_alive():
+                    t.join(timeout=1.0)
+        except KeyboardInterrupt:
+            # Let in-flight generations finish; unfinished claims expire and are picked up again.
+            self.stdout.write("Stopping after the jobs in flight...")
+            stop.set()
+            for t in threads:
+                t.join()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Image workers stopped: {done[ImageJob.Status.SUCCESS]} ready, {done[ImageJob.Status.FAILED]} failed, "
+            f"{done[ImageJob.Status.QUEUED]} requeued, {pending_jobs()} pending."
+        ))
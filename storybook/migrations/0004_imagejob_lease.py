@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storybook", "0003_story_description"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imagejob",
+            name="attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="imagejob",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="imagejob",
+            name="worker_id",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name="imagejob",
+            index=models.Index(fields=["status", "lease_expires_at"], name="storybook_i_status_9dd217_idx"),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storybook", "0004_imagejob_lease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="claimed_by",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddField(
+            model_name="page",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:46
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storybook", "0005_page_lease"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CachedImage",
+            fields=[
+                ("key", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("file", models.ImageField(upload_to="storybook/cache/")),
+                ("size_bytes", models.PositiveBigIntegerField(default=0)),
+                ("provider", models.CharField(max_length=50)),
+                ("model", models.CharField(max_length=200)),
+                ("params", models.JSONField(blank=True, default=dict)),
+                ("hits", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("last_used_at", models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
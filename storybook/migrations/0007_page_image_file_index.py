@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storybook", "0006_cachedimage"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="page",
+            index=models.Index(fields=["image_file"], name="storybook_p_image_f_fb9063_idx"),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.23 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storybook", "0007_page_image_file_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProviderThrottle",
+            fields=[
+                ("provider", models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ("tokens", models.FloatField(default=0.0)),
+                ("refilled_at", models.FloatField(default=0.0)),
+                ("held_until", models.FloatField(default=0.0)),
+                ("failures", models.PositiveIntegerField(default=0)),
+                ("open_until", models.FloatField(default=0.0)),
+                ("probe_until", models.FloatField(default=0.0)),
+                ("revision", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -72,6 +72,10 @@ class Page(models.Model):
     gen_status = models.CharField(max_length=8, choices=GenStatus.choices, default=GenStatus.PENDING)
     gen_error = models.TextField(blank=True, null = True)
 
+    # Claim on generating this image: only the holder of an unexpired lease calls the provider.
+    claimed_by = models.CharField(max_length=100, blank=True, default="")
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
     image_meta = models.JSONField(default=dict, blank=True)
 
     created_at = models.DateTimeField(default=timezone.now)
@@ -83,6 +87,7 @@ class Page(models.Model):
             models.Index(fields=["storybook", "index"]),
             models.Index(fields=["storybook", "gen_status"]),
             models.Index(fields=["kind"]),
+            models.Index(fields=["image_file"]),
         ]
 
     def __str__(self):
@@ -135,6 +140,11 @@ class ImageJob(models.Model):
     latency_ms = models.PositiveIntegerField(null=True, blank=True)
     cost_cents = models.PositiveIntegerField(null=True, blank=True)
 
+    # Claim held by a `run_image_workers` thread; a RUNNING job whose lease expired is reclaimed.
+    worker_id = models.CharField(max_length=100, blank=True, default="")
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
     created_at = models.DateTimeField(default=timezone.now)
     finished_at = models.DateTimeField(null=True, blank=True)
 
@@ -142,7 +152,53 @@ class ImageJob(models.Model):
         indexes = [
             models.Index(fields=["page"]),
             models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["status", "lease_expires_at"]),
         ]
 
     def __str__(self):
         return f"ImageJob {self.id} [{self.status}]"
+
+
+class CachedImage(models.Model):
+    """
+    A generated image stored once under its request key (see services.image_cache).
+    Pages that used the same request point their image_file at ``file``.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    file = models.ImageField(upload_to="storybook/cache/")
+    size_bytes = models.PositiveBigIntegerField(default=0)
+
+    provider = models.CharField(max_length=50)
+    model = models.CharField(max_length=200)
+    params = models.JSONField(default=dict, blank=True)
+
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"CachedImage {self.key[:12]} ({self.size_bytes} bytes)"
+
+
+class ProviderThrottle(models.Model):
+    """
+    Rate limit and circuit breaker state of one image provider, shared by every worker
+    process (see services.throttling). Times are Unix timestamps; every write is a
+    conditional UPDATE on ``revision``.
+    """
+    provider = models.CharField(max_length=50, primary_key=True)
+
+    # Token bucket: ``tokens`` as of ``refilled_at`` (0 = a full bucket); nothing is sent before ``held_until``.
+    tokens = models.FloatField(default=0.0)
+    refilled_at = models.FloatField(default=0.0)
+    held_until = models.FloatField(default=0.0)
+
+    # Circuit breaker: consecutive failures, open until ``open_until``; ``probe_until`` is the half-open probe's claim.
+    failures = models.PositiveIntegerField(default=0)
+    open_until = models.FloatField(default=0.0)
+    probe_until = models.FloatField(default=0.0)
+
+    revision = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"ProviderThrottle {self.provider}"
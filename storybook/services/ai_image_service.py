@@ -2,12 +2,20 @@
 import os
 import uuid
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 from django.conf import settings
 from django.core.files import File
-
-from .image_generator import generate_images
+from django.core.files.storage import default_storage
+from django.db import connection
+
+from . import image_cache
+from .image_generator import MODEL, PROVIDER, generate_images, image_concurrency
+from .image_jobs import (
+    LeaseKeeper, claim_page, complete_page, new_worker_id, refresh_story_status, renew_page_lease,
+)
+from .throttling import call_with_retries
 from ..models import Page
 
 logger = logging.getLogger(__name__)
@@ -18,13 +26,18 @@ class AIImageService:
         self,
         output_dir: str = "storybook/generated_images",
         timeout: int = 120,
-        max_retries: int = 1,
+        max_retries: Optional[int] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
     ):
         
         self.output_dir = output_dir.strip("/")
         self.media_root = getattr(settings, "MEDIA_ROOT", os.path.join(os.getcwd(), "media"))
         self.timeout = timeout
+        # Retries back off exponentially (see throttling); None uses STORYBOOK_IMAGE_RETRY["MAX_RETRIES"].
         self.max_retries = max_retries
+        self.width = width
+        self.height = height
 
     def _build_output_path(self) -> str:
         
@@ -33,76 +46,115 @@ class AIImageService:
         os.makedirs(dir_path, exist_ok=True)
         return os.path.join(dir_path, fname)
 
-    def generate_for_page(self, page: Page) -> Optional[str]:
-        
+    def generate_for_page(self, page: Page, worker_id: Optional[str] = None,
+                          lease: Optional[int] = None, retry_errors: bool = False) -> Optional[str]:
+        """
+        Generate the page's image, if this call wins the claim on the page (see image_jobs).
+        A page that is READY, or being generated under someone else's live claim, is left
+        alone without calling the provider.
+        :returns: the stored filename, or None if the page was not generated here.
+        """
         if page.kind != "IMAGE":
             raise ValueError("AIImageService.generate_for_page: page.kind must be 'IMAGE'.")
 
         if not page.image_prompt:
             raise ValueError("AIImageService.generate_for_page: page.image_prompt is empty.")
 
-        page.gen_status = "RUNNING"
-        page.gen_error = ""
-        page.save(update_fields=["gen_status", "gen_error"])
-
-        last_error = None
-
-        for attempt in range(self.max_retries + 1):
-            try:
-                tmp_path = self._build_output_path()
-
-                
-                final_path = generate_images(
-                    prompt=page.image_prompt,
-                    output_path=tmp_path,
-                    timeout=self.timeout,
-                )
-
-                
-                filename = os.path.basename(final_path)
+        worker_id = worker_id or new_worker_id()
+        if not claim_page(page, worker_id, lease, retry_errors=retry_errors):
+            logger.info("Page %s is ready or claimed by another worker; skipping", page.id)
+            return None
+
+        with LeaseKeeper(lambda: renew_page_lease(page, worker_id, lease), lease, name=f"page-{page.id}"):
+            return self._generate(page, worker_id)
+
+    def _generate(self, page: Page, worker_id: str) -> Optional[str]:
+        params = image_cache.request_params(
+            page.image_prompt, page.image_prompt_negative, page.seed, self.width, self.height,
+        )
+        key = image_cache.cache_key(PROVIDER, MODEL, params) if image_cache.cache_enabled() else None
+        if key:
+            cached = image_cache.lookup(key)
+            if cached is not None:
+                return self._complete(page, worker_id, cached.file.name, {"cache_key": key, "cache_hit": True})
+
+        try:
+            tmp_path = self._build_output_path()
+
+            
+            final_path = call_with_retries(
+                generate_images,
+                prompt=page.image_prompt,
+                output_path=tmp_path,
+                timeout=self.timeout,
+                negative_prompt=page.image_prompt_negative,
+                seed=page.seed,
+                width=self.width,
+                height=self.height,
+                max_retries=self.max_retries,
+                before_retry=lambda: renew_page_lease(page, worker_id),  # give up once the claim is gone
+            )
+
+            
+            if key:
+                name = image_cache.store(key, final_path, PROVIDER, MODEL, params).file.name
+            else:
                 with open(final_path, "rb") as fp:
-                    page.image_file.save(filename, File(fp), save=False)
-
-                page.gen_status = "READY"
-                page.save(update_fields=["image_file", "gen_status"])
+                    page.image_file.save(os.path.basename(final_path), File(fp), save=False)
+                name = page.image_file.name
 
-                
-                try:
-                    os.remove(final_path)
-                except Exception:
-                    logger.debug("Could not remove temp file: %s", final_path)
-
-                return filename
-
-            except Exception as e:
-                last_error = str(e)
-                logger.exception(
-                    "Image generation failed (attempt %s/%s): %s",
-                    attempt + 1, self.max_retries + 1, last_error
-                )
-
-                if attempt < self.max_retries:
-                    continue  # retry
-
-               
-                page.gen_status = "ERROR"
-                page.gen_error = (last_error or "Unknown error")[:500]
-                page.save(update_fields=["gen_status", "gen_error"])
-                return None
-
-    def generate_for_storybook(self, storybook_id) -> int:
+            
+            try:
+                os.remove(final_path)
+            except Exception:
+                logger.debug("Could not remove temp file: %s", final_path)
+
+        except Exception as e:
+            logger.exception("Image generation failed for page %s: %s", page.id, e)
+            page.gen_status = "ERROR"
+            page.gen_error = (str(e) or "Unknown error")[:500]
+            complete_page(page, worker_id, Page.GenStatus.ERROR, gen_error=page.gen_error)
+            return None
+
+        return self._complete(page, worker_id, name, {"cache_key": key, "cache_hit": False}, owned=not key)
+
+    def _complete(self, page: Page, worker_id: str, name: str, meta: dict, owned: bool = False) -> Optional[str]:
+        """Point the page at the stored file ``name``; ``owned`` files (not in the cache) go if the claim was lost."""
+        if not complete_page(page, worker_id, Page.GenStatus.READY, image_file=name, image_meta=meta):
+            # The claim was cancelled or expired and taken over: discard this result (a cached file stays cached).
+            logger.warning("Lost the claim on page %s; discarding %s", page.id, name)
+            if owned:
+                default_storage.delete(name)
+            return None
+
+        page.image_file.name = name
+        page.image_meta = meta
+        page.gen_status = "READY"
+        return os.path.basename(name)
+
+    def generate_for_storybook(self, storybook_id, concurrency: Optional[int] = None) -> int:
         """
-        Generate images for all IMAGE pages in a storybook that are still pending.
+        Generate images for all IMAGE pages in a storybook that are not ready yet
+        (errored ones are retried), up to ``concurrency`` pages at once
+        (default STORYBOOK_IMAGE_CONCURRENCY). Pages claimed by a live worker are skipped.
         :returns: Count of pages successfully generated.
         """
-        qs = Page.objects.filter(
+        pages = list(Page.objects.filter(
             storybook_id=storybook_id,
             kind="IMAGE",
-            gen_status__in=["PENDING", "ERROR"],  # retry errored ones if desired
-        ).order_by("index")
+        ).exclude(gen_status="READY").order_by("index"))
+        if not pages:
+            return 0
+
+        worker_id = new_worker_id()
+
+        def run(page):
+            try:
+                return self.generate_for_page(page, worker_id=worker_id, retry_errors=True)
+            finally:
+                connection.close()
 
-        success = 0
-        for page in qs:
-            if self.generate_for_page(page):
-                success += 1
+        with ThreadPoolExecutor(max_workers=min(concurrency or image_concurrency(), len(pages))) as pool:
+            success = sum(1 for filename in pool.map(run, pages) if filename)
+        refresh_story_status(storybook_id)
         return success
@@ -0,0 +1,143 @@
+"""
+Content-addressed cache of generated images, configured by settings.STORYBOOK_IMAGE_CACHE.
+
+An image request is keyed by the SHA-256 of (provider, model, prompt,
+negative prompt, seed, width, height). The first render is stored once as
+``storybook/cache/<key[:2]>/<key>.<ext>`` with a CachedImage row; every page
+asking for the same image points its ``image_file`` at that file instead of
+calling the provider again. Once the cache holds more than MAX_BYTES, the
+least recently used entries that no page references are evicted (row and
+file); a file some page still shows is never deleted, and neither is an entry
+used in the last GRACE seconds (a page that just got it may not point at it yet).
+"""
+import hashlib
+import json
+import os
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from ..models import CachedImage, Page
+
+DEFAULT_IMAGE_CACHE = {
+    "ENABLED": True,
+    "MAX_BYTES": 2 * 1024 ** 3,
+    "GRACE": 300,  # seconds
+}
+
+
+def cache_settings() -> dict:
+    return {**DEFAULT_IMAGE_CACHE, **getattr(settings, "STORYBOOK_IMAGE_CACHE", {})}
+
+
+def cache_enabled() -> bool:
+    return bool(cache_settings()["ENABLED"])
+
+
+def request_params(prompt: str, negative_prompt: Optional[str] = None, seed: Optional[int] = None,
+                   width: Optional[int] = None, height: Optional[int] = None) -> dict:
+    return {
+        "prompt": (prompt or "").strip(),
+        "negative_prompt": (negative_prompt or "").strip(),
+        "seed": int(seed or 0),
+        "width": width,
+        "height": height,
+    }
+
+
+def cache_key(provider: str, model: str, params: dict) -> str:
+    raw = json.dumps({"provider": provider, "model": model, **params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def lookup(key: str) -> Optional[CachedImage]:
+    """The cached image for ``key`` (its use is recorded), or None if absent or its file is gone."""
+    # Record the use first: from then on ``evict`` leaves the entry alone for GRACE seconds.
+    if not CachedImage.objects.filter(key=key).update(hits=F("hits") + 1, last_used_at=timezone.now()):
+        return None
+    entry = CachedImage.objects.filter(key=key).first()
+    if entry is None:
+        return None
+    if not default_storage.exists(entry.file.name):
+        entry.delete()
+        return None
+    return entry
+
+
+def store(key: str, path: str, provider: str, model: str, params: dict) -> CachedImage:
+    """Move the freshly generated file at ``path`` into the cache (or reuse a concurrent copy)."""
+    existing = lookup(key)
+    if existing is not None:
+        return existing
+
+    ext = os.path.splitext(path)[1].lower() or ".png"
+    name = f"storybook/cache/{key[:2]}/{key}{ext}"
+    if not default_storage.exists(name):
+        with open(path, "rb") as fp:
+            name = default_storage.save(name, File(fp))
+    # A single INSERT (no read-then-write transaction), so concurrent renders of the same key don't conflict.
+    CachedImage.objects.bulk_create([CachedImage(
+        key=key,
+        file=name,
+        size_bytes=default_storage.size(name),
+        provider=provider,
+        model=model,
+        params=params,
+    )], ignore_conflicts=True)
+    entry = CachedImage.objects.get(key=key)
+    evict(keep=key)
+    return entry
+
+
+def total_bytes() -> int:
+    return CachedImage.objects.aggregate(total=Sum("size_bytes"))["total"] or 0
+
+
+def evict(max_bytes: Optional[int] = None, keep: Optional[str] = None, batch_size: int = 200) -> int:
+    """
+    Drop least recently used, unreferenced entries until the cache fits in ``max_bytes``
+    (default MAX_BYTES) or only entries some page uses, or used within GRACE seconds, are left.
+    :returns: number of entries evicted
+    """
+    conf = cache_settings()
+    max_bytes = conf["MAX_BYTES"] if max_bytes is None else max_bytes
+    excess = total_bytes() - max_bytes
+    evicted = 0
+    if excess <= 0:
+        return 0
+    cutoff = timezone.now() - timedelta(seconds=conf["GRACE"])
+    candidates = CachedImage.objects.filter(last_used_at__lt=cutoff).exclude(key=keep).order_by("last_used_at")
+    kept = 0  # candidates some page uses; the only rows that stay in ``candidates``
+    while excess > 0:
+        batch = list(candidates.values_list("key", "file", "size_bytes")[kept:kept + batch_size])
+        if not batch:
+            break
+        in_use = set(Page.objects.filter(image_file__in=[name for _, name, _ in batch])
+                     .values_list("image_file", flat=True))
+        for key, name, size in batch:
+            if name in in_use:
+                kept += 1
+                continue
+            # Conditional on the entry still being idle, so a lookup that hit it meanwhile wins.
+            if not CachedImage.objects.filter(key=key, last_used_at__lt=cutoff).delete()[0]:
+                continue
+            default_storage.delete(name)
+            evicted += 1
+            excess -= size
+            if excess <= 0:
+                break
+    return evicted
+
+
+def stats() -> dict:
+    return {
+        "entries": CachedImage.objects.count(),
+        "bytes": total_bytes(),
+        "max_bytes": cache_settings()["MAX_BYTES"],
+        "hits": CachedImage.objects.aggregate(total=Sum("hits"))["total"] or 0,
+    }
@@ -2,10 +2,21 @@
 
 
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from typing import List, Optional, Union
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
 
-API_URL = "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0"
+from .throttling import call_with_retries
+
+PROVIDER = "hf_inference"
+MODEL = "stabilityai/stable-diffusion-xl-base-1.0"
+API_URL = f"https://api-inference.huggingface.co/models/{MODEL}"
 ''' <-- IMPORTANT --> '''
 HF_TOKEN = "set your hugging face token"                           
 ''' <-- IMPORTANT --> '''
@@ -13,18 +24,131 @@ HF_TOKEN = "set your hugging face token"
 HEADERS = {"Authorization": f"Bearer {HF_TOKEN}"} if HF_TOKEN else {}
 
 class ImageGenError(Exception):
-    pass
+    """
+    ``retryable``: the same request may succeed later. ``unhealthy``: the failure says the
+    provider is down, loading or throttling (see throttling.CircuitBreaker).
+    ``retry_after``: seconds the provider asked us to wait, if it said.
+    """
+    retryable = False
+    unhealthy = False
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class ModelLoadingError(ImageGenError):
+    """503 while the model is loaded onto the inference servers (``estimated_time`` in the body)."""
+    retryable = True
+    unhealthy = True
+
+
+class RateLimitedError(ImageGenError):
+    """429: too many requests."""
+    retryable = True
+    unhealthy = True
+
+
+class ProviderUnavailableError(ImageGenError):
+    """Other 5xx responses, timeouts and connection failures."""
+    retryable = True
+    unhealthy = True
+
+
+class RequestRejectedError(ImageGenError):
+    """Other 4xx responses: bad token, invalid parameters... Retrying cannot help."""
 
-def generate_images(prompt: str, output_path: str, timeout: int = 120) -> str:
+
+def _retry_after(resp) -> Optional[float]:
+    value = resp.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(resp) -> ImageGenError:
+    """The ImageGenError subclass describing a failed inference API response."""
+    try:
+        detail = resp.json()
+    except Exception:
+        detail = resp.text[:500]
+    message = f"HF API error [{resp.status_code}]: {detail}"
+    retry_after = _retry_after(resp)
+
+    if resp.status_code == 503 and isinstance(detail, dict) and "estimated_time" in detail:
+        estimated = float(detail.get("estimated_time") or 0) or None
+        return ModelLoadingError(message, resp.status_code, retry_after or estimated)
+    if resp.status_code == 429:
+        return RateLimitedError(message, resp.status_code, retry_after)
+    if resp.status_code >= 500:
+        return ProviderUnavailableError(message, resp.status_code, retry_after)
+    if resp.status_code >= 400:
+        return RequestRejectedError(message, resp.status_code)
+    # 2xx without an image (e.g. a JSON error body): treat as a transient provider fault.
+    return ProviderUnavailableError(message, resp.status_code)
+
+
+def image_concurrency() -> int:
+    """Image requests a single process keeps in flight at once."""
+    return max(1, getattr(settings, "STORYBOOK_IMAGE_CONCURRENCY", 4))
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Process-wide keep-alive session for the inference API, shared by all threads.
+    At most POOL_MAXSIZE connections per host are open; extra requests wait for a free one.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                conf = getattr(settings, "STORYBOOK_IMAGE_HTTP", {})
+                adapter = HTTPAdapter(
+                    pool_connections=conf.get("POOL_CONNECTIONS", 4),
+                    pool_maxsize=max(conf.get("POOL_MAXSIZE", 8), image_concurrency()),
+                    pool_block=True,
+                )
+                session = requests.Session()
+                session.headers.update(HEADERS)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def build_payload(prompt: str, negative_prompt: Optional[str] = None, seed: Optional[int] = None,
+                  width: Optional[int] = None, height: Optional[int] = None) -> dict:
+    """Inference API body; parameters left as None are not sent (the model defaults apply)."""
+    parameters = {"negative_prompt": negative_prompt or None, "seed": seed or None, "width": width, "height": height}
+    parameters = {k: v for k, v in parameters.items() if v is not None}
+    return {"inputs": prompt, "parameters": parameters} if parameters else {"inputs": prompt}
+
+
+def generate_images(prompt: str, output_path: str, timeout: int = 120, negative_prompt: Optional[str] = None,
+                    seed: Optional[int] = None, width: Optional[int] = None, height: Optional[int] = None) -> str:
     if not HF_TOKEN:
         raise ImageGenError("HF_TOKEN not set in environment variables.")
 
-    resp = requests.post(
-        API_URL,
-        headers=HEADERS,
-        json={"inputs": prompt},
-        timeout=timeout,
-    )
+    try:
+        resp = get_session().post(
+            API_URL,
+            json=build_payload(prompt, negative_prompt, seed, width, height),
+            timeout=timeout,
+        )
+    except requests.RequestException as e:
+        raise ProviderUnavailableError(f"HF API request failed: {e}") from e
 
     
     ctype = resp.headers.get("content-type", "")
@@ -38,9 +162,23 @@ def generate_images(prompt: str, output_path: str, timeout: int = 120) -> str:
         return str(out_path)
 
     
-    try:
-        detail = resp.json()
-    except Exception:
-        detail = resp.text[:500]
+    raise classify_error(resp)
+
+
+def generate_images_batch(requests_kwargs: List[dict], concurrency: Optional[int] = None) -> List[Union[str, Exception]]:
+    """
+    Run ``generate_images(**kwargs)`` for every item, at most ``concurrency`` at a time
+    (default STORYBOOK_IMAGE_CONCURRENCY) over the pooled session, within the shared
+    rate limit and circuit breaker and with backoff on retryable errors.
+    :returns: output path or the raised exception, in input order
+    """
+    def run(kwargs):
+        try:
+            return call_with_retries(generate_images, **kwargs)
+        except Exception as e:
+            return e
 
-    raise ImageGenError(f"HF API error [{resp.status_code}]: {detail}")
+    if not requests_kwargs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(concurrency or image_concurrency(), len(requests_kwargs))) as pool:
+        return list(pool.map(run, requests_kwargs))
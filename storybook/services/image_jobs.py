@@ -0,0 +1,268 @@
+"""
+Queue of image generation work, one ImageJob per IMAGE page, and the claims
+that make each image generated (and paid for) once.
+
+Web requests only create pages and QUEUED jobs; ``manage.py run_image_workers``
+drains them. Both ImageJob and Page are claimed with a conditional UPDATE (the
+row must still be claimable when the update runs), so of any number of
+concurrent workers, ``generate_for_storybook`` or ``Page.generate_ai_image``
+calls, only one generates a given page. A claim is a lease held by a worker
+id: the holder renews it while it generates, a claim whose lease expired (its
+worker died) can be taken again, and results are only written while the claim
+is still held. A job whose page is held by someone else's live claim (e.g.
+the page lease of a dead worker outliving its job lease) goes back to the
+queue until that lease runs out. Cancelling a job (ImageJob.Status.CANCELLED)
+releases the page claim, so a generation still in flight is discarded.
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import ImageJob, Page, Story
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_JOB_STATUSES = (ImageJob.Status.QUEUED, ImageJob.Status.RUNNING)
+
+
+def lease_seconds() -> int:
+    return getattr(settings, "STORYBOOK_IMAGE_JOB_LEASE", 300)
+
+
+def max_attempts() -> int:
+    return getattr(settings, "STORYBOOK_IMAGE_JOB_MAX_ATTEMPTS", 3)
+
+
+def new_worker_id(prefix: str = "inline") -> str:
+    return f"{prefix}:{uuid.uuid4().hex[:12]}"
+
+
+# ---------------------------------------------------------------------------
+# Page claims
+# ---------------------------------------------------------------------------
+
+def _page_claimable(now, retry_errors: bool) -> Q:
+    statuses = [Page.GenStatus.PENDING] + ([Page.GenStatus.ERROR] if retry_errors else [])
+    return Q(gen_status__in=statuses) | Q(gen_status=Page.GenStatus.RUNNING, lease_expires_at__lt=now)
+
+
+def claim_page(page: Page, worker_id: str, lease: Optional[int] = None, retry_errors: bool = False) -> bool:
+    """
+    Move ``page`` to RUNNING for ``worker_id`` unless someone holds a live claim on it.
+    READY pages are never claimed; ERROR pages only with ``retry_errors``.
+    :returns: True if the caller now owns the page and may call the provider.
+    """
+    lease = lease or lease_seconds()
+    now = timezone.now()
+    return bool(Page.objects.filter(_page_claimable(now, retry_errors), id=page.id, kind=Page.Kind.IMAGE).update(
+        gen_status=Page.GenStatus.RUNNING,
+        gen_error="",
+        claimed_by=worker_id,
+        lease_expires_at=now + timedelta(seconds=lease),
+    ))
+
+
+def renew_page_lease(page: Page, worker_id: str, lease: Optional[int] = None) -> bool:
+    lease = lease or lease_seconds()
+    return bool(Page.objects.filter(
+        id=page.id, claimed_by=worker_id, gen_status=Page.GenStatus.RUNNING,
+    ).update(lease_expires_at=timezone.now() + timedelta(seconds=lease)))
+
+
+def complete_page(page: Page, worker_id: str, status: str, **fields) -> bool:
+    """Write the outcome and drop the claim, only if ``worker_id`` still holds it."""
+    return bool(Page.objects.filter(
+        id=page.id, claimed_by=worker_id, gen_status=Page.GenStatus.RUNNING,
+    ).update(gen_status=status, claimed_by="", lease_expires_at=None, **fields))
+
+
+# ---------------------------------------------------------------------------
+# Jobs
+# ---------------------------------------------------------------------------
+
+def enqueue_page(page: Page) -> ImageJob:
+    return ImageJob.objects.create(
+        page=page,
+        request_payload={
+            "prompt": page.image_prompt,
+            "negative_prompt": page.image_prompt_negative,
+            "seed": page.seed,
+        },
+    )
+
+
+def pending_jobs() -> int:
+    return ImageJob.objects.filter(_claimable(timezone.now())).count()
+
+
+def _claimable(now) -> Q:
+    # On a QUEUED job lease_expires_at, when set, is the earliest time it may be claimed again (see requeue).
+    queued = Q(status=ImageJob.Status.QUEUED) & (Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now))
+    return queued | Q(status=ImageJob.Status.RUNNING, lease_expires_at__lt=now)
+
+
+def claim_next(worker_id: str, lease: Optional[int] = None) -> Optional[ImageJob]:
+    """Atomically take the oldest claimable job for ``worker_id``; None if there is none."""
+    lease = lease or lease_seconds()
+    now = timezone.now()
+    candidates = list(
+        ImageJob.objects.filter(_claimable(now)).order_by("created_at").values_list("id", flat=True)[:20]
+    )
+    for job_id in candidates:
+        claimed = ImageJob.objects.filter(_claimable(now), id=job_id).update(
+            status=ImageJob.Status.RUNNING,
+            worker_id=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease),
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return ImageJob.objects.select_related("page").get(id=job_id)
+    return None
+
+
+def renew_lease(job: ImageJob, worker_id: str, lease: Optional[int] = None) -> bool:
+    """Extend the lease; False if the job is no longer ours (expired and reclaimed, or cancelled)."""
+    lease = lease or lease_seconds()
+    return bool(ImageJob.objects.filter(
+        id=job.id, worker_id=worker_id, status=ImageJob.Status.RUNNING,
+    ).update(lease_expires_at=timezone.now() + timedelta(seconds=lease)))
+
+
+def requeue(job: ImageJob, worker_id: str, not_before) -> bool:
+    """Put a claimed job back in the queue, claimable again from ``not_before``; this attempt is not counted."""
+    return bool(ImageJob.objects.filter(
+        id=job.id, worker_id=worker_id, status=ImageJob.Status.RUNNING,
+    ).update(
+        status=ImageJob.Status.QUEUED,
+        worker_id="",
+        lease_expires_at=not_before,
+        attempts=F("attempts") - 1,
+    ))
+
+
+def finish(job: ImageJob, worker_id: str, status: str, latency_ms: Optional[int] = None,
+           response: Optional[dict] = None) -> bool:
+    """Record the outcome, unless the claim was lost in the meantime."""
+    return bool(ImageJob.objects.filter(
+        id=job.id, worker_id=worker_id, status=ImageJob.Status.RUNNING,
+    ).update(
+        status=status,
+        latency_ms=latency_ms,
+        response_payload=response or {},
+        lease_expires_at=None,
+        finished_at=timezone.now(),
+    ))
+
+
+def cancel_jobs(jobs) -> int:
+    """
+    Cancel the QUEUED/RUNNING jobs of the ``jobs`` queryset. Their pages that are not
+    READY yet become ERROR and unclaimed, so a generation still in flight is discarded.
+    :returns: number of jobs cancelled
+    """
+    with transaction.atomic():
+        active = jobs.filter(status__in=ACTIVE_JOB_STATUSES)
+        # Write first (pages of the still-active jobs, by subquery) so SQLite takes the write lock up front.
+        Page.objects.filter(id__in=active.values("page_id")).exclude(gen_status=Page.GenStatus.READY).update(
+            gen_status=Page.GenStatus.ERROR, gen_error="Cancelled.", claimed_by="", lease_expires_at=None,
+        )
+        cancelled = active.update(
+            status=ImageJob.Status.CANCELLED, lease_expires_at=None, finished_at=timezone.now(),
+        )
+    return cancelled
+
+
+def cancel_story(story_id) -> int:
+    cancelled = cancel_jobs(ImageJob.objects.filter(page__storybook_id=story_id))
+    refresh_story_status(story_id)
+    return cancelled
+
+
+class LeaseKeeper:
+    """Calls ``renew`` from a background thread every third of the lease while a claim is held."""
+
+    def __init__(self, renew: Callable[[], bool], lease: Optional[int] = None, name: str = "lease"):
+        self.renew = renew
+        self.lease = lease or lease_seconds()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def _run(self):
+        from django.db import connection
+
+        try:
+            while not self._stop.wait(self.lease / 3):
+                if not self.renew():
+                    logger.warning("Lost claim %s", self._thread.name)
+                    return
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def refresh_story_status(story_id):
+    """Mark the story READY (or ERROR) once none of its image pages is still pending or running."""
+    pages = Page.objects.filter(storybook_id=story_id, kind=Page.Kind.IMAGE)
+    if pages.filter(gen_status__in=[Page.GenStatus.PENDING, Page.GenStatus.RUNNING]).exists():
+        return
+    failed = pages.filter(gen_status=Page.GenStatus.ERROR).exists()
+    Story.objects.filter(id=story_id, status=Story.Status.GENERATING).update(
+        status=Story.Status.ERROR if failed else Story.Status.READY,
+    )
+
+
+def run_job(job: ImageJob, worker_id: str, service, lease: Optional[int] = None) -> str:
+    """
+    Generate the image for a claimed job with ``service`` (an AIImageService).
+    :returns: the ImageJob status recorded (QUEUED when the job went back to the queue)
+    """
+    page = job.page
+    if job.attempts > max_attempts():
+        # Every earlier claim expired without a result: the page keeps killing its worker.
+        logger.error("Giving up on image job %s after %s attempts", job.id, job.attempts - 1)
+        Page.objects.filter(id=page.id).exclude(gen_status=Page.GenStatus.READY).update(
+            gen_status=Page.GenStatus.ERROR, gen_error=f"Gave up after {job.attempts - 1} attempts.",
+            claimed_by="", lease_expires_at=None,
+        )
+        finish(job, worker_id, ImageJob.Status.FAILED, response={"error": "max attempts exceeded"})
+        refresh_story_status(page.storybook_id)
+        return ImageJob.Status.FAILED
+
+    started = time.perf_counter()
+    with LeaseKeeper(lambda: renew_lease(job, worker_id, lease), lease, name=f"job-{job.id}"):
+        try:
+            service.generate_for_page(page, worker_id=worker_id, lease=lease)
+        except Exception:
+            logger.exception("Image job %s failed", job.id)
+    latency_ms = int((time.perf_counter() - started) * 1000)
+
+    page.refresh_from_db(fields=["gen_status", "gen_error", "image_file", "claimed_by", "lease_expires_at"])
+    if page.gen_status == Page.GenStatus.READY:
+        status = ImageJob.Status.SUCCESS
+        finish(job, worker_id, status, latency_ms, {"file": page.image_file.name})
+    elif page.gen_status == Page.GenStatus.RUNNING and page.claimed_by != worker_id:
+        # Someone else holds the page: a live claimant (a second job, generate_for_storybook), or a dead
+        # worker whose page lease outlived its job lease. Come back once that lease has run out.
+        status = ImageJob.Status.QUEUED
+        requeue(job, worker_id, page.lease_expires_at or timezone.now() + timedelta(seconds=lease or lease_seconds()))
+    else:
+        status = ImageJob.Status.FAILED
+        complete_page(page, worker_id, Page.GenStatus.ERROR, gen_error=page.gen_error or "Generation failed.")
+        finish(job, worker_id, status, latency_ms, {"error": page.gen_error})
+    refresh_story_status(page.storybook_id)
+    return status
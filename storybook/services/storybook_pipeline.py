@@ -1,9 +1,13 @@
 from .text_splitter import split_text_into_chunks
 from ..models import Page
-from .ai_image_service import AIImageService
+from .image_jobs import enqueue_page
+
 
-service = AIImageService()
 def create_storybook_from_text(storybook,text):
+    """
+    Create the TEXT and IMAGE pages and queue one ImageJob per IMAGE page.
+    Images are generated later by `manage.py run_image_workers`.
+    """
     chunks = split_text_into_chunks(text, max_words= 200)
 
     for i,chunk in enumerate(chunks):
@@ -22,4 +26,4 @@ def create_storybook_from_text(storybook,text):
             gen_status="PENDING"
         )
 
-        service.generate_for_page(image_page)
\ No newline at end of file
+        enqueue_page(image_page)
@@ -0,0 +1,239 @@
+"""
+Flow control for calls to the image provider, shared by every thread of every process
+(the run_image_workers pools, generate_for_storybook, generate_images_batch): the state
+lives in the provider's ProviderThrottle row and each change is a conditional UPDATE.
+
+- ``TokenBucket`` caps the request rate (settings.STORYBOOK_IMAGE_RATE_LIMIT); a 429
+  with Retry-After holds the whole bucket, not only the thread that got it.
+- ``CircuitBreaker`` (settings.STORYBOOK_IMAGE_CIRCUIT_BREAKER) opens after
+  FAILURE_THRESHOLD consecutive provider failures, or at once when the provider says
+  how long to wait (model loading ``estimated_time``, ``Retry-After``). While it is
+  open nobody calls the provider and the workers stop claiming jobs; after the
+  cooldown a single probe request decides whether it closes again.
+- ``backoff_delay`` is exponential backoff with full jitter (settings.STORYBOOK_IMAGE_RETRY),
+  never shorter than what the provider asked for.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+
+from ..models import ProviderThrottle
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMIT = {"RATE": 1.0, "BURST": 4}
+DEFAULT_RETRY = {"MAX_RETRIES": 4, "BASE_DELAY": 2.0, "MAX_DELAY": 60.0}
+DEFAULT_CIRCUIT_BREAKER = {"FAILURE_THRESHOLD": 5, "COOLDOWN": 30.0}
+
+
+def retry_settings() -> dict:
+    return {**DEFAULT_RETRY, **getattr(settings, "STORYBOOK_IMAGE_RETRY", {})}
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Seconds to wait before retry number ``attempt + 1`` (attempt counts from 0)."""
+    conf = retry_settings()
+    delay = random.uniform(0, min(conf["MAX_DELAY"], conf["BASE_DELAY"] * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+def _update(provider: str, clock, change):
+    """
+    Apply ``change(state, now) -> (fields to write or None, result)`` to the provider's row,
+    retrying when another worker wrote it in between. :returns: the result
+    """
+    while True:
+        state = ProviderThrottle.objects.filter(provider=provider).first()
+        if state is None:
+            ProviderThrottle.objects.bulk_create([ProviderThrottle(provider=provider)], ignore_conflicts=True)
+            continue
+        fields, result = change(state, clock())
+        if not fields:
+            return result
+        if ProviderThrottle.objects.filter(provider=provider, revision=state.revision).update(
+                revision=state.revision + 1, **fields):
+            return result
+
+
+class TokenBucket:
+    def __init__(self, provider: str, rate: float, burst: int, clock=time.time):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.provider = provider
+        self.clock = clock
+
+    def _reserve(self) -> float:
+        """Take a token if one is available; otherwise the seconds until one will be."""
+        def take(state, now):
+            if now < state.held_until:
+                return None, state.held_until - now
+            tokens = min(self.burst, state.tokens + max(0.0, now - state.refilled_at) * self.rate)
+            if tokens >= 1:
+                return {"tokens": tokens - 1, "refilled_at": now}, 0.0
+            return None, (1 - tokens) / self.rate if self.rate > 0 else 1.0
+
+        return _update(self.provider, self.clock, take)
+
+    def acquire(self):
+        """Block until the caller may send one request."""
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def hold(self, seconds: float):
+        """Send nothing for ``seconds`` (the provider throttled us) and restart with an empty bucket."""
+        def change(state, now):
+            until = max(state.held_until, now + seconds)
+            return {"held_until": until, "tokens": 0.0, "refilled_at": until}, None
+
+        _update(self.provider, self.clock, change)
+
+
+class CircuitBreaker:
+    def __init__(self, provider: str, failure_threshold: int = 5, cooldown: float = 30.0, clock=time.time):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.provider = provider
+        self.clock = clock
+
+    def remaining(self) -> float:
+        """Seconds the breaker stays open (0 when requests may go out)."""
+        state = ProviderThrottle.objects.filter(provider=self.provider).first()
+        return max(0.0, state.open_until - self.clock()) if state is not None else 0.0
+
+    def _admit(self) -> float:
+        def admit(state, now):
+            if now < state.open_until:
+                return None, state.open_until - now
+            if state.open_until and state.failures:
+                # Half-open: let one probe through, the others wait for its outcome. The claim
+                # expires after the cooldown, in case the probing worker died.
+                if now < state.probe_until:
+                    return None, 1.0
+                return {"probe_until": now + self.cooldown}, 0.0
+            return None, 0.0
+
+        return _update(self.provider, self.clock, admit)
+
+    def wait(self):
+        """Block while the breaker is open."""
+        while True:
+            wait = self._admit()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def record_success(self):
+        def close(state, now):
+            if not (state.failures or state.open_until or state.probe_until):
+                return None, None
+            return {"failures": 0, "open_until": 0.0, "probe_until": 0.0}, None
+
+        _update(self.provider, self.clock, close)
+
+    def release_probe(self):
+        """The probe failed for a reason unrelated to the provider; let another caller probe."""
+        _update(self.provider, self.clock, lambda state, now: ({"probe_until": 0.0} if state.probe_until else None, None))
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        """
+        Count a provider failure. ``retry_after`` (the provider's own estimate) opens the
+        breaker for that long straight away; otherwise it opens for the cooldown once
+        FAILURE_THRESHOLD failures follow each other, or when the half-open probe fails.
+        """
+        def fail(state, now):
+            failures = state.failures + 1
+            fields = {"failures": failures, "probe_until": 0.0}
+            if retry_after or state.probe_until or failures >= self.failure_threshold:
+                seconds = retry_after or self.cooldown
+                fields["open_until"] = max(state.open_until, now + seconds)
+                return fields, (failures, seconds)
+            return fields, None
+
+        opened = _update(self.provider, self.clock, fail)
+        if opened:
+            logger.warning("Image provider unhealthy (%s failures); pausing requests for %.1fs", *opened)
+
+
+_limiter: Optional[TokenBucket] = None
+_breaker: Optional[CircuitBreaker] = None
+_lock = threading.Lock()
+
+
+def get_rate_limiter() -> TokenBucket:
+    """Token bucket of the image provider, built from ``settings.STORYBOOK_IMAGE_RATE_LIMIT``."""
+    global _limiter
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                from .image_generator import PROVIDER
+
+                conf = {**DEFAULT_RATE_LIMIT, **getattr(settings, "STORYBOOK_IMAGE_RATE_LIMIT", {})}
+                _limiter = TokenBucket(PROVIDER, conf["RATE"], conf["BURST"])
+    return _limiter
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Circuit breaker of the image provider, built from ``settings.STORYBOOK_IMAGE_CIRCUIT_BREAKER``."""
+    global _breaker
+    if _breaker is None:
+        with _lock:
+            if _breaker is None:
+                from .image_generator import PROVIDER
+
+                conf = {**DEFAULT_CIRCUIT_BREAKER, **getattr(settings, "STORYBOOK_IMAGE_CIRCUIT_BREAKER", {})}
+                _breaker = CircuitBreaker(PROVIDER, conf["FAILURE_THRESHOLD"], conf["COOLDOWN"])
+    return _breaker
+
+
+def call_provider(fn, *args, **kwargs):
+    """
+    Call ``fn`` (e.g. generate_images) once the breaker and the rate limit allow it,
+    and feed the outcome back to both. Errors are re-raised for the caller to retry.
+    """
+    breaker = get_circuit_breaker()
+    breaker.wait()
+    get_rate_limiter().acquire()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        if getattr(e, "unhealthy", False):
+            retry_after = getattr(e, "retry_after", None)
+            breaker.record_failure(retry_after)
+            if getattr(e, "status", None) == 429:
+                get_rate_limiter().hold(retry_after or backoff_delay(0))
+        elif getattr(e, "status", None):
+            # The provider answered (a hard 4xx): it is up, the request was bad.
+            breaker.record_success()
+        else:
+            breaker.release_probe()
+        raise
+    breaker.record_success()
+    return result
+
+
+def call_with_retries(fn, *args, max_retries: Optional[int] = None, before_retry=None, **kwargs):
+    """
+    ``call_provider(fn, ...)``, retrying errors marked ``retryable`` up to ``max_retries`` times
+    (default STORYBOOK_IMAGE_RETRY["MAX_RETRIES"]) after ``backoff_delay``. ``before_retry()``
+    runs after each wait; returning False gives up with the last error.
+    """
+    max_retries = retry_settings()["MAX_RETRIES"] if max_retries is None else max_retries
+    for attempt in range(max_retries + 1):
+        try:
+            return call_provider(fn, *args, **kwargs)
+        except Exception as e:
+            if not getattr(e, "retryable", False) or attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt, getattr(e, "retry_after", None))
+            logger.info("Image request failed (attempt %s/%s): %s; retrying in %.1fs",
+                        attempt + 1, max_retries + 1, e, delay)
+            time.sleep(delay)
+            if before_retry is not None and not before_retry():
+                raise
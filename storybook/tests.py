@@ -1,3 +1,237 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import CachedImage, ImageJob, Page, Story
+from .services import image_cache
+from .services.ai_image_service import AIImageService
+from .services.image_generator import RateLimitedError, RequestRejectedError
+from .services.image_jobs import claim_next, claim_page, enqueue_page, run_job
+from .services.throttling import CircuitBreaker, TokenBucket, backoff_delay, call_with_retries
+
+
+def make_page(prompt="A fox reading under a lantern", seed=7, index=1, story=None):
+    story = story or Story.objects.create(source_type=Story.SourceType.PASTE, status=Story.Status.GENERATING)
+    return Page.objects.create(storybook=story, index=index, kind=Page.Kind.IMAGE, image_prompt=prompt, seed=seed)
+
+
+def fake_generate_images(prompt, output_path, **kwargs):
+    with open(output_path, "wb") as fp:
+        fp.write(b"\x89PNG fake image for " + prompt.encode("utf-8"))
+    return output_path
+
+
+class MediaMixin:
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        patcher = mock.patch("storybook.services.ai_image_service.generate_images", side_effect=fake_generate_images)
+        self.generate_images = patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class MediaTestCase(MediaMixin, TestCase):
+    pass
+
+
+class LeaseReclaimTests(MediaTestCase):
+    def expire(self, model, **filters):
+        model.objects.filter(**filters).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_job_reclaimed_while_dead_workers_page_lease_is_live_is_requeued(self):
+        page = make_page()
+        job = enqueue_page(page)
+
+        # Worker A claims the job and the page, then dies. Its job lease runs out first.
+        self.assertEqual(claim_next("worker-a", lease=60).id, job.id)
+        self.assertTrue(claim_page(page, "worker-a", lease=60))
+        self.expire(ImageJob, id=job.id)
+
+        service = AIImageService()
+        reclaimed = claim_next("worker-b", lease=60)
+        self.assertEqual(run_job(reclaimed, "worker-b", service, lease=60), ImageJob.Status.QUEUED)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.Status.QUEUED, 1))
+        self.assertIsNone(claim_next("worker-b", lease=60))
+        self.generate_images.assert_not_called()
+
+        # Once A's page lease has run out too, the requeued job takes the page over.
+        self.expire(Page, id=page.id)
+        self.expire(ImageJob, id=job.id)
+        reclaimed = claim_next("worker-b", lease=60)
+        self.assertEqual(run_job(reclaimed, "worker-b", service, lease=60), ImageJob.Status.SUCCESS)
+
+        page.refresh_from_db()
+        self.assertEqual((page.gen_status, page.claimed_by), (Page.GenStatus.READY, ""))
+        self.assertEqual(Story.objects.get(id=page.storybook_id).status, Story.Status.READY)
+        self.assertEqual(self.generate_images.call_count, 1)
+
+
+@override_settings(STORYBOOK_IMAGE_JOB_MAX_ATTEMPTS=2)
+class ImageWorkerCommandTests(MediaMixin, TransactionTestCase):
+    # Worker threads use their own database connections, so the rows they read must be committed.
+
+    def run_workers(self, workers=1):
+        out = StringIO()
+        call_command("run_image_workers", workers=workers, once=True, lease_seconds=60, stdout=out)
+        return out.getvalue()
+
+    def claimed_by_dead_worker(self, page, attempts=1, expired=True):
+        """A job and page claimed by a worker that died; its leases ran out unless ``expired`` is False."""
+        expires = timezone.now() + timedelta(seconds=-1 if expired else 60)
+        job = enqueue_page(page)
+        ImageJob.objects.filter(id=job.id).update(
+            status=ImageJob.Status.RUNNING, worker_id="dead", attempts=attempts, lease_expires_at=expires,
+        )
+        Page.objects.filter(id=page.id).update(
+            gen_status=Page.GenStatus.RUNNING, claimed_by="dead", lease_expires_at=expires,
+        )
+        return job
+
+    def test_each_queued_job_is_claimed_once(self):
+        for i in range(3):
+            enqueue_page(make_page(prompt=f"A fox in scene {i}", index=i))
+        self.assertIn("3 ready, 0 failed", self.run_workers(workers=2))
+
+        self.assertEqual(self.generate_images.call_count, 3)
+        for job in ImageJob.objects.all():
+            self.assertEqual((job.status, job.attempts), (ImageJob.Status.SUCCESS, 1))
+            self.assertTrue(job.worker_id)
+        self.assertEqual(set(Page.objects.values_list("gen_status", flat=True)), {Page.GenStatus.READY})
+
+    def test_live_lease_is_left_alone(self):
+        job = self.claimed_by_dead_worker(make_page(), expired=False)
+        self.assertIn("0 ready, 0 failed", self.run_workers())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id), (ImageJob.Status.RUNNING, "dead"))
+        self.generate_images.assert_not_called()
+
+    def test_expired_lease_is_reclaimed_and_retried(self):
+        page = make_page()
+        job = self.claimed_by_dead_worker(page)
+        self.assertIn("1 ready, 0 failed", self.run_workers())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.Status.SUCCESS, 2))
+        self.assertNotEqual(job.worker_id, "dead")
+        page.refresh_from_db()
+        self.assertEqual((page.gen_status, page.claimed_by), (Page.GenStatus.READY, ""))
+
+    def test_job_gives_up_after_max_attempts(self):
+        page = make_page()
+        job = self.claimed_by_dead_worker(page, attempts=2)
+        self.assertIn("0 ready, 1 failed", self.run_workers())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.Status.FAILED, 3))
+        page.refresh_from_db()
+        self.assertEqual(page.gen_status, Page.GenStatus.ERROR)
+        self.assertEqual(Story.objects.get(id=page.storybook_id).status, Story.Status.ERROR)
+        self.generate_images.assert_not_called()
+
+
+class ImageCacheTests(MediaTestCase):
+    def test_pages_asking_for_the_same_image_share_one_render(self):
+        first, second = make_page(), make_page()
+        service = AIImageService()
+        self.assertTrue(service.generate_for_page(first))
+        self.assertTrue(service.generate_for_page(second))
+
+        self.assertEqual(self.generate_images.call_count, 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image_file.name, second.image_file.name)
+        self.assertEqual(second.image_meta["cache_hit"], True)
+        entry = CachedImage.objects.get()
+        self.assertEqual((entry.file.name, entry.hits), (first.image_file.name, 1))
+
+    def test_evict_drops_only_idle_unreferenced_entries(self):
+        service = AIImageService()
+        shown = make_page(prompt="shown")
+        service.generate_for_page(shown)
+        for prompt in ("idle", "recent"):
+            page = make_page(prompt=prompt)
+            service.generate_for_page(page)
+            Page.objects.filter(id=page.id).update(image_file="")
+        CachedImage.objects.exclude(params__prompt="recent").update(
+            last_used_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(image_cache.evict(max_bytes=0), 1)
+        self.assertEqual(sorted(CachedImage.objects.values_list("params__prompt", flat=True)), ["recent", "shown"])
+        self.assertTrue(default_storage.exists(Page.objects.get(id=shown.id).image_file.name))
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class ThrottlingTests(TestCase):
+    def test_token_bucket_is_shared_between_processes(self):
+        clock = FakeClock()
+        # Two buckets over the same provider row stand for two worker processes.
+        first, second = (TokenBucket("test", rate=1.0, burst=2, clock=clock) for _ in range(2))
+        self.assertEqual(first._reserve(), 0.0)
+        self.assertEqual(second._reserve(), 0.0)
+        self.assertAlmostEqual(first._reserve(), 1.0)
+
+        clock.now += 1.0
+        self.assertEqual(second._reserve(), 0.0)
+        first.hold(30)
+        clock.now += 10
+        self.assertAlmostEqual(second._reserve(), 20.0)
+
+    def test_breaker_opens_for_every_process_and_closes_after_a_probe(self):
+        clock = FakeClock()
+        first, second = (CircuitBreaker("test", failure_threshold=2, cooldown=30, clock=clock) for _ in range(2))
+        first.record_failure()
+        self.assertEqual(second.remaining(), 0.0)
+        second.record_failure()
+        self.assertEqual(first.remaining(), 30.0)
+
+        clock.now += 31
+        self.assertEqual(first._admit(), 0.0)   # the half-open probe
+        self.assertEqual(second._admit(), 1.0)  # waits for its outcome
+        first.record_success()
+        self.assertEqual(second._admit(), 0.0)
+
+    def test_failed_probe_or_provider_wait_reopens_breaker(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker("test", failure_threshold=5, cooldown=30, clock=clock)
+        breaker.record_failure(retry_after=12)
+        self.assertEqual(breaker.remaining(), 12.0)
+        clock.now += 13
+        self.assertEqual(breaker._admit(), 0.0)
+        breaker.record_failure()
+        self.assertEqual(breaker.remaining(), 30.0)
+
+    @override_settings(STORYBOOK_IMAGE_RETRY={"MAX_RETRIES": 2, "BASE_DELAY": 2.0, "MAX_DELAY": 5.0})
+    def test_backoff_is_capped_and_honours_retry_after(self):
+        for attempt in range(6):
+            self.assertLessEqual(backoff_delay(attempt), 5.0)
+        self.assertGreaterEqual(backoff_delay(0, retry_after=20), 20)
+
+    @override_settings(STORYBOOK_IMAGE_RETRY={"MAX_RETRIES": 2, "BASE_DELAY": 2.0, "MAX_DELAY": 5.0})
+    def test_only_retryable_errors_are_retried(self):
+        calls = mock.Mock(side_effect=[RateLimitedError("slow down", 429, 3), "ok"])
+        with mock.patch("storybook.services.throttling.time.sleep") as sleep:
+            self.assertEqual(call_with_retries(calls), "ok")
+        self.assertEqual(calls.call_count, 2)
+        self.assertGreaterEqual(sleep.call_args_list[0].args[0], 3)
+
+        rejected = mock.Mock(side_effect=RequestRejectedError("bad prompt", 400))
+        with self.assertRaises(RequestRejectedError):
+            call_with_retries(rejected)
+        self.assertEqual(rejected.call_count, 1)
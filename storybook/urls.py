@@ -6,5 +6,6 @@ app_name = "storybook"
 urlpatterns = [
     path("create/", views.create_storybook, name="create_storybook"),
     path("preview/<uuid:storybook_id>/", views.preview_storybook, name="preview_storybook"),
+    path("cancel/<uuid:storybook_id>/", views.cancel_storybook, name="cancel_storybook"),
     path("download/<uuid:storybook_id>/", views.download_pdf, name="download_pdf"),
 ]
\ No newline at end of file
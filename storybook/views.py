@@ -10,11 +10,11 @@ from django.views.decorators.http import require_http_methods
 from django.db import transaction
 
 
-from .models import Story, Page  
+from .models import Story
 from .services.storybook_pipeline import create_storybook_from_text
 from .services.pdf_builder import build_pdf
 from .services.pdf_extractor import extract_text_from_pdf  
-from .services.ai_image_service import AIImageService
+from .services.image_jobs import cancel_story, refresh_story_status
 
 
 @csrf_exempt
@@ -53,32 +53,29 @@ def create_storybook(request):
         status=Story.Status.GENERATING,
     )
 
-    # Building pages (TEXT + IMAGE prompts)
+    # Building pages (TEXT + IMAGE prompts) and queueing their image jobs;
+    # `manage.py run_image_workers` generates the images.
     try:
-        create_storybook_from_text(story, source_text)
-        story.page_count = story.pages.count()
-        story.save(update_fields=["page_count", "status"])
+        with transaction.atomic():
+            create_storybook_from_text(story, source_text)
+            story.page_count = story.pages.count()
+            story.save(update_fields=["page_count", "status"])
     except Exception as e:
         story.status = Story.Status.ERROR
         story.save(update_fields=["status"])
         return JsonResponse({"status": "error", "message": f"Pipeline failed: {e}"}, status=500)
+    refresh_story_status(story.id)  # a story without image pages is ready right away
 
-    image_page_ids = list(
-        story.pages.filter(kind="IMAGE", gen_status="PENDING").values_list("id", flat=True)
-    )
-    service = AIImageService()
-
-    def _kick_off():
-        for pid in image_page_ids:
-            try:
-                page = Page.objects.get(id=pid)  
-                service.generate_for_page(page)
-            except Exception:
-                continue
+    return JsonResponse({"status": "success", "storybook_id": str(story.id)})
 
-    transaction.on_commit(_kick_off)
 
-    return JsonResponse({"status": "success", "storybook_id": str(story.id)})
+@csrf_exempt
+@require_http_methods(["POST"])
+def cancel_storybook(request, storybook_id):
+    """Cancel the image jobs of a story that have not finished; images already generated are kept."""
+    story = get_object_or_404(Story, id=storybook_id)
+    cancelled = cancel_story(story.id)
+    return JsonResponse({"status": "success", "cancelled": cancelled})
 
 
 def preview_storybook(request, storybook_id):
@@ -0,0 +1,56 @@
+from base64 import b64encode
+
+import numpy as np
+from django.db import models
+
+
+class VectorField(models.BinaryField):
+    """
+    Dense vector stored as raw little-endian bytes (float32 by default, float16 to halve storage).
+
+    Values come back from the database as read-only ``numpy`` arrays built with
+    ``numpy.frombuffer``, so loading a row never parses JSON or creates Python floats.
+    Lists, tuples and arrays are accepted on assignment; an empty vector is stored as ``b""``.
+    """
+
+    description = "Dense float vector"
+
+    def __init__(self, *args, dtype="float32", **kwargs):
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        if self.dtype.kind != "f":
+            raise ValueError("VectorField dtype must be a floating point type.")
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.dtype != np.dtype("<f4"):
+            kwargs["dtype"] = self.dtype.name
+        return name, path, args, kwargs
+
+    def to_vector(self, value):
+        if value is None:
+            return None
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return np.frombuffer(value, dtype=self.dtype)
+        return np.asarray(value, dtype=self.dtype).ravel()
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_vector(value)
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            value = super().to_python(value)  # base64 from serialized fixtures
+        return self.to_vector(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is not None and not isinstance(value, (bytes, bytearray, memoryview)):
+            value = np.ascontiguousarray(value, dtype=self.dtype).tobytes()
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        if value is None:
+            return None
+        if not isinstance(value, (bytes, bytearray, memoryview)):
+            value = np.ascontiguousarray(value, dtype=self.dtype).tobytes()
+        return b64encode(value).decode("ascii")
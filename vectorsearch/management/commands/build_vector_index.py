@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from vectorsearch.models import Persona
+from vectorsearch.services.ann_index import IVFIndex, build_ivf_index, recall_at_k
+from vectorsearch.services.result_cache import bump_index_version
+from vectorsearch.services.search_backends import load_embedding_matrix, top_k_indices
+
+
+class Command(BaseCommand):
+    help = "Build the memory-mapped IVF index from Persona.embedding and report recall@k against exact search"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=None,
+                            help="Index directory (default: settings.VECTORSEARCH_INDEX_PATH)")
+        parser.add_argument("--nlist", type=int, default=None,
+                            help="Number of inverted lists (default: settings.VECTORSEARCH_IVF_NLIST or ~sqrt(n))")
+        parser.add_argument("--iterations", type=int, default=20, help="k-means iterations")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--recall-k", type=int, default=10, help="k used for the recall report")
+        parser.add_argument("--recall-queries", type=int, default=200,
+                            help="Number of sampled personas used as queries in the recall report (0 to skip)")
+        parser.add_argument("--nprobe", type=int, nargs="*", default=None,
+                            help="nprobe values to report (default: 1 2 4 8 16 32 and the configured value)")
+
+    def handle(self, *args, **opts):
+        output = opts["output"] or getattr(settings, "VECTORSEARCH_INDEX_PATH", None)
+        if not output:
+            raise CommandError("Pass --output or set VECTORSEARCH_INDEX_PATH.")
+
+        # -----------------------------
+        # Load vectors
+        # -----------------------------
+        t0 = time.perf_counter()
+        ids, matrix = load_embedding_matrix()
+        if len(ids) == 0:
+            raise CommandError("No persona embeddings found. Run generate_embeddings first.")
+        self.stdout.write(f"Loaded {len(ids)} vectors (dim={matrix.shape[1]}) in {time.perf_counter() - t0:.2f}s")
+
+        # -----------------------------
+        # Build and write the index
+        # -----------------------------
+        hashes = dict(Persona.objects.filter(embedding__isnull=False).values_list("id", "embedding_hash"))
+        nlist = opts["nlist"] or getattr(settings, "VECTORSEARCH_IVF_NLIST", None) or int(np.sqrt(len(ids))) or 1
+        t0 = time.perf_counter()
+        path = build_ivf_index(ids, matrix, output, nlist=nlist, iterations=opts["iterations"], seed=opts["seed"],
+                               hashes=[hashes.get(int(pk), "") for pk in ids])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote IVF index ({min(nlist, len(ids))} lists) to {path} in {time.perf_counter() - t0:.2f}s"
+        ))
+
+        bump_index_version()
+
+        if opts["recall_queries"] > 0:
+            self.report_recall(IVFIndex.open(path), ids, matrix, opts)
+
+    def report_recall(self, index, ids, matrix, opts):
+        k = opts["recall_k"]
+        rng = np.random.default_rng(opts["seed"])
+        n_queries = min(opts["recall_queries"], len(ids))
+        queries = matrix[rng.choice(len(ids), size=n_queries, replace=False)]
+
+        t0 = time.perf_counter()
+        exact = [ids[top_k_indices(matrix @ q, k)].tolist() for q in queries]
+        exact_ms = (time.perf_counter() - t0) * 1000 / n_queries
+
+        configured = getattr(settings, "VECTORSEARCH_IVF_NPROBE", 8)
+        nprobes = opts["nprobe"] or sorted({1, 2, 4, 8, 16, 32, configured})
+        nlist = index.meta["nlist"]
+
+        self.stdout.write(f"recall@{k} over {n_queries} queries (exact search: {exact_ms:.3f} ms/query)")
+        for nprobe in nprobes:
+            if nprobe > nlist:
+                continue
+            t0 = time.perf_counter()
+            approx = [index.search(q, top_k=k, nprobe=nprobe)[0].tolist() for q in queries]
+            approx_ms = (time.perf_counter() - t0) * 1000 / n_queries
+            marker = "  <- VECTORSEARCH_IVF_NPROBE" if nprobe == configured else ""
+            self.stdout.write(
+                f"  nprobe={nprobe:<4} recall={recall_at_k(exact, approx, k):.3f}  {approx_ms:.3f} ms/query{marker}"
+            )
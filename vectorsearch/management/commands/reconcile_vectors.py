@@ -0,0 +1,98 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from vectorsearch.models import Persona
+from vectorsearch.services.outbox import sync_vectors
+from vectorsearch.services.providers import default_model_name, encoder_version, get_encoder, get_pinecone_index
+from vectorsearch.services.result_cache import bump_index_version
+
+
+def _fetched_metadata(response) -> dict:
+    """{id: metadata} from a fetch response (SDK object or the dict returned by the local stand-in)."""
+    vectors = response.vectors if hasattr(response, "vectors") else response.get("vectors", {})
+    return {
+        vid: (v.metadata if hasattr(v, "metadata") else v.get("metadata")) or {}
+        for vid, v in vectors.items()
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare the Pinecone index with the Persona table and repair only the differences"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report the differences without writing anything")
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Personas re-embedded/upserted per repair batch")
+        parser.add_argument("--fetch-batch-size", type=int, default=100,
+                            help="Ids per index fetch when comparing content hashes")
+        parser.add_argument("--sample", type=int, default=10, help="Ids listed per category in the report")
+
+    def handle(self, *args, **opts):
+        index = get_pinecone_index()
+        namespace = getattr(settings, "PINECONE_NAMESPACE", None)
+        ns_kwargs = {"namespace": namespace} if namespace else {}
+        started = time.perf_counter()
+
+        # -----------------------------
+        # Collect ids on both sides
+        # -----------------------------
+        index_ids = set()
+        for page in index.list(**ns_kwargs):
+            index_ids.update(page)
+
+        db_hashes = {}
+        for pk, bio in Persona.objects.values_list("id", "bio").iterator(chunk_size=5000):
+            db_hashes[str(pk)] = Persona(bio=bio).content_hash()
+        self.stdout.write(f"{len(index_ids)} vectors in the index, {len(db_hashes)} personas in the database")
+
+        # -----------------------------
+        # Diff
+        # -----------------------------
+        missing = sorted(db_hashes.keys() - index_ids, key=int)
+        orphaned = sorted(index_ids - db_hashes.keys())
+        common = sorted(index_ids & db_hashes.keys(), key=int)
+
+        stale = []
+        fetch_size = max(1, opts["fetch_batch_size"])
+        for start in range(0, len(common), fetch_size):
+            chunk = common[start:start + fetch_size]
+            metadata = _fetched_metadata(index.fetch(ids=chunk, **ns_kwargs))
+            stale.extend(
+                vid for vid in chunk
+                if metadata.get(vid, {}).get("content_hash") != db_hashes[vid]
+            )
+
+        for label, ids in (("missing from index", missing), ("orphaned in index", orphaned),
+                           ("stale (content hash differs)", stale)):
+            sample = ", ".join(ids[:opts["sample"]]) + (" ..." if len(ids) > opts["sample"] else "")
+            self.stdout.write(f"  {label:<30} {len(ids):>7}" + (f"  [{sample}]" if ids else ""))
+        self.stdout.write(f"Compared in {time.perf_counter() - started:.2f}s")
+
+        if opts["dry_run"] or not (missing or orphaned or stale):
+            if not (missing or orphaned or stale):
+                self.stdout.write(self.style.SUCCESS("Index and database agree."))
+            return
+
+        # -----------------------------
+        # Repair only the delta
+        # -----------------------------
+        model_name = default_model_name()
+        encoder = get_encoder(model_name)
+        version = encoder_version(model_name)
+        upsert_ids = [int(vid) for vid in missing + stale]
+        batch_size = max(1, opts["batch_size"])
+        totals = {"upserted": 0, "embedded": 0, "deleted": 0}
+
+        stats = sync_vectors(encoder, version, index, upsert_ids=[], delete_ids=orphaned, namespace=namespace)
+        totals["deleted"] += stats["deleted"]
+        for start in range(0, len(upsert_ids), batch_size):
+            stats = sync_vectors(encoder, version, index, upsert_ids=upsert_ids[start:start + batch_size],
+                                 delete_ids=[], namespace=namespace)
+            for key in totals:
+                totals[key] += stats[key]
+
+        bump_index_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Repaired: {totals['upserted']} upserted ({totals['embedded']} re-embedded), {totals['deleted']} deleted."
+        ))
@@ -0,0 +1,54 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from vectorsearch.services.embedding_server import EmbeddingServer
+from vectorsearch.services.providers import default_model_name, get_encoder
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+class Command(BaseCommand):
+    help = "Serve sentence embeddings to all workers over a Unix socket, micro-batching concurrent requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=None,
+                            help="Socket path (default: settings.VECTORSEARCH_EMBEDDING_SOCKET)")
+        parser.add_argument("--model", default=None,
+                            help="Sentence encoder name (default: settings.VECTORSEARCH_MODEL_NAME)")
+        parser.add_argument("--max-batch", type=int, default=64,
+                            help="Most texts encoded in one model call")
+        parser.add_argument("--window-ms", type=float, default=5.0,
+                            help="How long to wait for more requests before encoding a batch")
+        parser.add_argument("--shm-ttl", type=float, default=60.0,
+                            help="Seconds after which a result block no client released is unlinked")
+
+    def handle(self, *args, **opts):
+        socket_path = opts["socket"] or getattr(settings, "VECTORSEARCH_EMBEDDING_SOCKET", None)
+        if not socket_path:
+            raise CommandError("Pass --socket or set VECTORSEARCH_EMBEDDING_SOCKET.")
+
+        model_name = opts["model"] or default_model_name()
+        encoder = get_encoder(model_name, remote=False)
+        self.stdout.write(self.style.SUCCESS(f"Model {model_name} loaded successfully."))
+
+        server = EmbeddingServer(
+            socket_path, encoder, model_name,
+            max_batch=max(1, opts["max_batch"]),
+            window_ms=max(0.0, opts["window_ms"]),
+            shm_ttl=max(1.0, opts["shm_ttl"]),
+        )
+        signal.signal(signal.SIGTERM, _interrupt)
+
+        self.stdout.write(f"Listening on {socket_path} (max batch {opts['max_batch']}, window {opts['window_ms']} ms)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(
+                f"Served {server.batcher.requests} requests in {server.batcher.batches} batches."
+            )
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("vectorsearch", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="persona",
+            name="embedding_dim",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="persona",
+            name="embedding_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="persona",
+            name="embedding_model",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+    ]
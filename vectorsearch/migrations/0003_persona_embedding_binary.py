@@ -0,0 +1,23 @@
+# Moves Persona.embedding from a JSON list of floats to packed float32 bytes:
+# 0003 adds the binary column, 0004 copies the vectors, 0005 drops the JSON column.
+# The data copy has its own migration so no schema change shares its transaction
+# (PostgreSQL refuses ALTER TABLE with pending trigger events).
+
+from django.db import migrations
+
+import vectorsearch.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("vectorsearch", "0002_persona_embedding_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="persona",
+            name="embedding_vec",
+            field=vectorsearch.fields.VectorField(blank=True, null=True),
+        ),
+    ]
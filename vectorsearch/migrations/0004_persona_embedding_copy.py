@@ -0,0 +1,40 @@
+# Copies the JSON embeddings into the packed float32 column added by 0003.
+
+from django.db import migrations
+
+
+def json_to_binary(apps, schema_editor):
+    Persona = apps.get_model("vectorsearch", "Persona")
+    batch = []
+    for persona in Persona.objects.filter(embedding__isnull=False).only("id", "embedding").iterator(chunk_size=1000):
+        persona.embedding_vec = persona.embedding or []
+        batch.append(persona)
+        if len(batch) >= 1000:
+            Persona.objects.bulk_update(batch, ["embedding_vec"])
+            batch = []
+    if batch:
+        Persona.objects.bulk_update(batch, ["embedding_vec"])
+
+
+def binary_to_json(apps, schema_editor):
+    Persona = apps.get_model("vectorsearch", "Persona")
+    batch = []
+    for persona in Persona.objects.filter(embedding_vec__isnull=False).only("id", "embedding_vec").iterator(chunk_size=1000):
+        persona.embedding = [float(x) for x in persona.embedding_vec]
+        batch.append(persona)
+        if len(batch) >= 1000:
+            Persona.objects.bulk_update(batch, ["embedding"])
+            batch = []
+    if batch:
+        Persona.objects.bulk_update(batch, ["embedding"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("vectorsearch", "0003_persona_embedding_binary"),
+    ]
+
+    operations = [
+        migrations.RunPython(json_to_binary, binary_to_json),
+    ]
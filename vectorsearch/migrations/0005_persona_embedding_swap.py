@@ -0,0 +1,22 @@
+# Drops the JSON embedding column and gives the packed float32 column its name.
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("vectorsearch", "0004_persona_embedding_copy"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="persona",
+            name="embedding",
+        ),
+        migrations.RenameField(
+            model_name="persona",
+            old_name="embedding_vec",
+            new_name="embedding",
+        ),
+    ]
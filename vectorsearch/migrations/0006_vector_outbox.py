@@ -0,0 +1,26 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("vectorsearch", "0005_persona_embedding_swap"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VectorOutbox",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("persona_id", models.BigIntegerField(db_index=True)),
+                ("op", models.CharField(choices=[("upsert", "Upsert"), ("delete", "Delete")], max_length=6)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+    ]
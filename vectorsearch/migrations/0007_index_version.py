@@ -0,0 +1,20 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("vectorsearch", "0006_vector_outbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IndexVersion",
+            fields=[
+                ("name", models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ("version", models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+    ]
@@ -1,4 +1,9 @@
-from django.db import models
+import hashlib
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .fields import VectorField
 
 class Persona(models.Model):
     name = models.CharField(max_length=100)
@@ -9,9 +14,71 @@ class Persona(models.Model):
     hobbies = models.JSONField(default=list)  
     smoker = models.BooleanField()
     location = models.CharField(max_length=100)
-    embedding = models.JSONField(null=True, blank=True) 
+    embedding = VectorField(null=True, blank=True)  # float32 bytes, read back as a numpy array
+
+    # What the stored embedding was computed from, so stale vectors can be detected
+    embedding_hash = models.CharField(max_length=64, blank=True, default="")
+    embedding_model = models.CharField(max_length=100, blank=True, default="")
+    embedding_dim = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.name} ({self.job_role})"
 
+    # post_save/post_delete handlers queue VectorOutbox rows (vectorsearch.signals); running them inside
+    # the same transaction as the write means a persona change and its outbox entry commit together.
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using")):
+            return super().delete(*args, **kwargs)
+
+    def embedding_text(self) -> str:
+        """Text that is fed to the sentence encoder for this persona."""
+        return self.bio or ""
+
+    def content_hash(self) -> str:
+        return hashlib.sha256(self.embedding_text().encode("utf-8")).hexdigest()
+
+    def embedding_is_current(self, model_name: str, dim: int) -> bool:
+        return (
+            self.embedding_hash == self.content_hash()
+            and self.embedding_model == model_name
+            and self.embedding_dim == dim
+        )
+
+
+class VectorOutbox(models.Model):
+    """
+    Pending vector-store changes, written in the same transaction as the Persona change
+    and drained by ``manage.py drain_vector_outbox``.
+    """
 
+    class Op(models.TextChoices):
+        UPSERT = "upsert", "Upsert"
+        DELETE = "delete", "Delete"
+
+    # Not a ForeignKey: delete entries outlive the persona they refer to.
+    persona_id = models.BigIntegerField(db_index=True)
+    op = models.CharField(max_length=6, choices=Op.choices)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.op} persona {self.persona_id}"
+
+
+class IndexVersion(models.Model):
+    """
+    Counter bumped whenever personas or their vectors change. Search caches and the
+    in-memory indexes key on it; it lives in the database so every process sees the same value.
+    """
+
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
@@ -0,0 +1,206 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index.
+
+On-disk layout: each build is written to its own versioned directory under
+the index path and published by atomically replacing the ``CURRENT`` pointer
+file, so readers never see a missing or half-swapped index:
+
+    CURRENT         name of the published build directory
+    v<ns>-<pid>/    one build; every array is a plain ``.npy`` so it can be
+                    opened with ``numpy.load(mmap_mode="r")``
+
+    meta.json       dim, count, nlist, metric
+    centroids.npy   (nlist, dim) float32, L2-normalised
+    offsets.npy     (nlist + 1,) int64, list ``i`` is rows offsets[i]:offsets[i+1]
+    vectors.npy     (count, dim) float32, rows grouped by list
+    ids.npy         (count,) int64 persona ids, same order as vectors.npy
+    hashes.npy      (count,) S64 Persona.embedding_hash of each row when built (optional)
+"""
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .search_backends import normalize_rows, top_k_indices
+
+META_FILE = "meta.json"
+POINTER_FILE = "CURRENT"
+
+
+def resolve_index_path(path) -> Path:
+    """The build directory ``path`` currently points at (``path`` itself for an unversioned index)."""
+    path = Path(path)
+    try:
+        name = (path / POINTER_FILE).read_text().strip()
+    except FileNotFoundError:
+        return path
+    return path / name
+
+
+def train_centroids(matrix, nlist: int, iterations: int = 20, seed: int = 0, max_train: int = 256):
+    """
+    Spherical k-means on (a sample of) the L2-normalised rows of ``matrix``.
+    At most ``max_train * nlist`` rows are used for training.
+    """
+    n = len(matrix)
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, n))
+
+    sample = matrix
+    if n > max_train * nlist:
+        sample = matrix[rng.choice(n, size=max_train * nlist, replace=False)]
+
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists from random rows so no centroid is wasted.
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        centroids = normalize_rows(sums.astype(np.float32))
+    return centroids
+
+
+def assign_lists(matrix, centroids, chunk_size: int = 65536):
+    """Nearest centroid (by cosine) for every row, computed in chunks."""
+    out = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), chunk_size):
+        block = matrix[start:start + chunk_size]
+        out[start:start + chunk_size] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def build_ivf_index(ids, matrix, path, nlist: int = 256, iterations: int = 20, seed: int = 0, hashes=None):
+    """
+    Cluster ``matrix`` into ``nlist`` inverted lists and write the index to ``path``.
+    ``hashes`` (Persona.embedding_hash per row) let readers tell which rows were re-embedded since.
+    The build goes to a new versioned directory under ``path`` and is published by
+    replacing the ``CURRENT`` pointer, so readers resolve either the old build or the
+    new one, never a mix. The previous build is kept for readers still opening it;
+    older ones are removed.
+    :returns: the directory of the new build.
+    """
+    path = Path(path)
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(matrix) == 0:
+        raise ValueError("Cannot build an index from zero vectors.")
+
+    centroids = train_centroids(matrix, nlist, iterations=iterations, seed=seed)
+    assign = assign_lists(matrix, centroids)
+    order = np.argsort(assign, kind="stable")
+    counts = np.bincount(assign, minlength=len(centroids))
+    offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    build_path = path / f"v{time.time_ns()}-{os.getpid()}"
+    build_path.mkdir(parents=True)
+
+    np.save(build_path / "centroids.npy", centroids)
+    np.save(build_path / "offsets.npy", offsets)
+    np.save(build_path / "vectors.npy", matrix[order])
+    np.save(build_path / "ids.npy", ids[order])
+    if hashes is not None:
+        np.save(build_path / "hashes.npy", np.asarray(hashes, dtype="S64")[order])
+    with open(build_path / META_FILE, "w") as f:
+        json.dump({
+            "dim": int(matrix.shape[1]),
+            "count": int(len(matrix)),
+            "nlist": int(len(centroids)),
+            "metric": "cosine",
+        }, f)
+
+    previous = resolve_index_path(path)
+    pointer_tmp = path / f"{POINTER_FILE}.{os.getpid()}.tmp"
+    pointer_tmp.write_text(build_path.name)
+    os.replace(pointer_tmp, path / POINTER_FILE)
+
+    keep = {build_path.name, previous.name}
+    for entry in path.iterdir():
+        if entry.is_dir() and entry.name.startswith("v") and entry.name not in keep:
+            shutil.rmtree(entry, ignore_errors=True)
+    return build_path
+
+
+class IVFIndex:
+    def __init__(self, centroids, offsets, vectors, ids, meta, hashes=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.vectors = vectors
+        self.ids = ids
+        self.meta = meta
+        self.hashes = hashes
+
+    @classmethod
+    def open(cls, path):
+        """Open the build ``path`` points at; the pointer is read once, so every file comes from one build."""
+        path = resolve_index_path(path)
+        with open(path / META_FILE) as f:
+            meta = json.load(f)
+        return cls(
+            centroids=np.load(path / "centroids.npy"),
+            offsets=np.load(path / "offsets.npy"),
+            vectors=np.load(path / "vectors.npy", mmap_mode="r"),
+            ids=np.load(path / "ids.npy", mmap_mode="r"),
+            meta=meta,
+            hashes=np.load(path / "hashes.npy", mmap_mode="r") if (path / "hashes.npy").exists() else None,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, vector, top_k: int = 50, nprobe: int = 8, mask=None):
+        """
+        Score only the rows of the ``nprobe`` lists whose centroids are closest to the query.
+        ``mask`` (bool per stored row) restricts the search to rows passing a filter;
+        nprobe is widened until top_k filtered rows are found or every list was probed.
+        :returns: (ids, scores) arrays, best first.
+        """
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        q = np.asarray(vector, dtype=np.float32).ravel()
+        q_norm = np.linalg.norm(q)
+        if q_norm == 0 or len(self.ids) == 0:
+            return empty
+        q = q / q_norm
+
+        nlist = len(self.centroids)
+        centroid_order = top_k_indices(self.centroids @ q, nlist)
+        nprobe = max(1, min(nprobe, nlist))
+        while True:
+            lists = centroid_order[:nprobe]
+            rows = np.concatenate([
+                np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists
+            ])
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows) >= top_k or nprobe >= nlist:
+                break
+            nprobe = min(nprobe * 2, nlist)
+
+        if len(rows) == 0:
+            return empty
+
+        rows.sort()  # sequential reads through the memory map
+        scores = self.vectors[rows] @ q
+        top = top_k_indices(scores, top_k)
+        return np.asarray(self.ids[rows[top]]), scores[top]
+
+
+def recall_at_k(exact_ids, approx_ids, k: int) -> float:
+    """Mean fraction of the exact top-k that the approximate search also returned."""
+    hits = 0
+    total = 0
+    for exact, approx in zip(exact_ids, approx_ids):
+        exact = set(exact[:k])
+        if not exact:
+            continue
+        hits += len(exact.intersection(approx[:k]))
+        total += len(exact)
+    return hits / total if total else 0.0
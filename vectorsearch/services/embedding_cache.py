@@ -0,0 +1,157 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+from django.conf import settings
+
+from .providers import encoder_version
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    return WHITESPACE_RE.sub(" ", (query or "").strip().lower())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU + TTL cache of query embeddings, keyed by normalised query text and model version.
+
+    The in-process layer is always used. When ``shared_alias`` names an entry in
+    ``settings.CACHES`` (e.g. a file-based or Redis cache), misses fall through to
+    it and new vectors are written to it, so every worker benefits from one encode.
+    """
+
+    def __init__(self, model_version: str, max_entries: int = 2048, ttl: Optional[float] = 3600,
+                 shared_alias: Optional[str] = None):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def key(self, query: str) -> str:
+        digest = hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+        return f"vectorsearch:qemb:{self.model_version}:{digest}"
+
+    @property
+    def shared(self):
+        if not self.shared_alias:
+            return None
+        from django.core.cache import caches
+        return caches[self.shared_alias]
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        key = self.key(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, expires = entry
+                if expires is None or expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+
+        shared = self.shared
+        if shared is not None:
+            raw = shared.get(key)
+            if raw is not None:
+                vector = np.frombuffer(raw, dtype=np.float32)
+                self._store(key, vector)
+                with self._lock:
+                    self.shared_hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, query: str, vector) -> np.ndarray:
+        key = self.key(query)
+        vector = np.array(vector, dtype=np.float32).ravel()
+        vector.flags.writeable = False
+        self._store(key, vector)
+
+        shared = self.shared
+        if shared is not None:
+            shared.set(key, vector.tobytes(), timeout=self.ttl)
+        return vector
+
+    def _store(self, key: str, vector):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (vector, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_encode(self, query: str, encode: Callable) -> np.ndarray:
+        vector = self.get(query)
+        if vector is None:
+            vector = self.set(query, encode(query))
+        return vector
+
+    def get_many_or_encode(self, queries, encode: Callable) -> list:
+        """
+        Vectors for every query. All misses (deduplicated) are encoded together
+        in one ``encode(list_of_texts)`` call.
+        """
+        vectors = [self.get(q) for q in queries]
+        pending = {}
+        for i, (query, vector) in enumerate(zip(queries, vectors)):
+            if vector is None:
+                pending.setdefault(self.key(query), (query, []))[1].append(i)
+        if pending:
+            texts = [query for query, _ in pending.values()]
+            encoded = np.asarray(encode(texts), dtype=np.float32).reshape(len(texts), -1)
+            for (query, positions), vector in zip(pending.values(), encoded):
+                vector = self.set(query, vector)
+                for i in positions:
+                    vectors[i] = vector
+        return vectors
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+_cache: Optional[QueryEmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    """Process-wide cache configured by ``settings.VECTORSEARCH_QUERY_CACHE``."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                conf = getattr(settings, "VECTORSEARCH_QUERY_CACHE", {})
+                _cache = QueryEmbeddingCache(
+                    model_version=encoder_version(),
+                    max_entries=conf.get("MAX_ENTRIES", 2048),
+                    ttl=conf.get("TTL", 3600),
+                    shared_alias=conf.get("SHARED"),
+                )
+    return _cache
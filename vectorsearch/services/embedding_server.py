@@ -0,0 +1,350 @@
+"""
+Local embedding service shared by every worker process.
+
+``manage.py run_embedding_server`` holds the only copy of the encoder weights
+and listens on a Unix socket. Requests arriving within ``window_ms`` of each
+other are merged into one ``encode`` call (micro-batching). Each reply
+carries the name of a ``multiprocessing.shared_memory`` block holding the
+float32 vectors. The server owns every block it hands out: the client copies
+the vectors out before it sends anything else, so a block is unlinked as soon
+as the next request arrives on its connection or the connection closes, and
+any block still outstanding after ``shm_ttl`` seconds (a hung client) is
+unlinked regardless.
+
+Wire format: every message is a 4-byte big-endian length followed by a JSON body.
+    request:  {"op": "encode", "model": "...", "texts": ["...", ...]}
+              {"op": "info"}
+    response: {"shm": "<name>", "shape": [n, dim], "dtype": "float32"}
+              {"model": "...", "dim": 384}
+              {"error": "..."}
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">I")
+
+
+class EmbeddingServerError(Exception):
+    pass
+
+
+def send_message(sock, payload: dict):
+    body = json.dumps(payload).encode("utf-8")
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def recv_message(sock) -> dict:
+    header = _recv_exact(sock, HEADER.size)
+    (length,) = HEADER.unpack(header)
+    return json.loads(_recv_exact(sock, length).decode("utf-8"))
+
+
+def _recv_exact(sock, n: int) -> bytes:
+    chunks = []
+    while n:
+        chunk = sock.recv(n)
+        if not chunk:
+            raise ConnectionError("embedding server connection closed")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+class MicroBatcher:
+    """
+    Collects concurrent encode requests and runs them as one batch.
+    A batch closes when ``window_ms`` has passed since its first request or it holds ``max_batch`` texts.
+    """
+
+    def __init__(self, encoder, max_batch: int = 64, window_ms: float = 5.0):
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._stopped = threading.Event()
+        self.batches = 0
+        self.requests = 0
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts) -> Future:
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future
+
+    def stop(self):
+        self._stopped.set()
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            size = len(item[0])
+            deadline = time.monotonic() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._stopped.set()
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._encode(batch)
+
+    def _encode(self, batch):
+        texts = [t for texts, _ in batch for t in texts]
+        try:
+            vectors = np.asarray(
+                self.encoder.encode(texts, batch_size=self.max_batch), dtype=np.float32
+            ).reshape(len(texts), -1)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.requests += len(batch)
+        start = 0
+        for texts_, future in batch:
+            future.set_result(vectors[start:start + len(texts_)])
+            start += len(texts_)
+
+
+def _to_shared_memory(array: np.ndarray) -> shared_memory.SharedMemory:
+    """Copy ``array`` into a new shared-memory block owned by this process (closed, not yet unlinked)."""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    try:
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    finally:
+        shm.close()
+    return shm
+
+
+def _unlink(shm: shared_memory.SharedMemory):
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _from_shared_memory(name: str, shape, dtype: str) -> np.ndarray:
+    shm = shared_memory.SharedMemory(name=name)
+    # Attaching registers the block with this process's resource tracker, but the server unlinks it.
+    resource_tracker.unregister(shm._name, "shared_memory")
+    try:
+        return np.ndarray(tuple(shape), dtype=dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+
+
+class SharedBlocks:
+    """Shared-memory blocks handed out to clients, unlinked when released or ``ttl`` seconds later."""
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._blocks)
+
+    def create(self, array: np.ndarray) -> str:
+        shm = _to_shared_memory(array)
+        with self._lock:
+            self._blocks[shm.name] = (shm, time.monotonic())
+        return shm.name
+
+    def release(self, name: str):
+        with self._lock:
+            entry = self._blocks.pop(name, None)
+        if entry is not None:
+            _unlink(entry[0])
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Unlink blocks handed out more than ``ttl`` seconds ago. :returns: number unlinked"""
+        cutoff = (time.monotonic() if now is None else now) - self.ttl
+        with self._lock:
+            expired = [name for name, (_, created) in self._blocks.items() if created < cutoff]
+            entries = [self._blocks.pop(name) for name in expired]
+        for shm, _ in entries:
+            _unlink(shm)
+        return len(entries)
+
+    def release_all(self):
+        with self._lock:
+            entries, self._blocks = list(self._blocks.values()), {}
+        for shm, _ in entries:
+            _unlink(shm)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        handed_out = None
+        try:
+            while True:
+                try:
+                    message = recv_message(self.request)
+                except (ConnectionError, OSError):
+                    return
+                # The client copies the vectors out before sending anything else: the block is free.
+                if handed_out:
+                    server.blocks.release(handed_out)
+                    handed_out = None
+                try:
+                    response = server.dispatch(message)
+                except Exception as e:
+                    logger.exception("embedding request failed")
+                    response = {"error": str(e)}
+                handed_out = response.get("shm")
+                send_message(self.request, response)
+        finally:
+            if handed_out:
+                server.blocks.release(handed_out)
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, encoder, model_name: str, max_batch: int = 64, window_ms: float = 5.0,
+                 shm_ttl: float = 60.0):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.dim = encoder.get_sentence_embedding_dimension()
+        self.batcher = MicroBatcher(encoder, max_batch=max_batch, window_ms=window_ms)
+        self.blocks = SharedBlocks(ttl=shm_ttl)
+        self._stopped = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep, name="embedding-shm-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep(self):
+        while not self._stopped.wait(max(self.blocks.ttl / 2, 0.1)):
+            expired = self.blocks.expire()
+            if expired:
+                logger.warning("Unlinked %s shared-memory blocks no client released", expired)
+
+    def dispatch(self, message: dict) -> dict:
+        op = message.get("op", "encode")
+        if op == "info":
+            return {"model": self.model_name, "dim": self.dim}
+        if op != "encode":
+            return {"error": f"unknown op {op!r}"}
+        model = message.get("model")
+        if model and model != self.model_name:
+            return {"error": f"server encodes with {self.model_name!r}, not {model!r}"}
+
+        texts = message.get("texts") or []
+        if texts:
+            vectors = self.batcher.submit(texts).result()
+        else:
+            vectors = np.zeros((0, self.dim), dtype=np.float32)
+        return {"shm": self.blocks.create(vectors), "shape": list(vectors.shape), "dtype": "float32"}
+
+    def server_close(self):
+        self._stopped.set()
+        self.batcher.stop()
+        super().server_close()
+        self.blocks.release_all()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class RemoteEncoder:
+    """
+    Drop-in for ``SentenceTransformer.encode`` that asks the embedding server.
+    Each thread keeps one connection open. If the server cannot be reached and
+    ``fallback`` is given, it is called to obtain a local encoder instead.
+    """
+
+    def __init__(self, socket_path: str, model_name: str, timeout: float = 30.0, fallback=None):
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.timeout = timeout
+        self.fallback = fallback
+        self._local = threading.local()
+        self._dim = None
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _request(self, message: dict) -> dict:
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                send_message(sock, message)
+                response = recv_message(sock)
+                break
+            except (ConnectionError, OSError):
+                self._drop_connection()
+                if attempt:
+                    raise
+        if "error" in response:
+            raise EmbeddingServerError(response["error"])
+        return response
+
+    def _drop_connection(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._dim is None:
+            try:
+                self._dim = self._request({"op": "info"})["dim"]
+            except (ConnectionError, OSError):
+                if self.fallback is None:
+                    raise
+                self._dim = self.fallback().get_sentence_embedding_dimension()
+        return self._dim
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        try:
+            response = self._request({"op": "encode", "model": self.model_name, "texts": texts})
+        except (ConnectionError, OSError):
+            if self.fallback is None:
+                raise
+            logger.warning("embedding server at %s unreachable; encoding in-process", self.socket_path)
+            return self.fallback().encode(sentences, batch_size=batch_size, **kwargs)
+
+        vectors = _from_shared_memory(response["shm"], response["shape"], response["dtype"])
+        return vectors[0] if single else vectors
@@ -0,0 +1,205 @@
+"""
+Structured persona filters shared by every search path.
+
+Filters are a plain dict with any of:
+    smoker (bool), gender (str), location (str), age_min (int), age_max (int)
+String filters match case-insensitively.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+from ..models import Persona
+
+EQUALITY_FIELDS = ("smoker", "gender", "location")
+FILTER_KEYS = EQUALITY_FIELDS + ("age_min", "age_max")
+
+
+def _parse_bool(value):
+    value = str(value).strip().lower()
+    if value in ("true", "1", "yes"):
+        return True
+    if value in ("false", "0", "no"):
+        return False
+    return None
+
+
+def _parse_int(value):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_filters(params) -> Dict:
+    """Build a filter dict from request parameters (``request.GET`` or a JSON dict); blanks are ignored."""
+    filters = {}
+    smoker = params.get("smoker")
+    if smoker not in (None, ""):
+        if isinstance(smoker, bool):
+            filters["smoker"] = smoker
+        elif _parse_bool(smoker) is not None:
+            filters["smoker"] = _parse_bool(smoker)
+
+    for field in ("gender", "location"):
+        value = params.get(field)
+        if value and str(value).strip():
+            filters[field] = str(value).strip()
+
+    for field in ("age_min", "age_max"):
+        value = params.get(field)
+        if value not in (None, "") and _parse_int(value) is not None:
+            filters[field] = _parse_int(value)
+    return filters
+
+
+def to_orm(filters: Dict) -> Dict:
+    lookups = {}
+    if "smoker" in filters:
+        lookups["smoker"] = filters["smoker"]
+    if "gender" in filters:
+        lookups["gender__iexact"] = filters["gender"]
+    if "location" in filters:
+        lookups["location__iexact"] = filters["location"]
+    if "age_min" in filters:
+        lookups["age__gte"] = filters["age_min"]
+    if "age_max" in filters:
+        lookups["age__lte"] = filters["age_max"]
+    return lookups
+
+
+def matches(persona, filters: Dict) -> bool:
+    """Evaluate ``filters`` against a loaded persona (same semantics as ``to_orm``)."""
+    if "smoker" in filters and bool(persona.smoker) != filters["smoker"]:
+        return False
+    for field in ("gender", "location"):
+        if field in filters and (getattr(persona, field) or "").strip().lower() != filters[field].strip().lower():
+            return False
+    if "age_min" in filters and (persona.age is None or persona.age < filters["age_min"]):
+        return False
+    if "age_max" in filters and (persona.age is None or persona.age > filters["age_max"]):
+        return False
+    return True
+
+
+def to_pinecone(filters: Dict) -> Optional[Dict]:
+    """
+    Pinecone metadata filter. String metadata is upserted lower-cased by
+    generate_embeddings (see ``pinecone_metadata``), so values are lower-cased here too.
+    """
+    clauses = {}
+    if "smoker" in filters:
+        clauses["smoker"] = {"$eq": bool(filters["smoker"])}
+    if "gender" in filters:
+        clauses["gender"] = {"$eq": filters["gender"].lower()}
+    if "location" in filters:
+        clauses["location"] = {"$eq": filters["location"].lower()}
+    age = {}
+    if "age_min" in filters:
+        age["$gte"] = filters["age_min"]
+    if "age_max" in filters:
+        age["$lte"] = filters["age_max"]
+    if age:
+        clauses["age"] = age
+    return clauses or None
+
+
+def pinecone_metadata(persona) -> Dict:
+    return {
+        "name": persona.name,
+        "job_role": persona.job_role,
+        "gender": (persona.gender or "").lower(),
+        "location": (persona.location or "").lower(),
+        "smoker": bool(persona.smoker),
+        "age": persona.age,
+    }
+
+
+class FilterColumns:
+    """
+    Per-row filter attributes aligned with a vector matrix.
+    gender and location are stored as int32 codes into a per-column vocabulary
+    (one small array each, whatever the number of distinct values), so a filter
+    is a few comparisons and boolean ANDs over arrays.
+    """
+
+    def __init__(self, smoker, age, gender, location):
+        self.smoker = np.asarray(smoker, dtype=bool)
+        self.age = np.asarray(age, dtype=np.int32)
+        self._codes = {
+            "gender": self._encode(gender),
+            "location": self._encode(location),
+        }
+
+    @staticmethod
+    def _encode(values):
+        """:returns: ({lower-cased value: code}, int32 code per row)"""
+        values = np.asarray([(v or "").strip().lower() for v in values], dtype=object)
+        if len(values) == 0:
+            return {}, np.zeros(0, dtype=np.int32)
+        vocab, codes = np.unique(values, return_inverse=True)
+        return {v: i for i, v in enumerate(vocab)}, codes.astype(np.int32).ravel()
+
+    def __len__(self):
+        return len(self.age)
+
+    # Up to this many ids are looked up with id__in (in chunks); larger sets scan the table once.
+    ID_LOOKUP_MAX = 20000
+    ID_LOOKUP_CHUNK = 500
+
+    @classmethod
+    def _rows(cls, ids):
+        qs = Persona.objects.values_list("id", "smoker", "age", "gender", "location")
+        if len(ids) > cls.ID_LOOKUP_MAX:
+            return list(qs.iterator(chunk_size=5000))
+        wanted = ids.tolist()
+        rows = []
+        for start in range(0, len(wanted), cls.ID_LOOKUP_CHUNK):
+            rows.extend(qs.filter(id__in=wanted[start:start + cls.ID_LOOKUP_CHUNK]))
+        return rows
+
+    @classmethod
+    def for_ids(cls, ids) -> "FilterColumns":
+        """Load filter attributes from the Persona table, in the order of ``ids``."""
+        ids = np.asarray(ids, dtype=np.int64)
+        n = len(ids)
+        smoker = np.zeros(n, dtype=bool)
+        age = np.zeros(n, dtype=np.int32)
+        gender = np.full(n, "", dtype=object)
+        location = np.full(n, "", dtype=object)
+
+        rows = cls._rows(ids) if n else []
+        if n and rows:
+            pks, sm, ag, ge, lo = (np.asarray(col, dtype=object) for col in zip(*rows))
+            pks = pks.astype(np.int64)
+            order = np.argsort(ids)
+            pos = np.clip(np.searchsorted(ids[order], pks), 0, n - 1)
+            found = ids[order][pos] == pks
+            target = order[pos[found]]
+            smoker[target] = sm[found].astype(bool)
+            age[target] = ag[found].astype(np.int32)
+            gender[target] = ge[found]
+            location[target] = lo[found]
+        return cls(smoker, age, gender, location)
+
+    def mask(self, filters: Dict) -> Optional[np.ndarray]:
+        """Boolean row mask for ``filters``; None when nothing is filtered."""
+        mask = None
+        if "smoker" in filters:
+            mask = self.smoker.copy() if filters["smoker"] else ~self.smoker
+        for field in ("gender", "location"):
+            if field not in filters:
+                continue
+            vocab, codes = self._codes[field]
+            code = vocab.get(str(filters[field]).strip().lower())
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            m = codes == code
+            mask = m if mask is None else mask & m
+        if "age_min" in filters:
+            m = self.age >= filters["age_min"]
+            mask = m if mask is None else mask & m
+        if "age_max" in filters:
+            m = self.age <= filters["age_max"]
+            mask = m if mask is None else mask & m
+        return mask
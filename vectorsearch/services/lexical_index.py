@@ -0,0 +1,210 @@
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from ..models import Persona
+from .search_backends import VersionedLoader
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#.\-]*[a-z0-9+#]|[a-z0-9]")
+LEXICAL_FIELDS = ("bio", "job_role", "hobbies", "location")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def persona_document(bio, job_role, hobbies, location) -> str:
+    if isinstance(hobbies, (list, tuple)):
+        hobbies = " ".join(str(h) for h in hobbies)
+    return " ".join(str(part) for part in (bio, job_role, hobbies or "", location) if part)
+
+
+def document_of(persona: Persona) -> str:
+    return persona_document(*(getattr(persona, f) for f in LEXICAL_FIELDS))
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring.
+    Postings are ``term -> {doc_id: term frequency}``; documents can be added,
+    replaced and removed one at a time so the index follows Persona edits.
+    Searches score from per-term arrays (doc ids, term frequencies, document
+    lengths), built on first use and dropped whenever the term's postings change.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.version = None  # index version of the Persona table this index reflects
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_terms: Dict[int, Dict[str, int]] = {}
+        self.doc_len: Dict[int, int] = {}
+        self.total_len = 0
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, doc_id: int, text: str):
+        terms: Dict[str, int] = defaultdict(int)
+        tokens = tokenize(text)
+        for tok in tokens:
+            terms[tok] += 1
+
+        with self._lock:
+            self._remove(doc_id)
+            for tok, tf in terms.items():
+                self.postings[tok][doc_id] = tf
+                self._arrays.pop(tok, None)
+            self.doc_terms[doc_id] = dict(terms)
+            self.doc_len[doc_id] = len(tokens)
+            self.total_len += len(tokens)
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: int):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for tok in terms:
+            self._arrays.pop(tok, None)
+            posting = self.postings.get(tok)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[tok]
+        self.total_len -= self.doc_len.pop(doc_id, 0)
+
+    def search(self, query: str, top_k: int = 50, candidates: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """
+        :param candidates: optional doc ids the results are restricted to, ideally as the sorted
+            int64 array ``SearchBackend.matching_ids`` returns; hits are checked against it by binary search.
+        :returns: [(doc_id, bm25 score), ...] best first.
+        """
+        terms = set(tokenize(query))
+        if not terms or top_k <= 0:
+            return []
+        if candidates is not None and not isinstance(candidates, np.ndarray):
+            candidates = np.unique(np.fromiter(candidates, dtype=np.int64))
+
+        with self._lock:
+            n = len(self.doc_len)
+            if n == 0:
+                return []
+            avgdl = self.total_len / n
+            k1, b = self.k1, self.b
+            doc_ids, parts = [], []
+            for tok in terms:
+                arrays = self._term_arrays(tok)
+                if arrays is None:
+                    continue
+                ids, tf, dl = arrays
+                idf = math.log(1.0 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+                doc_ids.append(ids)
+                parts.append(idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)))
+        if not doc_ids:
+            return []
+
+        # Sum each document's per-term scores.
+        doc_ids, inverse = np.unique(np.concatenate(doc_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(parts), minlength=len(doc_ids))
+        if candidates is not None:
+            pos = np.clip(np.searchsorted(candidates, doc_ids), 0, max(len(candidates) - 1, 0))
+            allowed = candidates[pos] == doc_ids if len(candidates) else np.zeros(len(doc_ids), dtype=bool)
+            doc_ids, scores = doc_ids[allowed], scores[allowed]
+        k = min(top_k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return list(zip(doc_ids[top].tolist(), scores[top].tolist()))
+
+    def _term_arrays(self, tok: str):
+        """(doc ids, term frequencies, document lengths) of one term's postings; call with the lock held."""
+        arrays = self._arrays.get(tok)
+        if arrays is None:
+            posting = self.postings.get(tok)
+            if not posting:
+                return None
+            ids = np.fromiter(posting.keys(), dtype=np.int64, count=len(posting))
+            tf = np.fromiter(posting.values(), dtype=np.float64, count=len(posting))
+            dl = np.fromiter((self.doc_len[d] for d in posting), dtype=np.float64, count=len(posting))
+            arrays = self._arrays[tok] = (ids, tf, dl)
+        return arrays
+
+    @classmethod
+    def from_personas(cls, queryset=None) -> "BM25Index":
+        index = cls()
+        qs = queryset if queryset is not None else Persona.objects.all()
+        for pk, *fields in qs.values_list("id", *LEXICAL_FIELDS).iterator(chunk_size=2000):
+            index.add(pk, persona_document(*fields))
+        return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60, weights: Optional[List[float]] = None):
+    """
+    Fuse several ranked id lists: score(id) = sum(weight / (k + rank)).
+    :returns: [(id, fused score), ...] best first.
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] += weight / (k + rank)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def _build(version: int) -> BM25Index:
+    index = BM25Index.from_personas()
+    index.version = version
+    return index
+
+
+_loader = VersionedLoader(_build)
+
+
+def get_lexical_index() -> BM25Index:
+    """
+    Process-wide BM25 index over every persona. It is rebuilt when the index version
+    moved on without this process applying the change (bulk loads, edits in other
+    processes, outbox drains); like the vector backends (``VersionedLoader``) the rebuild
+    runs in a background thread while searches keep using the previous index.
+    """
+    return _loader.get()
+
+
+def reset():
+    """Drop the loaded index (used when settings change, e.g. in tests)."""
+    global _loader
+    _loader = VersionedLoader(_build)
+
+
+def apply_change(version: int, doc_id: int, document: Optional[str] = None, deleted: bool = False):
+    """
+    Apply one committed Persona change, whose bump made the index version ``version``,
+    to the loaded index. If the index missed an earlier change it is left for
+    ``get_lexical_index`` to rebuild.
+    """
+    index = _loader.current
+    if index is None:
+        return
+    with index._lock:
+        if index.version != version - 1:
+            return
+        if deleted:
+            index.remove(doc_id)
+        elif document is not None:
+            index.add(doc_id, document)
+        index.version = version
+
+
+def hybrid_enabled() -> bool:
+    return getattr(settings, "VECTORSEARCH_HYBRID", True)
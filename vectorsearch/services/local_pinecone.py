@@ -0,0 +1,143 @@
+"""
+File-backed stand-in for a Pinecone index, for offline development and tests.
+
+Set settings.PINECONE_LOCAL_PATH to a directory and ``providers.get_pinecone_index``
+returns a ``LocalPineconeIndex`` stored in ``<dir>/<index name>.json``. It
+implements the subset of the Pinecone ``Index`` API this project uses
+(upsert, delete, fetch, query, list, describe_index_stats) with the same
+argument names and dict-shaped responses. Each write rewrites the file
+atomically, so it is meant for thousands of vectors, not millions.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_NAMESPACE = ""
+
+
+def _matches_filter(metadata: dict, flt: dict) -> bool:
+    for field, condition in flt.items():
+        value = metadata.get(field)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if op == "$eq" and value != expected:
+                return False
+            if op == "$ne" and value == expected:
+                return False
+            if op == "$in" and value not in expected:
+                return False
+            if op == "$nin" and value in expected:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > expected:
+                    return False
+                if op == "$gte" and not value >= expected:
+                    return False
+                if op == "$lt" and not value < expected:
+                    return False
+                if op == "$lte" and not value <= expected:
+                    return False
+    return True
+
+
+class LocalPineconeIndex:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._namespaces = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self._namespaces = json.load(f)
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._namespaces, f)
+        os.replace(tmp, self.path)
+
+    def _ns(self, namespace) -> dict:
+        return self._namespaces.setdefault(namespace or DEFAULT_NAMESPACE, {})
+
+    def upsert(self, vectors, namespace=None, **kwargs):
+        with self._lock:
+            ns = self._ns(namespace)
+            for v in vectors:
+                if isinstance(v, dict):
+                    vid, values, metadata = v["id"], v["values"], v.get("metadata") or {}
+                else:
+                    vid, values, metadata = v[0], v[1], (v[2] if len(v) > 2 else {})
+                ns[str(vid)] = {"values": [float(x) for x in values], "metadata": dict(metadata)}
+            self._save()
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, delete_all=False, namespace=None, **kwargs):
+        with self._lock:
+            ns = self._ns(namespace)
+            if delete_all:
+                ns.clear()
+            else:
+                for vid in ids or []:
+                    ns.pop(str(vid), None)
+            self._save()
+        return {}
+
+    def fetch(self, ids, namespace=None, **kwargs):
+        with self._lock:
+            ns = self._ns(namespace)
+            return {
+                "namespace": namespace or DEFAULT_NAMESPACE,
+                "vectors": {
+                    vid: {"id": vid, "values": ns[vid]["values"], "metadata": ns[vid]["metadata"]}
+                    for vid in map(str, ids) if vid in ns
+                },
+            }
+
+    def list(self, prefix=None, limit=100, namespace=None, **kwargs):
+        """Yield pages of ids, like ``Index.list`` on serverless indexes."""
+        with self._lock:
+            ids = sorted(vid for vid in self._ns(namespace) if not prefix or vid.startswith(prefix))
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def query(self, vector=None, top_k=10, filter=None, namespace=None,
+              include_values=False, include_metadata=False, id=None, **kwargs):
+        with self._lock:
+            ns = self._ns(namespace)
+            if vector is None and id is not None:
+                vector = ns.get(str(id), {}).get("values")
+            items = [(vid, v) for vid, v in ns.items() if not filter or _matches_filter(v["metadata"], filter)]
+        if vector is None or not items:
+            return {"matches": [], "namespace": namespace or DEFAULT_NAMESPACE}
+
+        q = np.asarray(vector, dtype=np.float32)
+        matrix = np.asarray([v["values"] for _, v in items], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(q) or 1.0)
+        scores = matrix @ q / np.where(norms == 0, 1.0, norms)
+        order = np.argsort(-scores)[:top_k]
+
+        matches = []
+        for i in order:
+            vid, v = items[i]
+            match = {"id": vid, "score": float(scores[i])}
+            if include_values:
+                match["values"] = v["values"]
+            if include_metadata:
+                match["metadata"] = v["metadata"]
+            matches.append(match)
+        return {"matches": matches, "namespace": namespace or DEFAULT_NAMESPACE}
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            dims = {len(v["values"]) for ns in self._namespaces.values() for v in ns.values()}
+            return {
+                "dimension": dims.pop() if len(dims) == 1 else None,
+                "total_vector_count": sum(len(ns) for ns in self._namespaces.values()),
+                "namespaces": {name: {"vector_count": len(ns)} for name, ns in self._namespaces.items()},
+            }
@@ -0,0 +1,110 @@
+"""
+Transactional outbox keeping the vector store in sync with the Persona table.
+
+Persona signals (and the bulk loader) add a VectorOutbox row in the same
+transaction as the change (Persona.save/delete wrap both in one atomic
+block), so a committed edit can never be lost. ``drain``
+takes the oldest entries, keeps only the last operation per persona,
+re-embeds every changed bio in one encoder call, upserts and deletes the
+vectors in bulk, stores the new embeddings, and only then removes the entries
+it handled. A failed drain leaves them in place, so the next one retries.
+
+Run a single drainer at a time (``manage.py drain_vector_outbox --loop``).
+Queueing is off unless settings.VECTORSEARCH_OUTBOX is set: nothing but the
+drainer empties the table. Each drain bumps the index version, which makes
+the local/IVF backends and the BM25 index reload.
+"""
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from ..models import Persona, VectorOutbox
+from .filters import pinecone_metadata
+
+# Persona fields that reach the vector store: the embedded text and the Pinecone metadata.
+SYNCED_FIELDS = ("bio", "name", "job_role", "gender", "location", "smoker", "age")
+EMBEDDING_FIELDS = ("embedding", "embedding_hash", "embedding_model", "embedding_dim")
+
+
+def outbox_enabled() -> bool:
+    return getattr(settings, "VECTORSEARCH_OUTBOX", False)
+
+
+def enqueue(persona_ids: Iterable[int], op: str = VectorOutbox.Op.UPSERT):
+    VectorOutbox.objects.bulk_create([VectorOutbox(persona_id=pk, op=op) for pk in persona_ids if pk is not None])
+
+
+def pending_count() -> int:
+    return VectorOutbox.objects.count()
+
+
+def drain(encoder, model_name: str, index=None, batch_size: int = 500, upsert_batch_size: int = 100,
+          namespace: Optional[str] = None) -> dict:
+    """
+    Process up to ``batch_size`` outbox entries.
+    ``model_name`` is the encoder version recorded in Persona.embedding_model;
+    ``index`` is the Pinecone index to write to (None keeps only the database in sync).
+    :returns: {"entries": n, "upserted": n, "embedded": n, "deleted": n}
+    """
+    entries = list(VectorOutbox.objects.order_by("id")[:batch_size])
+    if not entries:
+        return {"entries": 0, "upserted": 0, "embedded": 0, "deleted": 0}
+
+    # Coalesce: the newest operation per persona wins.
+    latest = {}
+    for entry in entries:
+        latest[entry.persona_id] = entry.op
+
+    stats = sync_vectors(
+        encoder, model_name, index,
+        upsert_ids=[pk for pk, op in latest.items() if op == VectorOutbox.Op.UPSERT],
+        delete_ids=[pk for pk, op in latest.items() if op == VectorOutbox.Op.DELETE],
+        upsert_batch_size=upsert_batch_size,
+        namespace=namespace,
+        on_commit=lambda: VectorOutbox.objects.filter(id__in=[e.id for e in entries]).delete(),
+    )
+    return {"entries": len(entries), **stats}
+
+
+def sync_vectors(encoder, model_name: str, index, upsert_ids, delete_ids, upsert_batch_size: int = 100,
+                 namespace: Optional[str] = None, on_commit=None) -> dict:
+    """
+    Write ``upsert_ids`` to the vector store (re-embedding stale ones) and delete ``delete_ids``.
+    Upsert ids whose persona no longer exists are deleted too. The new embeddings are
+    stored, together with ``on_commit()``, only after the vector store accepted the writes.
+    :returns: {"upserted": n, "embedded": n, "deleted": n}
+    """
+    personas = list(Persona.objects.filter(id__in=list(upsert_ids)))
+    found = {p.id for p in personas}
+    delete_ids = list(delete_ids) + [pk for pk in upsert_ids if pk not in found]
+
+    # Re-embed only personas whose text (or the model) changed; metadata-only edits reuse the stored vector.
+    dim = encoder.get_sentence_embedding_dimension()
+    stale = [p for p in personas if p.embedding is None or len(p.embedding) == 0 or not p.embedding_is_current(model_name, dim)]
+    if stale:
+        vectors = encoder.encode([p.embedding_text() for p in stale], batch_size=len(stale))
+        for persona, vector in zip(stale, vectors):
+            persona.embedding = vector
+            persona.embedding_hash = persona.content_hash()
+            persona.embedding_model = model_name
+            persona.embedding_dim = dim
+
+    if index is not None:
+        kwargs = {"namespace": namespace} if namespace else {}
+        items = [
+            (str(p.id), p.embedding.tolist(), {**pinecone_metadata(p), "content_hash": p.embedding_hash})
+            for p in personas
+        ]
+        for start in range(0, len(items), upsert_batch_size):
+            index.upsert(vectors=items[start:start + upsert_batch_size], **kwargs)
+        for start in range(0, len(delete_ids), 1000):
+            index.delete(ids=[str(pk) for pk in delete_ids[start:start + 1000]], **kwargs)
+
+    with transaction.atomic():
+        if stale:
+            Persona.objects.bulk_update(stale, list(EMBEDDING_FIELDS), batch_size=500)
+        if on_commit is not None:
+            on_commit()
+
+    return {"upserted": len(personas), "embedded": len(stale), "deleted": len(delete_ids)}
@@ -0,0 +1,128 @@
+"""
+In-process cache of persona "cards": the few fields search results display.
+
+Cards are read with ``values_list`` over CARD_FIELDS only, so hydrating
+results never loads (or decodes) ``Persona.embedding``. A change made in this
+process drops only its card (``apply_change``, from the Persona signals); the
+whole cache is cleared only when the shared index version moves past what this
+process applied (another worker or a bulk command changed personas).
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from django.conf import settings
+
+from ..models import Persona
+from .result_cache import get_index_version
+
+CARD_FIELDS = ("id", "name", "bio", "job_role", "location", "gender", "age", "smoker", "hobbies")
+
+
+def normalize_hobbies(h) -> List[str]:
+    if isinstance(h, list):
+        return h
+    if isinstance(h, str):
+        parts = [p.strip() for p in h.split(",") if p.strip()]
+        return parts if parts else [h]
+    return []
+
+
+class PersonaCard(NamedTuple):
+    id: int
+    name: str
+    bio: str
+    job_role: str
+    location: str
+    gender: str
+    age: Optional[int]
+    smoker: Optional[bool]
+    hobbies: List[str]
+
+    @classmethod
+    def from_row(cls, row) -> "PersonaCard":
+        *fields, hobbies = row
+        return cls(*fields, normalize_hobbies(hobbies))
+
+
+class PersonaCardCache:
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._cards: "OrderedDict[int, PersonaCard]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, PersonaCard]:
+        """Cards for ``ids`` (missing personas are left out); misses are loaded with one query."""
+        ids = set(ids)
+        self._check_version()
+        found = {}
+        with self._lock:
+            for pk in ids:
+                card = self._cards.get(pk)
+                if card is not None:
+                    self._cards.move_to_end(pk)
+                    found[pk] = card
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+
+        missing = ids - found.keys()
+        if missing:
+            rows = Persona.objects.filter(id__in=missing).values_list(*CARD_FIELDS)
+            loaded = {card.id: card for card in map(PersonaCard.from_row, rows)}
+            found.update(loaded)
+            with self._lock:
+                self._cards.update(loaded)
+                while len(self._cards) > self.max_entries:
+                    self._cards.popitem(last=False)
+        return found
+
+    def _check_version(self):
+        version = get_index_version()
+        if version != self._version:
+            with self._lock:
+                self._cards.clear()
+                self._version = version
+
+    def apply_change(self, version: int, pk: int):
+        """
+        Drop the card of a committed change whose bump made the index version ``version``.
+        If the cache is current up to the previous version it stays current, so the
+        change does not clear every other card.
+        """
+        with self._lock:
+            self._cards.pop(pk, None)
+            if self._version == version - 1:
+                self._version = version
+
+    def clear(self):
+        with self._lock:
+            self._cards.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._cards),
+                "max_entries": self.max_entries,
+            }
+
+
+_cache: Optional[PersonaCardCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_card_cache() -> PersonaCardCache:
+    """Process-wide card cache sized by ``settings.VECTORSEARCH_CARD_CACHE``."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                conf = getattr(settings, "VECTORSEARCH_CARD_CACHE", {})
+                _cache = PersonaCardCache(max_entries=conf.get("MAX_ENTRIES", 50000))
+    return _cache
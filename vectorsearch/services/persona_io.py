@@ -0,0 +1,117 @@
+import json
+
+READ_SIZE = 1 << 16
+
+
+def iter_records(path, fmt: str = "auto"):
+    """
+    Yield persona dicts from ``path`` without loading the whole file.
+
+    ``fmt`` is "ndjson" (one JSON object per line), "json" (a top-level array,
+    parsed element by element) or "auto" (array if the file starts with "[").
+    """
+    with open(path, encoding="utf-8") as f:
+        if fmt == "auto":
+            fmt = "json" if _first_char(f) == "[" else "ndjson"
+            f.seek(0)
+
+        if fmt == "ndjson":
+            for lineno, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{lineno}: invalid JSON: {e}") from e
+        elif fmt == "json":
+            yield from _iter_json_array(f)
+        else:
+            raise ValueError(f"Unknown format {fmt!r}; expected 'auto', 'json' or 'ndjson'.")
+
+
+def _first_char(f):
+    while True:
+        chunk = f.read(READ_SIZE)
+        if not chunk:
+            return ""
+        stripped = chunk.lstrip()
+        if stripped:
+            return stripped[0]
+
+
+def _delimited(buf, end):
+    """True if the value ending at ``end`` is followed by ',' or ']' within ``buf``."""
+    rest = buf[end:].lstrip()
+    return bool(rest) and rest[0] in ",]"
+
+
+def _iter_json_array(f):
+    """Incrementally decode the elements of a top-level JSON array."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(READ_SIZE)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    skip_ws()
+    if pos >= len(buf) or buf[pos] != "[":
+        raise ValueError("Expected a JSON array.")
+    pos += 1
+
+    expect_value = True
+    count = 0
+    while True:
+        skip_ws()
+        if pos >= len(buf):
+            raise ValueError("Unexpected end of file inside JSON array.")
+
+        ch = buf[pos]
+        if ch == "]":
+            if expect_value and count:
+                raise ValueError("Trailing ',' in JSON array.")
+            return
+        if ch == ",":
+            if expect_value:
+                raise ValueError("Unexpected ',' in JSON array.")
+            pos += 1
+            expect_value = True
+            continue
+
+        if not expect_value:
+            raise ValueError("Expected ',' or ']' in JSON array.")
+
+        # Decode one element; pull more text until it is complete.
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            if not eof and not _delimited(buf, end):
+                # A scalar (e.g. a number) may continue past the buffer boundary.
+                fill()
+                continue
+            break
+        pos = end
+        expect_value = False
+        count += 1
+        yield value
@@ -0,0 +1,303 @@
+"""
+Persona search pipeline shared by the HTML view and the JSON API.
+
+    encode queries -> vector candidates (fused with BM25 when hybrid search is on)
+    -> hydrate persona cards -> compatibility and insight (services.scoring)
+
+``search_many`` runs a list of queries together: one encoder call for all
+uncached queries, one ``backend.query_batch`` call and one Persona query.
+
+``search_page`` and ``iter_results`` page through a deeper ranking. The ranked
+ids (not the rendered results) are cached per (query, filters, index version),
+so later pages only hydrate their own slice. ``search_page`` ranks only
+DEFAULT_TOP_K deep at first and goes deeper (``depth_tiers``) when a cursor
+reaches the end of what was ranked. Cursors are opaque tokens naming the index
+version the ranking was built from, its depth and the next offset.
+"""
+import base64
+import hashlib
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .embedding_cache import get_query_cache, normalize_query
+from .filters import matches
+from .lexical_index import get_lexical_index, hybrid_enabled, reciprocal_rank_fusion
+from .persona_cards import PersonaCard, get_card_cache
+from .providers import get_encoder
+from .result_cache import get_index_version, result_cache
+from .scoring import get_scoring_engine
+from .search_backends import get_search_backend
+
+DEFAULT_TOP_K = 50
+
+
+class SearchBackendError(Exception):
+    """The vector search backend failed (message names the backend)."""
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def fuse_lexical(backend, query: str, query_embedding, vector_matches: List[dict], filters: Dict, top_k: int):
+    """
+    Candidate ids in final rank order, plus their vector scores.
+    With hybrid search on, BM25 hits are fused in by reciprocal rank fusion and
+    lexical-only hits are scored by the backend where it can.
+    :returns: (candidate_ids, {id: score})
+    """
+    vector_ids = [m.get("id") for m in vector_matches if m.get("id") is not None]
+    scores = {m.get("id"): m.get("score", 0.0) for m in vector_matches}
+    if not hybrid_enabled():
+        return vector_ids, scores
+
+    allowed = backend.matching_ids(filters) if filters else None
+    lexical_ids = [str(pk) for pk, _ in get_lexical_index().search(query, top_k=top_k, candidates=allowed)]
+    if not lexical_ids:
+        return vector_ids, scores
+
+    fused = reciprocal_rank_fusion(
+        [vector_ids, lexical_ids],
+        k=getattr(settings, "VECTORSEARCH_RRF_K", 60),
+        weights=[1.0, getattr(settings, "VECTORSEARCH_LEXICAL_WEIGHT", 1.0)],
+    )
+    missing = [pid for pid in lexical_ids if pid not in scores]
+    if missing:
+        scores.update(backend.score(query_embedding, missing))
+    return [pid for pid, _ in fused], scores
+
+
+def hydrate(candidate_lists: List[List[str]]) -> Dict[str, PersonaCard]:
+    """Cards for every persona named in ``candidate_lists`` ({"42": PersonaCard}); at most one query."""
+    numeric_ids = set()
+    for candidate_ids in candidate_lists:
+        for pid in candidate_ids:
+            try:
+                numeric_ids.add(int(pid))
+            except (TypeError, ValueError):
+                pass
+    if not numeric_ids:
+        return {}
+    return {str(pk): card for pk, card in get_card_cache().get_many(numeric_ids).items()}
+
+
+def build_results(candidate_ids, scores: Dict, personas: Dict[str, PersonaCard], filters: Dict) -> List[dict]:
+    # Candidates are already filtered; this only guards against a stale index.
+    cards = [
+        personas[str(pid)] for pid in candidate_ids
+        if str(pid) in personas and (not filters or matches(personas[str(pid)], filters))
+    ]
+    engine = get_scoring_engine()
+    compatibility, insights = engine.evaluate(cards, [scores.get(str(c.id), 0.0) for c in cards], filters)
+    order = np.argsort(-compatibility, kind="stable") if engine.rank_by_compatibility else range(len(cards))
+    return [
+        {
+            "id": cards[i].id,
+            "name": cards[i].name,
+            "bio": cards[i].bio,
+            "job_role": cards[i].job_role,
+            "location": cards[i].location,
+            "smoker": cards[i].smoker,
+            "hobbies": cards[i].hobbies,
+            "compatibility": f"{compatibility[i]:.2f}%",
+            "insight": insights[i],
+        }
+        for i in order
+    ]
+
+
+def order_by_compatibility(ranking: List[Tuple[str, float]], filters: Dict) -> List[Tuple[str, float]]:
+    """Re-order a whole ranking by compatibility (stable, so ties keep their search order)."""
+    if not ranking:
+        return ranking
+    engine = get_scoring_engine()
+    personas = hydrate([[pid for pid, _ in ranking]])
+    known = [(pid, score) for pid, score in ranking if pid in personas]
+    cards = [personas[pid] for pid, _ in known]
+    compatibility = engine.score(engine.columns(cards), [score for _, score in known], filters)
+    return [known[i] for i in np.argsort(-compatibility, kind="stable")]
+
+
+def search_many(queries: List[dict]) -> List[List[dict]]:
+    """
+    Run several searches together. Each query is ``{"q": str, "filters": dict, "k": int}``
+    (filters already parsed by ``parse_filters``). Returns one result list per query.
+    Raises SearchBackendError if the vector search fails.
+    """
+    results: List[Optional[List[dict]]] = [None] * len(queries)
+    cache_keys = [result_cache.key(q["q"], q["filters"], k=q["k"]) for q in queries]
+    todo = []
+    for i, key in enumerate(cache_keys):
+        results[i] = result_cache.get(key)
+        if results[i] is None:
+            todo.append(i)
+    if not todo:
+        return results
+
+    # 1) Vector search: one encoder call and one backend call for every uncached query
+    backend = get_search_backend()
+    texts = [queries[i]["q"] for i in todo]
+    embeddings = get_query_cache().get_many_or_encode(texts, get_encoder().encode)
+    try:
+        vector_matches = backend.query_batch(
+            embeddings,
+            top_k=[queries[i]["k"] for i in todo],
+            filters=[queries[i]["filters"] for i in todo],
+        )
+    except Exception as e:
+        raise SearchBackendError(f"Vector search error ({backend.name}): {e}") from e
+
+    # 2) Lexical fusion per query
+    ranked = [
+        fuse_lexical(backend, queries[i]["q"], embedding, found, queries[i]["filters"], queries[i]["k"])
+        for i, embedding, found in zip(todo, embeddings, vector_matches)
+    ]
+    ranked = [(candidate_ids[:queries[i]["k"]], scores) for i, (candidate_ids, scores) in zip(todo, ranked)]
+
+    # 3) One Persona query for every candidate, then build each result list
+    personas = hydrate([candidate_ids for candidate_ids, _ in ranked])
+    for i, (candidate_ids, scores) in zip(todo, ranked):
+        results[i] = build_results(candidate_ids, scores, personas, queries[i]["filters"])
+        result_cache.set(cache_keys[i], results[i])
+    return results
+
+
+def search(query: str, filters: Dict, top_k: int = DEFAULT_TOP_K) -> List[dict]:
+    return search_many([{"q": query, "filters": filters, "k": top_k}])[0]
+
+
+def ranking_depth() -> int:
+    return getattr(settings, "VECTORSEARCH_RANKING_DEPTH", 1000)
+
+
+def rank(query: str, filters: Dict, depth: int, version: Optional[int] = None) -> List[Tuple[str, float]]:
+    """
+    Up to ``depth`` (id, score) pairs in final rank order, cached per index version.
+    A ranking requested with an older ``version`` (from a cursor) is served
+    as long as it is still cached, so a client's pages stay consistent; once it
+    has expired, the ranking is recomputed and cached under the current version.
+    """
+    current = get_index_version()
+    if version is None:
+        version = current
+    key = result_cache.key(query, filters, version, depth=depth, ranking=True)
+    ranking = result_cache.get(key)
+    if ranking is not None:
+        return ranking
+    if version != current:
+        key = result_cache.key(query, filters, current, depth=depth, ranking=True)
+        ranking = result_cache.get(key)
+        if ranking is not None:
+            return ranking
+
+    backend = get_search_backend()
+    embedding = get_query_cache().get_or_encode(query, get_encoder().encode)
+    try:
+        found = backend.query(embedding, top_k=depth, filters=filters)
+    except Exception as e:
+        raise SearchBackendError(f"Vector search error ({backend.name}): {e}") from e
+    candidate_ids, scores = fuse_lexical(backend, query, embedding, found, filters, depth)
+    ranking = [(pid, float(scores.get(pid, 0.0))) for pid in candidate_ids[:depth]]
+    if get_scoring_engine().rank_by_compatibility:
+        ranking = order_by_compatibility(ranking, filters)
+    result_cache.set(key, ranking)
+    return ranking
+
+
+def depth_tiers() -> List[int]:
+    """Depths ``search_page`` ranks at: DEFAULT_TOP_K, then four times deeper up to VECTORSEARCH_RANKING_DEPTH."""
+    tiers = [min(DEFAULT_TOP_K, ranking_depth())]
+    while tiers[-1] < ranking_depth():
+        tiers.append(min(tiers[-1] * 4, ranking_depth()))
+    return tiers
+
+
+def rank_paged(query: str, filters: Dict, depth: int, version: int) -> List[Tuple[str, float]]:
+    """
+    ``rank`` for paging: the ranking at the next shallower tier is kept as the prefix and
+    only the hits it lacks are appended, so pages already served stay valid when a cursor
+    makes the ranking deeper.
+    """
+    shallower = [d for d in depth_tiers() if d < depth]
+    if not shallower:
+        return rank(query, filters, depth, version)
+    key = result_cache.key(query, filters, version, depth=depth, ranking=True, paged=True)
+    ranking = result_cache.get(key)
+    if ranking is not None:
+        return ranking
+
+    prefix = rank_paged(query, filters, shallower[-1], version)
+    seen = {pid for pid, _ in prefix}
+    extra = [item for item in rank(query, filters, depth, version) if item[0] not in seen]
+    ranking = prefix + extra[:depth - len(prefix)]
+    result_cache.set(key, ranking)
+    return ranking
+
+
+def _query_digest(query: str, filters: Dict) -> str:
+    payload = json.dumps({"q": normalize_query(query), "filters": filters}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(query: str, filters: Dict, version: int, offset: int, depth: int) -> str:
+    payload = json.dumps({"v": version, "o": offset, "d": depth, "h": _query_digest(query, filters)},
+                         separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, query: str, filters: Dict) -> Tuple[int, int, int]:
+    """:returns: (index version, offset, depth); raises InvalidCursor if it is malformed or for another query."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw.decode("utf-8"))
+        version, offset, digest = int(payload["v"]), int(payload["o"]), payload["h"]
+        depth = int(payload.get("d", ranking_depth()))
+    except (ValueError, TypeError, KeyError, AttributeError, UnicodeDecodeError):
+        raise InvalidCursor("Malformed cursor.")
+    if offset < 0 or depth <= 0 or digest != _query_digest(query, filters):
+        raise InvalidCursor("Cursor does not belong to this query.")
+    return version, offset, depth
+
+
+def _hydrate_window(window, filters: Dict) -> List[dict]:
+    ids = [pid for pid, _ in window]
+    return build_results(ids, dict(window), hydrate([ids]), filters)
+
+
+def search_page(query: str, filters: Dict, cursor: Optional[str] = None,
+                page_size: int = 10) -> Tuple[List[dict], Optional[str]]:
+    """
+    One page of results and the cursor for the next page (None on the last page).
+    The first page ranks DEFAULT_TOP_K deep; later pages reuse the cached ranking and
+    only search deeper once a page reaches the end of a ranking that was cut off at its depth.
+    """
+    if cursor:
+        version, offset, depth = decode_cursor(cursor, query, filters)
+    else:
+        version, offset, depth = get_index_version(), 0, depth_tiers()[0]
+    ranking = rank_paged(query, filters, depth, version)
+    end = offset + page_size
+    deeper = [d for d in depth_tiers() if d > depth]
+    while end >= len(ranking) and len(ranking) >= depth and deeper:
+        depth = deeper.pop(0)
+        ranking = rank_paged(query, filters, depth, version)
+    results = _hydrate_window(ranking[offset:end], filters)
+    next_cursor = encode_cursor(query, filters, version, end, depth) if end < len(ranking) else None
+    return results, next_cursor
+
+
+def iter_results(query: str, filters: Dict, limit: int, chunk_size: int = 200) -> Iterator[dict]:
+    """
+    Yield up to ``limit`` results in rank order, hydrating ``chunk_size`` personas at a time.
+    The ranking is computed before the first item is yielded, so backend errors surface immediately.
+    """
+    ranking = rank(query, filters, limit)
+
+    def generate():
+        for start in range(0, len(ranking), chunk_size):
+            yield from _hydrate_window(ranking[start:start + chunk_size], filters)
+
+    return generate()
@@ -0,0 +1,245 @@
+"""
+Lazily created, process-wide sentence encoder and Pinecone client.
+
+Nothing heavy happens at import time: the SentenceTransformer weights are
+loaded on the first ``get_encoder()`` call and the Pinecone client on the
+first ``get_pinecone_index()`` call. Servers can call ``warmup()`` at boot
+(see VECTORSEARCH_WARMUP_ON_BOOT) to pay that cost before the first request.
+
+When settings.VECTORSEARCH_EMBEDDING_SOCKET is set, ``get_encoder()`` returns a
+client for ``manage.py run_embedding_server`` instead of loading weights in
+this process (see services.embedding_server).
+
+settings.VECTORSEARCH_ENCODER tunes CPU inference of the in-process model:
+dynamic int8 quantisation of its Linear layers, the torch intra-op thread
+count and the maximum sequence length (see ``encoder_options()``).
+
+settings.PINECONE_LOCAL_PATH swaps the Pinecone index for a file-backed stand-in
+(services.local_pinecone), so index maintenance can be exercised offline.
+
+Stub mode (settings.VECTORSEARCH_STUB_MODELS or ORBITAI_VECTORSEARCH_STUB=1)
+swaps in a deterministic hash-based encoder and a no-op Pinecone index, for
+tests, migrations and offline development.
+"""
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_encoders: Dict[str, object] = {}
+_pinecone_client = None
+_pinecone_indexes: Dict[str, object] = {}
+
+
+def stub_mode() -> bool:
+    if os.environ.get("ORBITAI_VECTORSEARCH_STUB", "").lower() in ("1", "true", "yes"):
+        return True
+    return getattr(settings, "VECTORSEARCH_STUB_MODELS", False)
+
+
+def default_model_name() -> str:
+    return getattr(settings, "VECTORSEARCH_MODEL_NAME", "all-MiniLM-L6-v2")
+
+
+def encoder_options(options: Optional[dict] = None) -> dict:
+    """
+    Inference options for the in-process encoder, from settings.VECTORSEARCH_ENCODER unless given.
+        QUANTIZE:       apply torch dynamic int8 quantisation to nn.Linear layers
+        THREADS:        torch intra-op threads per process (None = torch default, all cores)
+        MAX_SEQ_LENGTH: truncate inputs to this many tokens (None = model default)
+    """
+    conf = getattr(settings, "VECTORSEARCH_ENCODER", {}) if options is None else options
+    return {
+        "QUANTIZE": bool(conf.get("QUANTIZE", False)),
+        "THREADS": conf.get("THREADS"),
+        "MAX_SEQ_LENGTH": conf.get("MAX_SEQ_LENGTH"),
+    }
+
+
+def encoder_variant(options: Optional[dict] = None) -> str:
+    """Suffix naming the options that change the vectors (thread count does not)."""
+    opts = encoder_options(options)
+    variant = ""
+    if opts["QUANTIZE"]:
+        variant += "+int8"
+    if opts["MAX_SEQ_LENGTH"]:
+        variant += f"+seq{opts['MAX_SEQ_LENGTH']}"
+    return variant
+
+
+def encoder_version(model_name: Optional[str] = None, options: Optional[dict] = None) -> str:
+    """Identifies the vectors an encoder produces; used in cache keys and Persona.embedding_model."""
+    name = (model_name or default_model_name()) + encoder_variant(options)
+    return f"stub:{name}" if stub_mode() else name
+
+
+class StubEncoder:
+    """Deterministic pseudo-embeddings derived from a hash of the text (unit length)."""
+
+    def __init__(self, model_name: str, dim: Optional[int] = None):
+        self.model_name = model_name
+        self.dim = dim or getattr(settings, "VECTORSEARCH_STUB_DIM", 384)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _vector(self, text: str):
+        seed = int.from_bytes(hashlib.sha256((text or "").encode("utf-8")).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return v / np.linalg.norm(v)
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs):
+        if isinstance(sentences, str):
+            return self._vector(sentences)
+        if not sentences:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self._vector(s) for s in sentences])
+
+
+class StubPineconeIndex:
+    """Accepts writes and returns no matches."""
+
+    def upsert(self, vectors, **kwargs):
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, **kwargs):
+        return {}
+
+    def query(self, **kwargs):
+        return {"matches": []}
+
+    def fetch(self, ids, **kwargs):
+        return {"vectors": {}}
+
+    def list(self, **kwargs):
+        return iter(())
+
+
+def get_encoder(model_name: Optional[str] = None, remote: Optional[bool] = None):
+    """
+    Shared encoder for ``model_name`` (default settings.VECTORSEARCH_MODEL_NAME), loaded on first use.
+    ``remote`` defaults to whether VECTORSEARCH_EMBEDDING_SOCKET is configured; the
+    embedding server itself passes ``remote=False`` to get the in-process model.
+    """
+    name = model_name or default_model_name()
+    socket_path = getattr(settings, "VECTORSEARCH_EMBEDDING_SOCKET", None)
+    if remote is None:
+        remote = bool(socket_path) and not stub_mode()
+
+    key = ("remote:" if remote else "") + encoder_version(name)
+    encoder = _encoders.get(key)
+    if encoder is None:
+        with _lock:
+            encoder = _encoders.get(key)
+            if encoder is None:
+                encoder = _remote_encoder(name, socket_path) if remote else load_encoder(name)
+                _encoders[key] = encoder
+    return encoder
+
+
+def load_encoder(name: str, options: Optional[dict] = None):
+    """Build a new (uncached) in-process encoder with ``encoder_options(options)`` applied."""
+    if stub_mode():
+        return StubEncoder(name)
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    opts = encoder_options(options)
+    if opts["THREADS"]:
+        torch.set_num_threads(int(opts["THREADS"]))
+
+    logger.info("Loading sentence encoder %s%s", name, encoder_variant(opts))
+    model = SentenceTransformer(name, device="cpu" if opts["QUANTIZE"] else None)
+    if opts["MAX_SEQ_LENGTH"]:
+        model.max_seq_length = int(opts["MAX_SEQ_LENGTH"])
+    if opts["QUANTIZE"]:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    return model
+
+
+def _remote_encoder(name: str, socket_path: str):
+    from .embedding_server import RemoteEncoder
+
+    fallback = None
+    if getattr(settings, "VECTORSEARCH_EMBEDDING_FALLBACK_LOCAL", True):
+        fallback = lambda: get_encoder(name, remote=False)  # noqa: E731
+    return RemoteEncoder(socket_path, name, fallback=fallback)
+
+
+def get_pinecone_client():
+    global _pinecone_client
+    if _pinecone_client is None:
+        with _lock:
+            if _pinecone_client is None:
+                from pinecone import Pinecone
+
+                _pinecone_client = Pinecone(api_key=settings.PINECONE_API_KEY)
+    return _pinecone_client
+
+
+def get_pinecone_index(index_name: Optional[str] = None):
+    name = index_name or getattr(settings, "PINECONE_INDEX_NAME", "index1")
+    index = _pinecone_indexes.get(name)
+    if index is None:
+        with _lock:
+            index = _pinecone_indexes.get(name)
+            if index is None:
+                local_path = getattr(settings, "PINECONE_LOCAL_PATH", None)
+                if local_path:
+                    from .local_pinecone import LocalPineconeIndex
+
+                    index = LocalPineconeIndex(os.path.join(local_path, f"{name}.json"))
+                elif stub_mode():
+                    index = StubPineconeIndex()
+                else:
+                    index = get_pinecone_client().Index(name)
+                _pinecone_indexes[name] = index
+    return index
+
+
+def ensure_pinecone_index(dim: int, index_name: Optional[str] = None):
+    """Create the serverless index if it does not exist yet, then return it."""
+    name = index_name or getattr(settings, "PINECONE_INDEX_NAME", "index1")
+    if not stub_mode() and not getattr(settings, "PINECONE_LOCAL_PATH", None):
+        from pinecone import ServerlessSpec
+
+        pc = get_pinecone_client()
+        if name not in [i.name for i in pc.list_indexes()]:
+            pc.create_index(
+                name=name,
+                dimension=dim,
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region=settings.PINECONE_ENV),
+            )
+    return get_pinecone_index(name)
+
+
+def warmup():
+    """Load the encoder, the search backend and the lexical index ahead of the first request."""
+    from .lexical_index import get_lexical_index, hybrid_enabled
+    from .search_backends import get_search_backend
+
+    encoder = get_encoder()
+    encoder.encode("warmup")
+    backend = get_search_backend()
+    backend.warmup()
+    if hybrid_enabled():
+        get_lexical_index()
+    logger.info("vectorsearch warmed up (backend=%s, encoder=%s)", backend.name, encoder_version())
+
+
+def reset():
+    """Drop every cached encoder and client (used when settings change, e.g. in tests)."""
+    global _pinecone_client
+    with _lock:
+        _encoders.clear()
+        _pinecone_indexes.clear()
+        _pinecone_client = None
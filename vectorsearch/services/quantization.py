@@ -0,0 +1,103 @@
+"""
+Scalar int8 quantisation of persona vectors (one float32 scale per row).
+
+Rows are L2-normalised first, then stored as ``round(v / scale)`` with
+``scale = max|v| / 127``: 1 byte per dimension plus 4 bytes per row, about a
+quarter of float32. Scoring is asymmetric: the query stays float32 and
+``score = (codes @ q) * scale``, computed in blocks so the temporary float
+copy never exceeds ``block_rows`` rows.
+"""
+from typing import Optional
+
+import numpy as np
+
+from ..models import Persona
+from .search_backends import normalize_rows
+
+
+def quantize_int8(matrix):
+    """:returns: (codes int8 (n, dim), scales float32 (n,))"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class Int8Matrix:
+    def __init__(self, codes, scales, block_rows: int = 65536):
+        self.codes = codes
+        self.scales = scales
+        self.block_rows = block_rows
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+    def scores(self, q, rows: Optional[np.ndarray] = None):
+        """
+        Approximate dot products with normalised float32 queries:
+        ``q`` of shape (dim,) gives (n,), a block of shape (b, dim) gives (b, n).
+        """
+        q = np.asarray(q, dtype=np.float32)
+        codes = self.codes if rows is None else self.codes[rows]
+        scales = self.scales if rows is None else self.scales[rows]
+        out = np.empty((len(codes),) + q.shape[:-1], dtype=np.float32)
+        for start in range(0, len(codes), self.block_rows):
+            block = codes[start:start + self.block_rows].astype(np.float32)
+            out[start:start + self.block_rows] = block @ q.T
+        out *= scales.reshape((-1,) + (1,) * (q.ndim - 1))
+        return out.T
+
+    @classmethod
+    def from_personas(cls, chunk_rows: int = 10000):
+        """
+        Stream Persona.embedding into int8 codes ``chunk_rows`` at a time,
+        so the full float32 matrix is never held in memory.
+        :returns: (ids int64 array, Int8Matrix)
+        """
+        ids = []
+        codes = []
+        scales = []
+        pending_ids = []
+        pending = []
+        dim = None
+
+        def flush():
+            block = normalize_rows(np.vstack(pending).astype(np.float32))
+            c, s = quantize_int8(block)
+            codes.append(c)
+            scales.append(s)
+            ids.extend(pending_ids)
+            pending.clear()
+            pending_ids.clear()
+
+        qs = Persona.objects.filter(embedding__isnull=False).values_list("id", "embedding")
+        for pk, emb in qs.iterator(chunk_size=2000):
+            if len(emb) == 0 or (dim is not None and len(emb) != dim):
+                continue
+            dim = len(emb)
+            pending_ids.append(pk)
+            pending.append(emb)
+            if len(pending) >= chunk_rows:
+                flush()
+        if pending:
+            flush()
+
+        if not codes:
+            return np.zeros(0, dtype=np.int64), cls(np.zeros((0, 0), dtype=np.int8), np.zeros(0, dtype=np.float32))
+        return np.asarray(ids, dtype=np.int64), cls(np.vstack(codes), np.concatenate(scales))
+
+
+def exact_scores(q, ids) -> dict:
+    """Exact cosine of ``q`` against the stored float vectors of ``ids`` ({id: score})."""
+    rows = list(Persona.objects.filter(id__in=[int(i) for i in ids]).values_list("id", "embedding"))
+    rows = [(pk, emb) for pk, emb in rows if emb is not None and len(emb) == len(q)]
+    if not rows:
+        return {}
+    matrix = normalize_rows(np.vstack([emb for _, emb in rows]).astype(np.float32))
+    scores = matrix @ q
+    return {pk: float(s) for (pk, _), s in zip(rows, scores)}
@@ -0,0 +1,117 @@
+"""
+Cache of final search results, keyed by (query, filters, index version).
+
+The index version is a counter kept in the database (IndexVersion), so every
+worker process sees the same value. It is bumped whenever personas or their
+vectors change (Persona signals and the embedding/loading commands), which
+makes every previously cached result unreachable at once and tells the
+in-memory indexes to reload. Each process re-reads it at most every
+VERSION_TTL seconds.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from ..models import IndexVersion
+from .embedding_cache import normalize_query
+from .providers import encoder_version
+
+INDEX_VERSION_NAME = "personas"
+
+_version = {"value": None, "read_at": 0.0}
+_version_lock = threading.Lock()
+
+
+def _conf() -> dict:
+    return getattr(settings, "VECTORSEARCH_RESULT_CACHE", {})
+
+
+def _cache():
+    return caches[_conf().get("ALIAS", "default")]
+
+
+def _remember_version(value: int) -> int:
+    with _version_lock:
+        _version["value"] = value
+        _version["read_at"] = time.monotonic()
+    return value
+
+
+def get_index_version() -> int:
+    with _version_lock:
+        if _version["value"] is not None and time.monotonic() - _version["read_at"] < _conf().get("VERSION_TTL", 1.0):
+            return _version["value"]
+    version = IndexVersion.objects.filter(name=INDEX_VERSION_NAME).values_list("version", flat=True).first()
+    return _remember_version(version or 1)
+
+
+def bump_index_version() -> int:
+    rows = IndexVersion.objects.filter(name=INDEX_VERSION_NAME)
+    # UPDATE first and INSERT only for the very first bump, so concurrent bumps never read-then-write.
+    if not rows.update(version=F("version") + 1):
+        try:
+            with transaction.atomic():
+                IndexVersion.objects.create(name=INDEX_VERSION_NAME, version=2)
+        except IntegrityError:
+            rows.update(version=F("version") + 1)
+    return _remember_version(rows.values_list("version", flat=True).get())
+
+
+class SearchResultCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return _conf().get("ENABLED", True)
+
+    def key(self, query: str, filters: dict, version: Optional[int] = None, **extra) -> str:
+        if version is None:
+            version = get_index_version()
+        payload = json.dumps({
+            "q": normalize_query(query),
+            "filters": filters,
+            "backend": getattr(settings, "VECTORSEARCH_BACKEND", "local"),
+            "model": encoder_version(),
+            "quantization": getattr(settings, "VECTORSEARCH_LOCAL_QUANTIZATION", None),
+            **extra,
+        }, sort_keys=True, default=str)
+        digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+        return f"vectorsearch:results:{version}:{digest}"
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+        value = _cache().get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, results):
+        if self.enabled:
+            _cache().set(key, results, timeout=_conf().get("TTL", 300))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "index_version": get_index_version(),
+            }
+
+
+result_cache = SearchResultCache()
@@ -0,0 +1,108 @@
+"""
+Compatibility scoring for search results, configured by settings.VECTORSEARCH_SCORING.
+
+    compatibility = SIMILARITY_WEIGHT * similarity
+                  + FIELD_WEIGHTS[field]     for each requested smoker/gender/location the persona matches
+    capped at MAX.
+
+Filters are hard (pushed down into the candidate search), so there is no
+boost for personas near the requested location or age range: none reach here.
+
+Every term is computed column-wise with NumPy over the whole candidate set
+(arrays built from persona cards), so re-scoring thousands of candidates is a
+handful of vector operations. With RANK_BY_COMPATIBILITY the candidates are
+re-ordered by the result; otherwise the search ranking is kept.
+"""
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from django.conf import settings
+
+from .filters import EQUALITY_FIELDS
+
+DEFAULT_SCORING = {
+    "SIMILARITY_WEIGHT": 100.0,
+    "FIELD_WEIGHTS": {"smoker": 5.0, "gender": 5.0, "location": 5.0},
+    "MAX": 100.0,
+    "RANK_BY_COMPATIBILITY": False,
+}
+
+
+def _lower(value) -> str:
+    return (value or "").strip().lower()
+
+
+class ScoringEngine:
+    def __init__(self, config: Optional[dict] = None):
+        conf = {**DEFAULT_SCORING, **(config or {})}
+        self.similarity_weight = float(conf["SIMILARITY_WEIGHT"])
+        self.field_weights = {f: float(w) for f, w in conf["FIELD_WEIGHTS"].items() if f in EQUALITY_FIELDS}
+        self.max_score = float(conf["MAX"])
+        self.rank_by_compatibility = bool(conf["RANK_BY_COMPATIBILITY"])
+
+    def columns(self, cards: Sequence) -> Dict[str, np.ndarray]:
+        """Column arrays for the fields the scoring reads."""
+        return {
+            "smoker": np.fromiter((bool(c.smoker) for c in cards), dtype=bool, count=len(cards)),
+            "gender": np.array([_lower(c.gender) for c in cards], dtype=object),
+            "location": np.array([_lower(c.location) for c in cards], dtype=object),
+        }
+
+    def matched(self, cols: Dict[str, np.ndarray], filters: Dict) -> Dict[str, np.ndarray]:
+        """Boolean column per requested equality field: does the persona have the requested value?"""
+        matched = {}
+        for field in EQUALITY_FIELDS:
+            if field not in filters:
+                continue
+            value = filters[field] if field == "smoker" else _lower(filters[field])
+            matched[field] = cols[field] == value
+        return matched
+
+    def score(self, cols: Dict[str, np.ndarray], similarity, filters: Dict, matched=None) -> np.ndarray:
+        similarity = np.asarray(similarity, dtype=np.float64)
+        total = self.similarity_weight * similarity
+        if matched is None:
+            matched = self.matched(cols, filters)
+
+        for field, mask in matched.items():
+            total += self.field_weights.get(field, 0.0) * mask
+        return np.minimum(total, self.max_score)
+
+    def insights(self, cards: Sequence, filters: Dict, matched) -> List[str]:
+        parts = [[] for _ in cards]
+        for field, mask in matched.items():
+            for i in np.flatnonzero(mask):
+                if field == "smoker":
+                    parts[i].append("Non-smoker as requested." if filters[field] is False else "Smoker as requested.")
+                else:
+                    parts[i].append(f"{field.capitalize()}: {getattr(cards[i], field)}")
+        insights = []
+        for card, p in zip(cards, parts):
+            p.append(f"Expertise: {card.job_role}")
+            if card.hobbies:
+                p.append(f"Hobbies: {', '.join(card.hobbies)}")
+            insights.append(" | ".join(p))
+        return insights
+
+    def evaluate(self, cards: Sequence, similarity, filters: Dict):
+        """:returns: (compatibility array, insight strings), aligned with ``cards``."""
+        if not cards:
+            return np.zeros(0), []
+        cols = self.columns(cards)
+        matched = self.matched(cols, filters)
+        return self.score(cols, similarity, filters, matched), self.insights(cards, filters, matched)
+
+
+_engine: Optional[ScoringEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_scoring_engine() -> ScoringEngine:
+    """Process-wide engine built from ``settings.VECTORSEARCH_SCORING``."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ScoringEngine(getattr(settings, "VECTORSEARCH_SCORING", None))
+    return _engine
@@ -0,0 +1,508 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+
+from ..models import Persona
+from .filters import FilterColumns, to_orm, to_pinecone
+from .result_cache import get_index_version
+
+logger = logging.getLogger(__name__)
+
+
+def _embedding_rows(only_ids=None, chunk_size: int = 500):
+    qs = Persona.objects.filter(embedding__isnull=False).values_list("id", "embedding")
+    if only_ids is None:
+        yield from qs.iterator(chunk_size=2000)
+        return
+    only_ids = [int(pk) for pk in only_ids]
+    for start in range(0, len(only_ids), chunk_size):
+        yield from qs.filter(id__in=only_ids[start:start + chunk_size])
+
+
+def load_embedding_matrix(only_ids=None):
+    """
+    Read every stored persona vector (or only those of ``only_ids``) into one contiguous float32 matrix.
+    Rows are L2-normalised so a dot product is the cosine similarity.
+    :returns: (ids int64 array, matrix float32 array of shape (n, dim))
+    """
+    ids = []
+    rows = []
+    for pk, emb in _embedding_rows(only_ids):
+        # VectorField hands back numpy views over the stored bytes (no parsing).
+        if len(emb) == 0 or (rows and len(emb) != len(rows[0])):
+            continue
+        ids.append(pk)
+        rows.append(emb)
+
+    if rows:
+        matrix = np.vstack(rows).astype(np.float32, copy=False)
+        normalize_rows(matrix)
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+
+    return np.asarray(ids, dtype=np.int64), matrix
+
+
+def per_query(value, n: int) -> list:
+    """Broadcast a shared ``query_batch`` argument to one entry per query."""
+    if isinstance(value, (list, tuple)):
+        if len(value) != n:
+            raise ValueError(f"Expected {n} per-query values, got {len(value)}.")
+        return list(value)
+    return [value] * n
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def top_k_indices(scores, k: int):
+    """Indices of the ``k`` highest scores, best first."""
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(n)
+    return top[np.argsort(-scores[top])]
+
+
+class VectorSnapshot:
+    """Persona ids, their vectors and filter columns from one load, replaced as a whole on reload."""
+
+    def __init__(self, version: int, ids, matrix, columns: FilterColumns):
+        self.version = version
+        self.ids = ids
+        self.matrix = matrix
+        self.columns = columns
+        self.order = np.argsort(ids)
+        self.sorted_ids = ids[self.order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, q, top_k: int, filters: Optional[dict] = None):
+        """Exact top-k of the normalised float32 query ``q``; :returns: (ids, scores) arrays, best first."""
+        mask = self.columns.mask(filters) if filters else None
+        rows = np.arange(len(self.ids)) if mask is None else np.flatnonzero(mask)
+        if len(rows) == 0 or top_k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = self.matrix[rows] @ q
+        top = top_k_indices(scores, top_k)
+        return self.ids[rows[top]], scores[top]
+
+
+class VersionedLoader:
+    """
+    Holds what a backend loaded from the database and rebuilds it (``build(version)``) once
+    the index version moves on, i.e. after personas were created, edited or deleted by any
+    process. The first load blocks. Later reloads run in a background thread while every
+    request keeps querying the previous state, so steady write traffic never puts a full
+    rebuild on the request path; versions bumped during a rebuild are picked up by the next one.
+    Set VECTORSEARCH_BACKGROUND_RELOAD = False to rebuild in the calling thread instead.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self._state = None
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        """What is loaded now, or None; never loads."""
+        return self._state
+
+    def reload(self):
+        with self._lock:
+            self._state = self.build(get_index_version())
+        return self._state
+
+    def get(self):
+        version = get_index_version()
+        state = self._state
+        if state is not None and state.version == version:
+            return state
+        if state is not None and getattr(settings, "VECTORSEARCH_BACKGROUND_RELOAD", True):
+            self._reload_in_background()
+            return state
+        if self._lock.acquire(blocking=state is None):
+            try:
+                if self._state is None or self._state.version != version:
+                    self._state = self.build(version)
+            finally:
+                self._lock.release()
+        return self._state
+
+    def _reload_in_background(self):
+        if not self._lock.acquire(blocking=False):
+            return  # a rebuild is already running
+        try:
+            threading.Thread(target=self._rebuild, name="vectorsearch-reload", daemon=True).start()
+        except Exception:
+            self._lock.release()
+            raise
+
+    def _rebuild(self):
+        # Owns self._lock, acquired by the request thread that started it.
+        try:
+            version = get_index_version()
+            if self._state is None or self._state.version != version:
+                self._state = self.build(version)
+        except Exception:
+            logger.exception("vector snapshot reload failed; still serving version %s",
+                             getattr(self._state, "version", None))
+        finally:
+            connections.close_all()
+            self._lock.release()
+
+
+class SearchBackend:
+    """
+    Common interface for persona vector search.
+    ``query`` returns matches shaped like Pinecone's: [{"id": "42", "score": 0.83}, ...]
+    """
+
+    name = ""
+
+    def query(self, vector, top_k: int = 50, filters: Optional[dict] = None) -> List[dict]:
+        """Top-k over the personas matching ``filters`` (see ``services.filters``)."""
+        raise NotImplementedError
+
+    def query_batch(self, vectors, top_k=50, filters=None) -> List[List[dict]]:
+        """
+        ``query`` for several vectors at once, one result list per vector.
+        ``top_k`` and ``filters`` are either shared or one entry per vector.
+        """
+        top_ks, filters_list = per_query(top_k, len(vectors)), per_query(filters, len(vectors))
+        return [self.query(v, k, f) for v, k, f in zip(vectors, top_ks, filters_list)]
+
+    def warmup(self):
+        """Load whatever the backend needs so the first query is not slower than the rest."""
+
+    def matching_ids(self, filters: dict):
+        """Ids of every persona that passes ``filters``, as a sorted int64 array."""
+        qs = Persona.objects.filter(**to_orm(filters)).order_by("id").values_list("id", flat=True)
+        return np.fromiter(qs.iterator(chunk_size=5000), dtype=np.int64)
+
+    def score(self, vector, ids) -> dict:
+        """
+        Similarity of specific personas to ``vector`` ({"42": 0.71, ...}).
+        Backends that cannot score arbitrary ids return only what they know.
+        """
+        return {}
+
+
+class LocalSearchBackend(SearchBackend):
+    """
+    In-process cosine search over ``Persona.embedding``.
+    All vectors live in one contiguous float32 matrix (rows L2-normalised),
+    so a query is a single matmul followed by ``argpartition``.
+
+    With ``quantization="int8"`` the matrix is kept as int8 codes plus a scale
+    per row (~4x smaller). The query is scored against the codes
+    asymmetrically, and the best ``rerank`` candidates are re-scored exactly
+    from the float vectors stored in ``Persona.embedding``.
+
+    The matrix is reloaded whenever the index version changes, so personas
+    created or edited in any process become searchable.
+    """
+
+    name = "local"
+
+    def __init__(self, quantization: Optional[str] = None, rerank: Optional[int] = None):
+        if quantization is None:
+            quantization = getattr(settings, "VECTORSEARCH_LOCAL_QUANTIZATION", None)
+        if quantization not in (None, "int8"):
+            raise ValueError(f"Unsupported quantization {quantization!r}; expected None or 'int8'.")
+        self.quantization = quantization
+        self.rerank = rerank if rerank is not None else getattr(settings, "VECTORSEARCH_RERANK", 100)
+        self._loaded = VersionedLoader(self._build)
+
+    def _build(self, version: int) -> VectorSnapshot:
+        if self.quantization == "int8":
+            from .quantization import Int8Matrix
+
+            ids, matrix = Int8Matrix.from_personas()
+        else:
+            ids, matrix = load_embedding_matrix()
+        # Filter columns are rebuilt with the matrix, so they always describe the same rows.
+        return VectorSnapshot(version, ids, matrix, FilterColumns.for_ids(ids))
+
+    def load(self):
+        self._loaded.reload()
+        return self
+
+    def warmup(self):
+        self._loaded.get()
+
+    @property
+    def size(self) -> int:
+        return len(self._loaded.get())
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the vectors."""
+        return self._loaded.get().matrix.nbytes
+
+    # Queries scored together by query_batch; bounds the (queries x personas) score matrix.
+    QUERY_BLOCK = 64
+
+    def _scores(self, snap: VectorSnapshot, q, rows=None):
+        """Scores of one query (dim,) -> (n,) or a block of queries (b, dim) -> (b, n)."""
+        if self.quantization == "int8":
+            return snap.matrix.scores(q, rows)
+        matrix = snap.matrix if rows is None else snap.matrix[rows]
+        return (matrix @ q.T).T
+
+    def query(self, vector, top_k: int = 50, filters: Optional[dict] = None) -> List[dict]:
+        snap = self._loaded.get()
+        if len(snap) == 0 or top_k <= 0:
+            return []
+
+        q = np.asarray(vector, dtype=np.float32).ravel()
+        q_norm = np.linalg.norm(q)
+        if q_norm == 0:
+            return []
+        q = q / q_norm
+
+        # Score only the rows that pass the filters, so top-k is over the filtered set.
+        mask = snap.columns.mask(filters) if filters else None
+        rows = None if mask is None else np.flatnonzero(mask)
+        return self._top(snap, q, self._scores(snap, q, rows), rows, top_k)
+
+    def query_batch(self, vectors, top_k=50, filters=None) -> List[List[dict]]:
+        """Scores a block of queries against every row with one matrix-matrix product."""
+        snap = self._loaded.get()
+        n = len(vectors)
+        top_ks, filters_list = per_query(top_k, n), per_query(filters, n)
+        if n == 0 or len(snap) == 0:
+            return [[] for _ in range(n)]
+
+        queries = np.asarray(vectors, dtype=np.float32).reshape(n, -1)
+        norms = np.linalg.norm(queries, axis=1)
+        usable = norms > 0
+        queries = queries / np.where(usable, norms, 1.0)[:, None]
+
+        results = []
+        for start in range(0, n, self.QUERY_BLOCK):
+            block = queries[start:start + self.QUERY_BLOCK]
+            scores = self._scores(snap, block)
+            for i, row in enumerate(scores, start=start):
+                if not usable[i] or top_ks[i] <= 0:
+                    results.append([])
+                    continue
+                mask = snap.columns.mask(filters_list[i]) if filters_list[i] else None
+                rows = None if mask is None else np.flatnonzero(mask)
+                results.append(self._top(snap, queries[i], row if rows is None else row[rows], rows, top_ks[i]))
+        return results
+
+    def _top(self, snap: VectorSnapshot, q, scores, rows, top_k: int) -> List[dict]:
+        depth = max(top_k, self.rerank) if self.quantization else top_k
+        top = top_k_indices(scores, depth)
+        ids = snap.ids[top] if rows is None else snap.ids[rows[top]]
+
+        if self.quantization and self.rerank:
+            from .quantization import exact_scores
+
+            exact = exact_scores(q, ids)
+            ranked = sorted(exact.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+            return [{"id": str(pk), "score": s} for pk, s in ranked]
+
+        return [{"id": str(pk), "score": float(s)} for pk, s in zip(ids[:top_k], scores[top][:top_k])]
+
+    def matching_ids(self, filters: dict):
+        snap = self._loaded.get()
+        mask = snap.columns.mask(filters)
+        return snap.sorted_ids if mask is None else snap.sorted_ids[mask[snap.order]]
+
+    def score(self, vector, ids) -> dict:
+        snap = self._loaded.get()
+        wanted = np.asarray([int(i) for i in ids], dtype=np.int64)
+        if len(wanted) == 0 or len(snap) == 0:
+            return {}
+        pos = np.searchsorted(snap.sorted_ids, wanted)
+        pos = np.clip(pos, 0, len(snap.sorted_ids) - 1)
+        found = snap.sorted_ids[pos] == wanted
+        rows = snap.order[pos[found]]
+
+        q = np.asarray(vector, dtype=np.float32).ravel()
+        q_norm = np.linalg.norm(q)
+        if q_norm == 0:
+            return {}
+        scores = self._scores(snap, q / q_norm, rows)
+        return {str(pk): float(s) for pk, s in zip(wanted[found], scores)}
+
+
+class IVFSnapshot:
+    """
+    The opened IVF index plus what changed in the database since it was built:
+    ``usable`` masks out rows whose persona was deleted or re-embedded, and
+    ``delta`` holds the vectors the file lacks (new or re-embedded personas).
+    """
+
+    def __init__(self, version: int, index, columns: FilterColumns, usable, delta: VectorSnapshot):
+        self.version = version
+        self.index = index
+        self.columns = columns
+        self.usable = usable
+        self.delta = delta
+
+
+class IVFSearchBackend(SearchBackend):
+    """
+    Approximate search over the memory-mapped IVF index written by
+    ``manage.py build_vector_index``. Every worker maps the same file, so the
+    vectors are shared through the page cache instead of copied per process.
+    When the index version changes the file is reopened, and personas added or
+    re-embedded since it was built are searched exactly next to it until the
+    next rebuild.
+    """
+
+    name = "ivf"
+
+    def __init__(self, path=None, nprobe: Optional[int] = None):
+        self.path = path or getattr(settings, "VECTORSEARCH_INDEX_PATH", None)
+        if not self.path:
+            raise ValueError("VECTORSEARCH_INDEX_PATH must be set to use the 'ivf' backend.")
+        self.nprobe = nprobe or getattr(settings, "VECTORSEARCH_IVF_NPROBE", 8)
+        self._loaded = VersionedLoader(self._build)
+
+    def _build(self, version: int) -> IVFSnapshot:
+        from .ann_index import IVFIndex
+
+        index = IVFIndex.open(self.path)
+        index_ids = np.asarray(index.ids)
+        current = list(Persona.objects.filter(embedding__isnull=False).values_list("id", "embedding_hash"))
+        db_ids = np.asarray([pk for pk, _ in current], dtype=np.int64)
+        db_hashes = np.asarray([h.encode("ascii") for _, h in current], dtype="S64")
+
+        order = np.argsort(db_ids)
+        pos = np.clip(np.searchsorted(db_ids[order], index_ids), 0, max(len(db_ids) - 1, 0))
+        usable = db_ids[order][pos] == index_ids if len(db_ids) else np.zeros(len(index_ids), dtype=bool)
+        if index.hashes is not None and len(db_ids):
+            usable &= db_hashes[order][pos] == np.asarray(index.hashes)
+
+        delta_ids, delta_matrix = load_embedding_matrix(np.setdiff1d(db_ids, index_ids[usable]))
+        delta = VectorSnapshot(version, delta_ids, delta_matrix, FilterColumns.for_ids(delta_ids))
+        return IVFSnapshot(version, index, FilterColumns.for_ids(index_ids), None if usable.all() else usable, delta)
+
+    @property
+    def index(self):
+        return self._loaded.get().index
+
+    def warmup(self):
+        self._loaded.get()
+
+    def query(self, vector, top_k: int = 50, filters: Optional[dict] = None) -> List[dict]:
+        snap = self._loaded.get()
+        mask = snap.columns.mask(filters) if filters else None
+        if snap.usable is not None:
+            mask = snap.usable if mask is None else mask & snap.usable
+        ids, scores = snap.index.search(vector, top_k=top_k, nprobe=self.nprobe, mask=mask)
+
+        q = np.asarray(vector, dtype=np.float32).ravel()
+        q_norm = np.linalg.norm(q)
+        if len(snap.delta) and q_norm > 0:
+            delta_ids, delta_scores = snap.delta.search(q / q_norm, top_k, filters)
+            ids, scores = np.concatenate([ids, delta_ids]), np.concatenate([scores, delta_scores])
+            top = top_k_indices(scores, top_k)
+            ids, scores = ids[top], scores[top]
+        return [{"id": str(pk), "score": float(s)} for pk, s in zip(ids, scores)]
+
+    def matching_ids(self, filters: dict):
+        snap = self._loaded.get()
+        mask = snap.columns.mask(filters)
+        if snap.usable is not None:
+            mask = snap.usable if mask is None else mask & snap.usable
+        ids = np.asarray(snap.index.ids)
+        ids = ids if mask is None else ids[mask]
+        delta_mask = snap.delta.columns.mask(filters)
+        delta_ids = snap.delta.ids if delta_mask is None else snap.delta.ids[delta_mask]
+        return np.union1d(ids, delta_ids)
+
+
+class PineconeSearchBackend(SearchBackend):
+    name = "pinecone"
+
+    def __init__(self, index_name: Optional[str] = None, namespace: Optional[str] = None):
+        self.index_name = index_name or getattr(settings, "PINECONE_INDEX_NAME", "index1")
+        self.namespace = namespace if namespace is not None else getattr(settings, "PINECONE_NAMESPACE", None)
+
+    @property
+    def index(self):
+        from .providers import get_pinecone_index
+        return get_pinecone_index(self.index_name)
+
+    def warmup(self):
+        _ = self.index  # opens the client and index eagerly
+
+    def query(self, vector, top_k: int = 50, filters: Optional[dict] = None) -> List[dict]:
+        if hasattr(vector, "tolist"):
+            vector = vector.tolist()
+
+        pinecone_kwargs = dict(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=False,  # unused, and it caps top_k at 1000
+            include_values=False,
+        )
+        if self.namespace:
+            pinecone_kwargs["namespace"] = self.namespace
+        metadata_filter = to_pinecone(filters or {})
+        if metadata_filter:
+            pinecone_kwargs["filter"] = metadata_filter
+
+        response = self.index.query(**pinecone_kwargs)
+        matches = response.get("matches", []) or []
+        return [
+            {"id": m.get("id"), "score": m.get("score", 0.0)}
+            for m in matches
+            if m.get("id") is not None
+        ]
+
+    def query_batch(self, vectors, top_k=50, filters=None) -> List[List[dict]]:
+        """Pinecone has no multi-vector query; the queries are sent concurrently instead."""
+        n = len(vectors)
+        top_ks, filters_list = per_query(top_k, n), per_query(filters, n)
+        if n <= 1:
+            return [self.query(v, k, f) for v, k, f in zip(vectors, top_ks, filters_list)]
+        workers = min(n, getattr(settings, "PINECONE_QUERY_CONCURRENCY", 8))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(self.query, vectors, top_ks, filters_list))
+
+
+BACKENDS = {
+    LocalSearchBackend.name: LocalSearchBackend,
+    IVFSearchBackend.name: IVFSearchBackend,
+    PineconeSearchBackend.name: PineconeSearchBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend() -> SearchBackend:
+    """Process-wide backend selected by ``settings.VECTORSEARCH_BACKEND``."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, "VECTORSEARCH_BACKEND", "local")
+                try:
+                    backend_cls = BACKENDS[name]
+                except KeyError:
+                    raise ValueError(
+                        f"Unknown VECTORSEARCH_BACKEND {name!r}; expected one of {sorted(BACKENDS)}"
+                    )
+                _backend = backend_cls()
+    return _backend
@@ -0,0 +1,36 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Persona, VectorOutbox
+from .services import lexical_index, outbox
+from .services.persona_cards import get_card_cache
+from .services.result_cache import bump_index_version
+
+
+def _changed(pk, document=None, deleted=False):
+    version = bump_index_version()
+    get_card_cache().apply_change(version, pk)
+    lexical_index.apply_change(version, pk, document, deleted)
+
+
+@receiver(post_save, sender=Persona)
+def persona_saved(sender, instance, update_fields=None, **kwargs):
+    pk = instance.pk
+    # Saves that only touch the stored embedding (or other unsynced fields) need no vector-store work.
+    synced = not update_fields or set(update_fields) & set(outbox.SYNCED_FIELDS)
+    if synced and outbox.outbox_enabled():
+        outbox.enqueue([pk], VectorOutbox.Op.UPSERT)
+
+    # The BM25 index only learns about the change once it is committed.
+    lexical = not update_fields or set(update_fields) & set(lexical_index.LEXICAL_FIELDS)
+    document = lexical_index.document_of(instance) if lexical else None
+    transaction.on_commit(lambda: _changed(pk, document))
+
+
+@receiver(post_delete, sender=Persona)
+def persona_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    if outbox.outbox_enabled():
+        outbox.enqueue([pk], VectorOutbox.Op.DELETE)
+    transaction.on_commit(lambda: _changed(pk, deleted=True))
@@ -1,3 +1,708 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .fields import VectorField
+from .models import IndexVersion, Persona, VectorOutbox
+from .services import embedding_server, lexical_index, persona_io, providers, result_cache
+from .services.ann_index import IVFIndex, build_ivf_index, recall_at_k
+from .services.embedding_cache import QueryEmbeddingCache
+from .services.embedding_server import EmbeddingServer, RemoteEncoder, SharedBlocks
+from .services.filters import FilterColumns
+from .services.lexical_index import BM25Index
+from .services.persona_cards import PersonaCard, get_card_cache
+from .services.persona_search import DEFAULT_TOP_K, InvalidCursor, build_results, rank, search_page
+from .services.providers import StubEncoder, get_encoder, get_pinecone_index
+from .services.quantization import Int8Matrix, quantize_int8
+from .services.result_cache import INDEX_VERSION_NAME, bump_index_version, get_index_version
+from .services.scoring import ScoringEngine
+from .services.search_backends import (
+    IVFSearchBackend, LocalSearchBackend, VersionedLoader, normalize_rows, top_k_indices,
+)
+
+# Re-read the index version on every call, as a second worker process would after VERSION_TTL.
+RESULT_CACHE = {"ENABLED": True, "ALIAS": "default", "TTL": 300, "VERSION_TTL": 0}
+
+
+def make_persona(bio, **fields):
+    defaults = {"name": "Ada", "gender": "female", "age": 30, "job_role": "Engineer",
+                "hobbies": [], "smoker": False, "location": "London"}
+    return Persona.objects.create(bio=bio, **{**defaults, **fields})
+
+
+def drain_outbox():
+    call_command("drain_vector_outbox", skip_upsert=True, stdout=StringIO())
+
+
+def top_ids(backend, text, top_k=5, filters=None):
+    return [int(m["id"]) for m in backend.query(get_encoder().encode(text), top_k=top_k, filters=filters)]
+
+
+def card(pk, **fields):
+    defaults = {"name": f"P{pk}", "bio": "", "job_role": "Engineer", "location": "London", "gender": "female",
+                "age": 30, "smoker": False, "hobbies": []}
+    return PersonaCard(id=pk, **{**defaults, **fields})
+
+
+def compute_compatibility(score, persona, query_filters):
+    """The scoring search_personas used before services.scoring."""
+    compatibility = float(score) * 100.0
+    for field, value in query_filters.items():
+        if hasattr(persona, field) and getattr(persona, field) == value:
+            compatibility += 5
+    return min(compatibility, 100.0)
+
+
+class ScoringEngineTests(TestCase):
+    cards = [
+        card(1, hobbies=["chess", "tennis"]),
+        card(2, smoker=True, location="Paris"),
+        card(3, gender="male", job_role="Chef"),
+    ]
+    filters = {"smoker": False, "gender": "female", "location": "London"}
+
+    def test_defaults_match_compute_compatibility(self):
+        similarity = [0.5, 0.62, 0.97]
+        compatibility, insights = ScoringEngine().evaluate(self.cards, similarity, self.filters)
+        expected = [compute_compatibility(s, c, self.filters) for s, c in zip(similarity, self.cards)]
+        np.testing.assert_allclose(compatibility, expected)
+        self.assertEqual(insights[0], "Non-smoker as requested. | Gender: female | Location: London | "
+                                      "Expertise: Engineer | Hobbies: chess, tennis")
+        self.assertEqual(insights[1], "Gender: female | Expertise: Engineer")
+
+    def test_similarity_weight(self):
+        compatibility, _ = ScoringEngine({"SIMILARITY_WEIGHT": 50.0}).evaluate(self.cards, [0.4, 0.2, 0.8], {})
+        np.testing.assert_allclose(compatibility, [20.0, 10.0, 40.0])
+
+    def test_field_weights(self):
+        engine = ScoringEngine({"FIELD_WEIGHTS": {"smoker": 0.0, "gender": 10.0, "location": 1.0}})
+        compatibility, _ = engine.evaluate(self.cards, [0.0, 0.0, 0.0], {**self.filters, "location": "paris"})
+        np.testing.assert_allclose(compatibility, [10.0, 11.0, 0.0])
+
+    def test_max_caps_the_total(self):
+        compatibility, _ = ScoringEngine({"MAX": 60.0}).evaluate(self.cards, [0.58, 0.3, 0.9], self.filters)
+        np.testing.assert_allclose(compatibility, [60.0, 35.0, 60.0])
+
+    def test_rank_by_compatibility(self):
+        personas = {str(c.id): c for c in self.cards}
+        scores = {"1": 0.7, "2": 0.62, "3": 0.5}
+        for rank_by, order in ((False, [3, 2, 1]), (True, [1, 2, 3])):
+            engine = ScoringEngine({"RANK_BY_COMPATIBILITY": rank_by})
+            with mock.patch("vectorsearch.services.persona_search.get_scoring_engine", return_value=engine):
+                results = build_results(["3", "2", "1"], scores, personas, {})
+            self.assertEqual([r["id"] for r in results], order)
+
+
+@override_settings(VECTORSEARCH_OUTBOX=False)
+class VectorFieldTests(TestCase):
+    def test_round_trip(self):
+        persona = make_persona("Restores antique clocks.", embedding=[0.5, -1.25, 2.0])
+        stored = Persona.objects.get(id=persona.id).embedding
+        self.assertEqual(stored.dtype, np.dtype("<f4"))
+        np.testing.assert_array_equal(stored, [0.5, -1.25, 2.0])
+        self.assertFalse(stored.flags.writeable)  # a view over the row's bytes, not a copy
+
+        Persona.objects.filter(id=persona.id).update(embedding=[])
+        self.assertEqual(len(Persona.objects.get(id=persona.id).embedding), 0)
+        Persona.objects.filter(id=persona.id).update(embedding=None)
+        self.assertIsNone(Persona.objects.get(id=persona.id).embedding)
+
+    def test_float16_and_fixture_serialization(self):
+        field = VectorField(dtype="float16")
+        raw = field.get_db_prep_value([1.5, -2.0], connection)
+        self.assertEqual(len(bytes(raw)), 4)
+        np.testing.assert_array_equal(field.to_python(bytes(raw)), np.asarray([1.5, -2.0], dtype=np.float16))
+
+        persona = make_persona("Restores antique clocks.", embedding=np.asarray([0.25, 4.0], dtype=np.float32))
+        text = Persona._meta.get_field("embedding").value_to_string(persona)
+        np.testing.assert_array_equal(Persona._meta.get_field("embedding").to_python(text), [0.25, 4.0])
+
+
+class PersonaLoaderTests(TestCase):
+    def write(self, text, suffix=".json"):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_json_array_across_chunk_boundaries(self):
+        records = [12345, {"bio": "likes [brackets], commas and \"quotes\"", "n": [1, 2.5e3]}, "ümlaut", None, -7.25]
+        path = self.write(" \n[ " + ",\n  ".join(json.dumps(r, ensure_ascii=False) for r in records) + " ]\n")
+        for size in (1, 2, 3, 7, 64):
+            with mock.patch.object(persona_io, "READ_SIZE", size):
+                self.assertEqual(list(persona_io.iter_records(path)), records, f"READ_SIZE={size}")
+
+    def test_malformed_input(self):
+        with mock.patch.object(persona_io, "READ_SIZE", 2):
+            for text in ("[1, 2,]", "[1 2]", "[1, 2", "{}"):
+                with self.assertRaises(ValueError, msg=text):
+                    list(persona_io.iter_records(self.write(text), "json"))
+        with self.assertRaisesRegex(ValueError, ":2: invalid JSON"):
+            list(persona_io.iter_records(self.write('{"a": 1}\n{"a": \n'), "ndjson"))
+
+    @override_settings(VECTORSEARCH_OUTBOX=False)
+    def test_load_upserts_by_natural_key(self):
+        def record(name, bio, **extra):
+            return {"name": name, "gender": "female", "age": 30, "bio": bio, "job_role": "Engineer",
+                    "hobbies": ["chess"], "smoker": False, "location": "London", **extra}
+
+        first = [record("Ada", "Writes compilers.", embedding=[0.5, 1.0]), record("Grace", "Debugs moths.")]
+        call_command("load_personas", self.write("\n".join(map(json.dumps, first)), ".ndjson"), stdout=StringIO())
+
+        second = [record("Ada", "Writes proofs."), record("Linus", "Maintains kernels."),
+                  record("Linus", "Maintains git.")]
+        out = StringIO()
+        call_command("load_personas", self.write(json.dumps(second)), batch_size=2, stdout=out)
+        self.assertIn("1 created, 2 updated", out.getvalue())
+
+        self.assertEqual(sorted(Persona.objects.values_list("name", flat=True)), ["Ada", "Grace", "Linus"])
+        ada = Persona.objects.get(name="Ada")
+        self.assertEqual(ada.bio, "Writes proofs.")
+        np.testing.assert_array_equal(ada.embedding, [0.5, 1.0])  # not in the file, so kept
+        self.assertEqual(Persona.objects.get(name="Linus").bio, "Maintains git.")
+
+
+class EmbeddingMigrationTests(TransactionTestCase):
+    before = [("vectorsearch", "0003_persona_embedding_binary")]
+    after = [("vectorsearch", "0005_persona_embedding_swap")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_json_embeddings_are_copied_to_packed_floats(self):
+        OldPersona = self.migrate(self.before).get_model("vectorsearch", "Persona")
+        fields = {"name": "Ada", "gender": "female", "age": 30, "bio": "", "job_role": "Engineer",
+                  "hobbies": [], "smoker": False, "location": "London"}
+        with_vector = OldPersona.objects.create(embedding=[0.5, -1.25, 2.0], **fields)
+        without = OldPersona.objects.create(embedding=None, **fields)
+
+        NewPersona = self.migrate(self.after).get_model("vectorsearch", "Persona")
+        np.testing.assert_array_equal(NewPersona.objects.get(id=with_vector.id).embedding, [0.5, -1.25, 2.0])
+        self.assertIsNone(NewPersona.objects.get(id=without.id).embedding)
+
+
+class QueryEmbeddingCacheTests(TestCase):
+    def test_hit_and_miss(self):
+        cache = QueryEmbeddingCache("stub")
+        self.assertIsNone(cache.get("Rust developer"))
+        cache.set("Rust developer", [1.0, 2.0])
+        np.testing.assert_array_equal(cache.get("  rust   DEVELOPER "), [1.0, 2.0])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertIsNone(QueryEmbeddingCache("other-model").get("Rust developer"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = QueryEmbeddingCache("stub", max_entries=2)
+        cache.set("a", [1.0])
+        cache.set("b", [2.0])
+        cache.get("a")
+        cache.set("c", [3.0])
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_entries_expire_after_ttl(self):
+        cache = QueryEmbeddingCache("stub", ttl=10)
+        cache.set("a", [1.0])
+        with mock.patch("vectorsearch.services.embedding_cache.time.monotonic", return_value=time.monotonic() + 11):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_shared_layer_and_batched_misses(self):
+        caches["default"].clear()
+        encode = mock.Mock(side_effect=lambda texts: np.ones((len(texts), 2), dtype=np.float32))
+        first = QueryEmbeddingCache("stub", shared_alias="default")
+        first.get_many_or_encode(["a", "b", "A ", "a"], encode)
+        encode.assert_called_once_with(["a", "b"])
+
+        second = QueryEmbeddingCache("stub", shared_alias="default")
+        second.get_many_or_encode(["b"], encode)
+        self.assertEqual(encode.call_count, 1)
+        self.assertEqual(second.shared_hits, 1)
+
+
+@override_settings(VECTORSEARCH_RESULT_CACHE=RESULT_CACHE)
+class IndexVersionTests(TestCase):
+    def test_bump_is_stored_in_database(self):
+        before = get_index_version()
+        self.assertEqual(bump_index_version(), before + 1)
+        self.assertEqual(IndexVersion.objects.get(name=INDEX_VERSION_NAME).version, before + 1)
+
+    def test_bump_from_another_process_is_seen(self):
+        before = get_index_version()
+        # Another worker bumps the row; this process never called bump_index_version.
+        IndexVersion.objects.update_or_create(name=INDEX_VERSION_NAME, defaults={"version": before + 5})
+        self.assertEqual(get_index_version(), before + 5)
+
+    def test_version_is_remembered_for_ttl(self):
+        with self.settings(VECTORSEARCH_RESULT_CACHE={"VERSION_TTL": 60}):
+            version = bump_index_version()
+            IndexVersion.objects.filter(name=INDEX_VERSION_NAME).update(version=version + 1)
+            self.assertEqual(get_index_version(), version)
+        result_cache._remember_version(None)
+
+
+@override_settings(VECTORSEARCH_STUB_MODELS=True, VECTORSEARCH_OUTBOX=True, VECTORSEARCH_RESULT_CACHE=RESULT_CACHE,
+                   VECTORSEARCH_BACKGROUND_RELOAD=False)
+class BackendReloadTests(TestCase):
+    def test_local_backend_finds_persona_created_after_load(self):
+        first = make_persona("Sails across the Atlantic every summer.")
+        drain_outbox()
+        backend = LocalSearchBackend()
+        self.assertEqual(backend.size, 1)
+
+        second = make_persona("Bakes sourdough bread at dawn.")
+        drain_outbox()
+        self.assertEqual(backend.size, 2)
+        self.assertEqual(top_ids(backend, second.bio, top_k=1), [second.id])
+
+        first.delete()
+        bump_index_version()
+        self.assertEqual(top_ids(backend, first.bio), [second.id])
+
+    def test_ivf_backend_serves_personas_missing_from_the_index_file(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, True)
+        first = make_persona("Sails across the Atlantic every summer.")
+        old = make_persona("Collects vintage stamps.")
+        drain_outbox()
+        call_command("build_vector_index", output=path, recall_queries=0, stdout=StringIO())
+        backend = IVFSearchBackend(path=path)
+        self.assertEqual(top_ids(backend, first.bio, top_k=1), [first.id])
+
+        second = make_persona("Bakes sourdough bread at dawn.")
+        old.delete()
+        first.bio = "Climbs mountains in the Alps."
+        first.save()
+        drain_outbox()
+
+        self.assertEqual(top_ids(backend, second.bio, top_k=1), [second.id])
+        self.assertEqual(top_ids(backend, first.bio, top_k=1), [first.id])
+        self.assertNotIn(old.id, top_ids(backend, old.bio))
+
+
+@override_settings(VECTORSEARCH_BACKGROUND_RELOAD=True)
+class VersionedLoaderTests(TestCase):
+    def test_reload_runs_in_background_while_old_state_is_served(self):
+        version = [1]
+        release = threading.Event()
+        built = []
+
+        def build(v):
+            if built:
+                release.wait(5)
+            built.append(v)
+            return SimpleNamespace(version=v)
+
+        with mock.patch("vectorsearch.services.search_backends.get_index_version", side_effect=lambda: version[0]):
+            loader = VersionedLoader(build)
+            self.assertEqual(loader.get().version, 1)
+            version[0] = 2
+            self.assertEqual(loader.get().version, 1)
+            self.assertEqual(loader.get().version, 1)  # the running rebuild is not started twice
+            release.set()
+            deadline = time.monotonic() + 5
+            while loader.get().version != 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(loader.get().version, 2)
+        self.assertEqual(built, [1, 2])
+
+
+@override_settings(VECTORSEARCH_OUTBOX=False, VECTORSEARCH_RESULT_CACHE=RESULT_CACHE)
+class Int8QuantizationTests(TestCase):
+    def test_recall_against_float32(self):
+        rng = np.random.default_rng(0)
+        matrix = normalize_rows(rng.standard_normal((2000, 64)).astype(np.float32))
+        queries = normalize_rows(rng.standard_normal((50, 64)).astype(np.float32))
+        quantized = Int8Matrix(*quantize_int8(matrix), block_rows=300)
+        self.assertLess(quantized.nbytes, matrix.nbytes / 3)
+
+        exact = [top_k_indices(matrix @ q, 10).tolist() for q in queries]
+        approx = [top_k_indices(row, 10).tolist() for row in quantized.scores(queries)]
+        self.assertGreaterEqual(recall_at_k(exact, approx, 10), 0.9)
+        np.testing.assert_allclose(quantized.scores(queries[0]), matrix @ queries[0], atol=0.02)
+
+    def test_backend_rerank_matches_float_search(self):
+        rng = np.random.default_rng(1)
+        for i, vector in enumerate(rng.standard_normal((200, 32)).astype(np.float32)):
+            make_persona(f"Persona {i}", embedding=vector)
+        exact = LocalSearchBackend().load()
+        quantized = LocalSearchBackend(quantization="int8", rerank=50).load()
+        for q in rng.standard_normal((20, 32)).astype(np.float32):
+            self.assertEqual([m["id"] for m in quantized.query(q, top_k=10)],
+                             [m["id"] for m in exact.query(q, top_k=10)])
+
+
+class IVFIndexFileTests(TestCase):
+    def test_builds_are_published_through_the_pointer(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, True)
+        rng = np.random.default_rng(0)
+        matrix = rng.standard_normal((40, 8)).astype(np.float32)
+
+        first = build_ivf_index(np.arange(40), matrix, path, nlist=4)
+        opened = IVFIndex.open(path)
+        second = build_ivf_index(np.arange(100, 140), matrix, path, nlist=4)
+        self.assertEqual(sorted(np.asarray(IVFIndex.open(path).ids).tolist()), list(range(100, 140)))
+        # A reader that opened the previous build keeps a consistent view of it.
+        self.assertEqual(int(opened.search(matrix[3], top_k=1)[0][0]), 3)
+
+        third = build_ivf_index(np.arange(40), matrix, path, nlist=4)
+        builds = sorted(p for p in os.listdir(path) if os.path.isdir(os.path.join(path, p)))
+        self.assertEqual(builds, sorted([second.name, third.name]))
+        self.assertNotIn(first.name, builds)
+
+
+@override_settings(VECTORSEARCH_STUB_MODELS=True, VECTORSEARCH_OUTBOX=True, VECTORSEARCH_RESULT_CACHE=RESULT_CACHE,
+                   VECTORSEARCH_BACKGROUND_RELOAD=False)
+class FilteredSearchTests(TestCase):
+    def test_filters_see_created_and_edited_personas(self):
+        make_persona("Sails across the Atlantic every summer.")
+        drain_outbox()
+        backend = LocalSearchBackend()
+        backend.warmup()
+
+        smoker = make_persona("Bakes sourdough bread at dawn.", smoker=True, location="Paris")
+        drain_outbox()
+        self.assertEqual(top_ids(backend, smoker.bio, filters={"smoker": True}), [smoker.id])
+        self.assertEqual(backend.matching_ids({"location": "paris"}).tolist(), [smoker.id])
+
+        smoker.location = "Berlin"
+        smoker.save()
+        drain_outbox()
+        self.assertEqual(backend.matching_ids({"location": "paris"}).tolist(), [])
+        self.assertEqual(top_ids(backend, smoker.bio, filters={"location": "berlin"}), [smoker.id])
+
+    def test_filter_columns_mask(self):
+        columns = FilterColumns([True, False, False, True], [25, 40, 31, 60],
+                                ["Female", "male", "female", None], ["Paris", "paris ", "Berlin", "Paris"])
+        self.assertIsNone(columns.mask({}))
+        self.assertEqual(columns.mask({"location": "PARIS"}).tolist(), [True, True, False, True])
+        self.assertEqual(columns.mask({"gender": "female", "smoker": False}).tolist(), [False, False, True, False])
+        self.assertEqual(columns.mask({"location": "paris", "age_min": 30, "age_max": 50}).tolist(),
+                         [False, True, False, False])
+        self.assertEqual(columns.mask({"location": "Rome"}).tolist(), [False] * 4)
+
+    def test_lexical_search_is_restricted_to_sorted_id_array(self):
+        index = BM25Index()
+        for doc_id, text in [(3, "python developer"), (7, "python teacher"), (9, "rust developer")]:
+            index.add(doc_id, text)
+        hits = index.search("python developer", candidates=np.asarray([7, 9], dtype=np.int64))
+        self.assertEqual(sorted(doc_id for doc_id, _ in hits), [7, 9])
+        self.assertEqual(index.search("python", candidates=np.zeros(0, dtype=np.int64)), [])
+
+
+@override_settings(VECTORSEARCH_OUTBOX=False, VECTORSEARCH_RESULT_CACHE=RESULT_CACHE,
+                   VECTORSEARCH_BACKGROUND_RELOAD=False)
+class LexicalIndexTests(TestCase):
+    def setUp(self):
+        lexical_index.reset()
+        self.addCleanup(lexical_index.reset)
+
+    def hits(self, query):
+        return [doc_id for doc_id, _ in lexical_index.get_lexical_index().search(query)]
+
+    def test_scores_follow_bm25(self):
+        index = BM25Index(k1=1.2, b=0.75)
+        docs = {1: "python python developer", 2: "python teacher in berlin", 3: "rust developer"}
+        for doc_id, text in docs.items():
+            index.add(doc_id, text)
+        avgdl = sum(len(t.split()) for t in docs.values()) / len(docs)
+
+        def expected(doc_id, terms):
+            tokens = docs[doc_id].split()
+            score = 0.0
+            for term in terms:
+                df = sum(term in t.split() for t in docs.values())
+                tf = tokens.count(term)
+                if tf:
+                    idf = np.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                    score += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * len(tokens) / avgdl))
+            return score
+
+        hits = index.search("python developer")
+        self.assertEqual([doc_id for doc_id, _ in hits], [1, 3, 2])
+        for doc_id, score in hits:
+            self.assertAlmostEqual(score, expected(doc_id, ["python", "developer"]))
+
+        # Replacing a document drops the cached arrays of every term it touched.
+        docs[3] = "python developer"
+        index.add(3, docs[3])
+        avgdl = sum(len(t.split()) for t in docs.values()) / len(docs)
+        for doc_id, score in index.search("python"):
+            self.assertAlmostEqual(score, expected(doc_id, ["python"]))
+
+    def test_saves_reach_the_index_only_on_commit(self):
+        lexical_index.get_lexical_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            persona = make_persona("Restores antique clocks.")
+            self.assertEqual(self.hits("clocks"), [])
+        self.assertEqual(self.hits("clocks"), [persona.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            persona.delete()
+        self.assertEqual(self.hits("clocks"), [])
+
+    def test_rebuilds_after_changes_it_did_not_see(self):
+        lexical_index.get_lexical_index()
+        # A bulk load (no signals) or another process's edit only bumps the index version.
+        Persona.objects.bulk_create([Persona(name="Bo", gender="male", age=40, bio="Restores antique clocks.",
+                                             job_role="Clockmaker", hobbies=[], smoker=False, location="Bern")])
+        bump_index_version()
+        self.assertEqual(len(self.hits("clocks")), 1)
+
+
+@override_settings(VECTORSEARCH_OUTBOX=False, VECTORSEARCH_RESULT_CACHE=RESULT_CACHE)
+class PersonaCardCacheTests(TestCase):
+    def test_local_save_drops_only_its_card(self):
+        cache = get_card_cache()
+        edited, other = make_persona("Restores antique clocks."), make_persona("Bakes sourdough bread.")
+        cache.get_many([edited.id, other.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            edited.name = "Grace"
+            edited.save()
+        hits = cache.hits
+        cards = cache.get_many([edited.id, other.id])
+        self.assertEqual(cards[edited.id].name, "Grace")
+        self.assertEqual(cache.hits, hits + 1)  # the other card survived the save
+
+    def test_change_from_another_process_clears_the_cache(self):
+        cache = get_card_cache()
+        persona = make_persona("Restores antique clocks.")
+        cache.get_many([persona.id])
+        Persona.objects.filter(id=persona.id).update(name="Grace")
+        bump_index_version()
+        self.assertEqual(cache.get_many([persona.id])[persona.id].name, "Grace")
+
+
+@override_settings(VECTORSEARCH_STUB_MODELS=True, VECTORSEARCH_OUTBOX=True, VECTORSEARCH_RESULT_CACHE=RESULT_CACHE,
+                   VECTORSEARCH_BACKGROUND_RELOAD=False, VECTORSEARCH_BACKEND="local", VECTORSEARCH_RANKING_DEPTH=1000)
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        # Rolled-back tests reuse index version numbers; drop rankings cached by earlier ones.
+        caches["default"].clear()
+        for i in range(120):
+            make_persona(f"Persona number {i} enjoys gardening and chess.", name=f"P{i}")
+        drain_outbox()
+
+    def test_first_page_ranks_shallow_and_cursors_go_deeper(self):
+        with mock.patch.object(LocalSearchBackend, "query", autospec=True,
+                               side_effect=LocalSearchBackend.query) as query:
+            results, cursor = search_page("gardening", {}, page_size=20)
+            self.assertEqual([c.kwargs["top_k"] for c in query.call_args_list], [DEFAULT_TOP_K])
+
+            seen = [r["id"] for r in results]
+            while cursor:
+                results, cursor = search_page("gardening", {}, cursor=cursor, page_size=20)
+                seen += [r["id"] for r in results]
+
+        self.assertEqual(len(seen), 120)
+        self.assertEqual(len(set(seen)), 120)
+        self.assertEqual([c.kwargs["top_k"] for c in query.call_args_list], [DEFAULT_TOP_K, DEFAULT_TOP_K * 4])
+
+    def test_expired_ranking_is_recomputed_under_the_current_version(self):
+        stale = get_index_version()
+        current = bump_index_version()
+        ranking = rank("gardening", {}, DEFAULT_TOP_K, version=stale)
+        self.assertEqual(len(ranking), DEFAULT_TOP_K)
+        key = result_cache.result_cache.key
+        self.assertIsNone(result_cache.result_cache.get(key("gardening", {}, stale, depth=DEFAULT_TOP_K, ranking=True)))
+        self.assertEqual(result_cache.result_cache.get(key("gardening", {}, current, depth=DEFAULT_TOP_K,
+                                                           ranking=True)), ranking)
+
+    def test_cursor_for_another_query_is_rejected(self):
+        _, cursor = search_page("gardening", {}, page_size=20)
+        with self.assertRaises(InvalidCursor):
+            search_page("chess", {}, cursor=cursor, page_size=20)
+
+
+@override_settings(VECTORSEARCH_STUB_MODELS=True, VECTORSEARCH_OUTBOX=True, VECTORSEARCH_RESULT_CACHE=RESULT_CACHE,
+                   VECTORSEARCH_BACKGROUND_RELOAD=False, VECTORSEARCH_BACKEND="local", VECTORSEARCH_HYBRID=True)
+class BatchSearchTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        lexical_index.reset()
+        self.addCleanup(lexical_index.reset)
+        for i in range(10):
+            make_persona(f"Persona number {i} enjoys gardening and chess.", name=f"P{i}")
+        drain_outbox()
+
+    def test_each_query_returns_at_most_k_matches(self):
+        payload = {"queries": [{"q": "gardening", "k": 3}, {"q": "chess", "k": 1}, "gardening"]}
+        for _ in range(2):  # the second round is served from the result cache
+            response = self.client.post(reverse("search_batch"), json.dumps(payload), content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+            results = response.json()["results"]
+            self.assertEqual([len(r["matches"]) for r in results], [3, 1, 10])
+
+
+@override_settings(VECTORSEARCH_STUB_MODELS=True, VECTORSEARCH_OUTBOX=True, VECTORSEARCH_RESULT_CACHE=RESULT_CACHE,
+                   VECTORSEARCH_BACKGROUND_RELOAD=False)
+class VectorOutboxTests(TestCase):
+    def test_persona_and_outbox_entry_commit_together(self):
+        with mock.patch("vectorsearch.services.outbox.enqueue", side_effect=DatabaseError("outbox write failed")):
+            with self.assertRaises(DatabaseError):
+                make_persona("Restores antique clocks.")
+        self.assertFalse(Persona.objects.exists())
+
+        persona = make_persona("Restores antique clocks.")
+        self.assertEqual(list(VectorOutbox.objects.values_list("persona_id", "op")),
+                         [(persona.id, VectorOutbox.Op.UPSERT)])
+        with mock.patch("vectorsearch.services.outbox.enqueue", side_effect=DatabaseError("outbox write failed")):
+            with self.assertRaises(DatabaseError):
+                persona.delete()
+        self.assertTrue(Persona.objects.filter(id=persona.id).exists())
+
+    def test_drain_makes_the_change_searchable(self):
+        backend = LocalSearchBackend()
+        backend.warmup()
+        persona = make_persona("Restores antique clocks.")
+        self.assertEqual(top_ids(backend, persona.bio), [])
+        drain_outbox()
+        self.assertFalse(VectorOutbox.objects.exists())
+        self.assertEqual(top_ids(backend, persona.bio), [persona.id])
+
+    @override_settings(VECTORSEARCH_OUTBOX=False)
+    def test_nothing_is_queued_when_the_outbox_is_off(self):
+        make_persona("Restores antique clocks.")
+        self.assertFalse(VectorOutbox.objects.exists())
+
+
+@override_settings(VECTORSEARCH_STUB_MODELS=True, VECTORSEARCH_OUTBOX=False, VECTORSEARCH_RESULT_CACHE=RESULT_CACHE)
+class ReconcileVectorsTests(TestCase):
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, True)
+        local = self.settings(PINECONE_LOCAL_PATH=path)
+        local.enable()
+        self.addCleanup(local.disable)
+        providers.reset()
+        self.addCleanup(providers.reset)
+        self.index = get_pinecone_index()
+
+    def index_ids(self):
+        return sorted(int(vid) for page in self.index.list() for vid in page)
+
+    def reconcile(self, **opts):
+        out = StringIO()
+        call_command("reconcile_vectors", stdout=out, **opts)
+        return out.getvalue()
+
+    def test_repairs_missing_stale_and_orphaned_vectors(self):
+        kept = make_persona("Sails across the Atlantic every summer.")
+        edited = make_persona("Bakes sourdough bread at dawn.")
+        dropped = make_persona("Collects vintage stamps.")
+        self.reconcile()
+        self.assertEqual(self.index_ids(), [kept.id, edited.id, dropped.id])
+
+        dim = get_encoder().get_sentence_embedding_dimension()
+        self.index.delete(ids=[str(dropped.id)])
+        self.index.upsert(vectors=[("999999", [0.5] * dim, {"content_hash": "gone"})])
+        # update() sends no signals, as with an edit the vector store never heard about.
+        Persona.objects.filter(id=edited.id).update(bio="Climbs mountains in the Alps.")
+
+        report = self.reconcile(dry_run=True)
+        self.assertRegex(report, r"missing from index\s+1\b")
+        self.assertRegex(report, r"orphaned in index\s+1\b")
+        self.assertRegex(report, r"stale \(content hash differs\)\s+1\b")
+        self.assertIn(999999, self.index_ids())
+
+        self.reconcile()
+        self.assertEqual(self.index_ids(), [kept.id, edited.id, dropped.id])
+        metadata = self.index.fetch(ids=[str(edited.id)])["vectors"][str(edited.id)]["metadata"]
+        self.assertEqual(metadata["content_hash"], Persona.objects.get(id=edited.id).content_hash())
+        self.assertIn("Index and database agree.", self.reconcile())
+
+
+@override_settings(VECTORSEARCH_STUB_MODELS=True, VECTORSEARCH_OUTBOX=False, VECTORSEARCH_RESULT_CACHE=RESULT_CACHE,
+                   PINECONE_NAMESPACE="personas")
+class GenerateEmbeddingsTests(TestCase):
+    def run_command(self, index):
+        with mock.patch("vectorsearch.management.commands.generate_embeddings.ensure_pinecone_index",
+                        return_value=index):
+            call_command("generate_embeddings", workers=0, stdout=StringIO())
+
+    def test_failed_upsert_leaves_personas_stale(self):
+        persona = make_persona("Restores antique clocks.")
+        index = mock.Mock()
+        index.upsert.side_effect = RuntimeError("pinecone unavailable")
+        with self.assertRaises(RuntimeError):
+            self.run_command(index)
+        persona.refresh_from_db()
+        self.assertEqual(persona.embedding_hash, "")
+
+        index = mock.Mock()
+        self.run_command(index)
+        persona.refresh_from_db()
+        self.assertEqual(persona.embedding_hash, persona.content_hash())
+        self.assertEqual(index.upsert.call_args.kwargs["namespace"], "personas")
+        self.assertEqual([v[0] for v in index.upsert.call_args.kwargs["vectors"]], [str(persona.id)])
+
+
+class EmbeddingServerTests(TestCase):
+    def start_server(self):
+        # Client and server share this process's resource tracker; only the server's unlink may unregister.
+        patcher = mock.patch.object(embedding_server, "resource_tracker")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        path = os.path.join(tempfile.mkdtemp(), "embeddings.sock")
+        server = EmbeddingServer(path, StubEncoder("stub", dim=8), "stub", window_ms=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(os.path.dirname(path), True)
+
+        self.addCleanup(stop)
+        return server, RemoteEncoder(path, "stub")
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_server_unlinks_blocks_once_the_client_moves_on(self):
+        server, client = self.start_server()
+        first = client.encode(["alpha", "beta"])
+        self.assertEqual(first.shape, (2, 8))
+        self.assertEqual(len(server.blocks), 1)
+
+        client.encode("gamma")
+        self.assertEqual(len(server.blocks), 1)
+        client._drop_connection()
+        self.wait_for(lambda: len(server.blocks) == 0)
+
+    def test_unreleased_blocks_expire(self):
+        blocks = SharedBlocks(ttl=10)
+        name = blocks.create(np.ones((2, 4), dtype=np.float32))
+        self.assertEqual(blocks.expire(), 0)
+        self.assertEqual(blocks.expire(now=time.monotonic() + 11), 1)
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
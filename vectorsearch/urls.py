@@ -4,4 +4,8 @@ from . import views
 urlpatterns = [
     path('vectorsearch/', views.search_personas, name='search_personas'),
     path('download_json/', views.download_json, name='download_json'),
+    path('stats/', views.search_stats, name='search_stats'),
+    path('api/search/', views.search_api, name='search_api'),
+    path('api/search/stream/', views.search_stream, name='search_stream'),
+    path('api/search/batch/', views.search_batch, name='search_batch'),
 ]
\ No newline at end of file
@@ -1,158 +1,166 @@
-from django.shortcuts import render
-from vectorsearch.models import Persona
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
+import json
 import os
+
 from django.conf import settings
-from django.http import FileResponse
-
-
-PINECONE_INDEX_NAME = getattr(settings, "PINECONE_INDEX_NAME", "index1")
-PINECONE_NAMESPACE = getattr(settings, "PINECONE_NAMESPACE", None)  
-
-
-model = SentenceTransformer('all-MiniLM-L6-v2')
-pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-index = pc.Index(PINECONE_INDEX_NAME)
-
-def _normalize_hobbies(h):
-    if isinstance(h, list):
-        return h
-    if isinstance(h, str):
-        
-        parts = [p.strip() for p in h.split(",") if p.strip()]
-        return parts if parts else [h]
-    return []
-
-def compute_compatibility(score, persona, query_filters):
-    
-    compatibility = float(score) * 100.0
-    for field, value in query_filters.items():
-        
-        if hasattr(persona, field) and getattr(persona, field) == value:
-            compatibility += 5
-    return min(compatibility, 100.0)
-
-def generate_insight(persona, query_filters):
-    insights = []
-    for field, value in query_filters.items():
-        if hasattr(persona, field) and getattr(persona, field) == value:
-            if field == "smoker":
-                insights.append("Non-smoker as requested." if value is False else "Smoker as requested.")
-            else:
-                insights.append(f"{field.capitalize()}: {getattr(persona, field)}")
-    insights.append(f"Expertise: {persona.job_role}")
-    hobbies_list = _normalize_hobbies(persona.hobbies)
-    if hobbies_list:
-        insights.append(f"Hobbies: {', '.join(hobbies_list)}")
-    return " | ".join(insights)
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from vectorsearch.services.embedding_cache import get_query_cache
+from vectorsearch.services.filters import parse_filters
+from vectorsearch.services.persona_cards import get_card_cache
+from vectorsearch.services.persona_search import (
+    DEFAULT_TOP_K, InvalidCursor, SearchBackendError, iter_results, search_many, search_page,
+)
+from vectorsearch.services.result_cache import result_cache
+from vectorsearch.services.search_backends import get_search_backend
+
+
+FILTER_PARAMS = ("smoker", "gender", "location", "age_min", "age_max")
+
 
 def search_personas(request):
     query = request.GET.get('q', '') or ''
-    filter_smoker = request.GET.get('smoker', None)
 
-    # Structured filters
-    query_filters = {}
-    if filter_smoker:
-        query_filters['smoker'] = (filter_smoker.lower() == 'true')
+    # Structured filters (pushed down into the candidate search)
+    search_filters = parse_filters(request.GET)
 
-    results = []
+    context = {"query": query}
+    for param in FILTER_PARAMS:
+        context[param] = request.GET.get(param, None)
 
-    
     if not query:
-        
         return render(request, "vectorsearch/search.html", {
-            "results": results,
-            "query": query,
-            "smoker": filter_smoker,  
+            **context,
+            "results": [],
         })
 
-    # 1) Vector search
-    query_embedding = model.encode(query).tolist()
-
-    pinecone_kwargs = dict(
-        vector=query_embedding,
-        top_k=50,
-        include_metadata=True,
-        include_values=False,
-    )
-    if PINECONE_NAMESPACE:
-        pinecone_kwargs["namespace"] = PINECONE_NAMESPACE
-
+    page_size = getattr(settings, "VECTORSEARCH_PAGE_SIZE", 5)
     try:
-        pinecone_results = index.query(**pinecone_kwargs)
-    except Exception as e:
-        
+        results, next_cursor = search_page(query, search_filters, request.GET.get("cursor"), page_size)
+    except (SearchBackendError, InvalidCursor) as e:
         return render(request, "vectorsearch/search.html", {
+            **context,
             "results": [],
-            "query": query,
-            "smoker": filter_smoker,
-            "error": f"Pinecone query error: {e}",
+            "error": str(e),
         })
 
-    matches = pinecone_results.get("matches", []) or []
-    if not matches:
+    if not results:
         return render(request, "vectorsearch/search.html", {
+            **context,
             "results": [],
-            "query": query,
-            "smoker": filter_smoker,
             "info": "No vector matches found. Check your namespace/index IDs and that vectors are upserted.",
         })
 
-    # 2) Map Pinecone IDs → scores
-    candidate_ids = [m.get("id") for m in matches if m.get("id") is not None]
-    scores_dict = {m.get("id"): m.get("score", 0.0) for m in matches}
+    next_params = None
+    if next_cursor:
+        params = request.GET.copy()
+        params["cursor"] = next_cursor
+        next_params = params.urlencode()
+
+    return render(request, "vectorsearch/search.html", {
+        **context,
+        "results": results,
+        "next_params": next_params,
+    })
+
+
+def _api_search_args(request):
+    query = (request.GET.get("q") or "").strip()
+    if not query:
+        raise ValueError("'q' is required.")
+    return query, parse_filters(request.GET)
+
 
-    # 3) Fetch matching personas
-    numeric_ids = []
-    for pid in candidate_ids:
+@require_GET
+def search_api(request):
+    """
+    GET ?q=...&<filters>&limit=20&cursor=... -> {"results": [...], "next_cursor": "..." | null}
+    Pass ``next_cursor`` back (with the same q and filters) to fetch the following page.
+    """
+    try:
+        query, filters = _api_search_args(request)
+        limit = max(1, min(int(request.GET.get("limit", 20)), getattr(settings, "VECTORSEARCH_BATCH_MAX_K", 200)))
+        results, next_cursor = search_page(query, filters, request.GET.get("cursor"), limit)
+    except (ValueError, InvalidCursor) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except SearchBackendError as e:
+        return JsonResponse({"error": str(e)}, status=502)
+    return JsonResponse({"results": results, "next_cursor": next_cursor})
+
+
+@require_GET
+def search_stream(request):
+    """GET ?q=...&<filters>&limit=5000 -> one JSON result per line (application/x-ndjson), best first."""
+    max_results = getattr(settings, "VECTORSEARCH_STREAM_MAX_RESULTS", 5000)
+    try:
+        query, filters = _api_search_args(request)
+        limit = max(1, min(int(request.GET.get("limit", max_results)), max_results))
+        results = iter_results(query, filters, limit)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except SearchBackendError as e:
+        return JsonResponse({"error": str(e)}, status=502)
+    lines = (json.dumps(result) + "\n" for result in results)
+    return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+
+@csrf_exempt
+@require_POST
+def search_batch(request):
+    """
+    POST {"queries": [{"q": "...", "k": 10, "filters": {"smoker": false, "age_min": 25}}, ...]}
+    -> {"results": [{"q": "...", "matches": [...]}, ...]} in request order.
+    Each match carries the same fields as the HTML results (compatibility, insight, ...).
+    """
+    try:
+        payload = json.loads(request.body or b"{}")
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({"error": "Request body must be JSON."}, status=400)
+
+    entries = payload.get("queries") if isinstance(payload, dict) else None
+    max_queries = getattr(settings, "VECTORSEARCH_BATCH_MAX_QUERIES", 500)
+    max_k = getattr(settings, "VECTORSEARCH_BATCH_MAX_K", 200)
+    if not isinstance(entries, list) or not entries:
+        return JsonResponse({"error": "'queries' must be a non-empty list."}, status=400)
+    if len(entries) > max_queries:
+        return JsonResponse({"error": f"At most {max_queries} queries per request."}, status=400)
+
+    queries = []
+    for n, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {"q": entry}
+        q = entry.get("q") if isinstance(entry, dict) else None
+        if not isinstance(q, str) or not q.strip():
+            return JsonResponse({"error": f"queries[{n}].q must be a non-empty string."}, status=400)
         try:
-            numeric_ids.append(int(pid))
+            k = int(entry.get("k", DEFAULT_TOP_K))
         except (TypeError, ValueError):
-            pass
-
-    personas_qs = Persona.objects.none()
-    if numeric_ids:
-        personas_qs = Persona.objects.filter(id__in=numeric_ids)
-
-    # CASE B: If you used a custom Pinecone ID (e.g., "persona_42"), add a pinecone_id field to Persona
-    
-    if query_filters:
-        personas_qs = personas_qs.filter(**query_filters)
-
-    personas = list(personas_qs)
-
-    # 4) Sort by Pinecone similarity score (defensively)
-    def persona_score(p):
-        key = str(p.id)
-        return scores_dict.get(key, 0.0)
-
-    personas.sort(key=persona_score, reverse=True)
-
-    # 5) Build response
-    for persona in personas:
-        score = persona_score(persona)
-        compatibility = compute_compatibility(score, persona, query_filters)
-        insight = generate_insight(persona, query_filters)
-
-        results.append({
-            "name": persona.name,
-            "bio": persona.bio,
-            "job_role": persona.job_role,
-            "location": getattr(persona, "location", ""),
-            "smoker": getattr(persona, "smoker", None),
-            "hobbies": _normalize_hobbies(getattr(persona, "hobbies", [])),
-            "compatibility": f"{compatibility:.2f}%",
-            "insight": insight
-        })
+            return JsonResponse({"error": f"queries[{n}].k must be an integer."}, status=400)
+        filters = entry.get("filters") or {}
+        if not isinstance(filters, dict):
+            return JsonResponse({"error": f"queries[{n}].filters must be an object."}, status=400)
+        queries.append({"q": q, "k": max(1, min(k, max_k)), "filters": parse_filters(filters)})
 
-    return render(request, "vectorsearch/search.html", {
-        "results": results,
-        "query": query,
-        "smoker": filter_smoker,
+    try:
+        results = search_many(queries)
+    except SearchBackendError as e:
+        return JsonResponse({"error": str(e)}, status=502)
+
+    return JsonResponse({
+        "results": [{"q": q["q"], "matches": matches} for q, matches in zip(queries, results)],
     })
 
 def download_json(request):
     app_dir = os.path.dirname(os.path.abspath(__file__))
     filepath = os.path.join(app_dir, 'orbitai.json')
     return FileResponse(open(filepath, 'rb'), as_attachment=True, filename='orbitai.json')
+
+def search_stats(request):
+    return JsonResponse({
+        "backend": get_search_backend().name,
+        "query_embedding_cache": get_query_cache().stats(),
+        "result_cache": result_cache.stats(),
+        "persona_cards": get_card_cache().stats(),
+    })